@@ -0,0 +1,19 @@
+"""
+Configuración común de pytest: backend en sys.path y base de datos temporal
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+backend_dir = Path(__file__).parent.absolute() / "web_app" / "backend"
+sys.path.insert(0, str(backend_dir))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Base de datos vacía en un directorio temporal (también el directorio de trabajo)"""
+    monkeypatch.chdir(tmp_path)
+    from models import Database
+    return Database(str(tmp_path / "chile_data.db"))
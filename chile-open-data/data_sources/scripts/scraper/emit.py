@@ -4,12 +4,23 @@ from datetime import datetime, timezone
 from typing import List
 import yaml
 from .schema import Source, SourcesFile
+from .shared import import_backend_service
+
+# Snapshot compilado compartido con el backend (sin él se parsea y valida el YAML cada vez)
+_snapshot_module = import_backend_service("catalog_snapshot")
+cached_parse = _snapshot_module.cached_parse if _snapshot_module else None
+
+def _parse_sources_file(raw: bytes) -> SourcesFile:
+    data = yaml.load(raw.decode("utf-8"), Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    return SourcesFile.model_validate(data)
 
 def load_existing(path: Path) -> SourcesFile | None:
     if not path.exists():
         return None
-    data = yaml.safe_load(path.read_text(encoding="utf-8"))
-    return SourcesFile.model_validate(data)
+    raw = path.read_bytes()
+    if cached_parse is None:
+        return _parse_sources_file(raw)
+    return cached_parse(path, raw, "scraper", _parse_sources_file, kind=SourcesFile)
 
 def write_sources(path: Path, existing: SourcesFile | None, new_sources: List[Source]) -> None:
     all_sources = {s.id: s for s in (existing.sources if existing else [])}
@@ -1,7 +1,18 @@
 from __future__ import annotations
 import time, random
+from contextlib import nullcontext
 from typing import Optional
+from urllib.parse import urlparse
 import requests
+from .shared import import_backend_service
+
+# Cache DNS y despacho por host compartidos con el checker del backend
+# (el scraper funciona igual sin ellos)
+_dns_cache_module = import_backend_service("dns_cache")
+_http_timing_module = import_backend_service("http_timing")
+_politeness_module = import_backend_service("politeness")
+dns_cache = _dns_cache_module.dns_cache if _dns_cache_module else None
+host_politeness = _politeness_module.host_politeness if _politeness_module else None
 
 DEFAULT_HEADERS = {
     "User-Agent": "BibliotecaDatosCL/1.0 (+https://github.com/tu-org/tu-repo)",
@@ -13,14 +24,26 @@ class HttpClient:
         self.timeout = timeout
         self.max_retries = max_retries
         self.backoff = backoff
-        self.session = requests.Session()
+        if dns_cache is not None and _http_timing_module is not None:
+            # Solo las conexiones de esta sesión usan el cache DNS
+            self.session = _http_timing_module.timed_session(resolver=dns_cache)
+        else:
+            self.session = requests.Session()
         self.session.headers.update(DEFAULT_HEADERS)
 
     def get(self, url: str, *, headers: Optional[dict] = None) -> requests.Response:
         last_exc = None
+        host = urlparse(url).hostname or ""
         for attempt in range(1, self.max_retries + 1):
             try:
-                resp = self.session.get(url, timeout=self.timeout, headers=headers)
+                slot = host_politeness.slot(host) if host_politeness is not None else nullcontext()
+                with slot:
+                    resp = self.session.get(url, timeout=self.timeout, headers=headers)
+                if host_politeness is not None:
+                    # Un Retry-After (429/503) hace esperar al próximo intento en slot()
+                    host_politeness.record_response(host, resp.status_code, resp.headers)
+                if resp.status_code == 429:
+                    raise requests.HTTPError("429 too many requests")
                 if 500 <= resp.status_code < 600:
                     raise requests.HTTPError(f"{resp.status_code} server error")
                 return resp
@@ -0,0 +1,28 @@
+from __future__ import annotations
+import importlib
+import logging
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# data_sources/scripts/scraper -> raíz del proyecto (donde vive web_app/)
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+
+def import_backend_service(name: str) -> Optional[ModuleType]:
+    """Importa web_app.backend.services.<name> (cache DNS, politeness, snapshot del catálogo).
+
+    La raíz del proyecto se agrega a sys.path para que funcione desde cualquier
+    directorio. Si el módulo no está disponible devuelve None y lo registra:
+    el scraper sigue funcionando sin esa optimización.
+    """
+    root = str(PROJECT_ROOT)
+    if root not in sys.path:
+        sys.path.append(root)
+    try:
+        return importlib.import_module(f"web_app.backend.services.{name}")
+    except ImportError as e:
+        logger.warning("Scraper sin web_app.backend.services.%s (%s): se continúa sin él", name, e)
+        return None
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los timeouts adaptativos del checker (user-032)
+"""
+
+from services.checker import (
+    adaptive_timeout, with_adaptive_timeouts,
+    ADAPTIVE_TIMEOUT_FLOOR, ADAPTIVE_TIMEOUT_MIN_SAMPLES
+)
+
+
+def test_empty_history_uses_configured_timeout():
+    assert adaptive_timeout([], 6.0) == 6.0
+
+
+def test_short_history_uses_configured_timeout():
+    latencies = [100.0] * (ADAPTIVE_TIMEOUT_MIN_SAMPLES - 1)
+    assert adaptive_timeout(latencies, 6.0) == 6.0
+    # Con el mínimo de muestras ya se adapta
+    assert adaptive_timeout(latencies + [100.0], 6.0) == ADAPTIVE_TIMEOUT_FLOOR
+
+
+def test_timeout_is_three_times_p99():
+    # El p99 de 100 muestras ignora la peor
+    latencies = [1000.0] * 99 + [5000.0]
+    assert adaptive_timeout(latencies, 10.0) == 3.0
+    latencies = [800.0] * 198 + [9000.0, 9000.0]
+    assert adaptive_timeout(latencies, 10.0) == 2.4
+
+
+def test_timeout_has_a_floor():
+    assert adaptive_timeout([50.0] * 30, 6.0) == ADAPTIVE_TIMEOUT_FLOOR
+
+
+def test_values_above_the_cap_use_configured_timeout():
+    assert adaptive_timeout([5000.0] * 30, 6.0) == 6.0
+    # El tope manda aunque el floor sea mayor
+    assert adaptive_timeout([50.0] * 30, 1.5) == 1.5
+
+
+def test_with_adaptive_timeouts_only_copies_changed_datasets():
+    fast = {'id': 'fast', 'url': 'https://a.example.cl/f'}
+    slow = {'id': 'slow', 'url': 'https://a.example.cl/s', 'timeout': 4}
+    new = {'id': 'new', 'url': 'https://a.example.cl/n'}
+    adjusted = with_adaptive_timeouts(
+        [fast, slow, new], {'fast': [100.0] * 30, 'slow': [3000.0] * 30}
+    )
+    
+    assert adjusted[0] == {**fast, 'timeout': ADAPTIVE_TIMEOUT_FLOOR}
+    assert 'timeout' not in fast
+    assert adjusted[1] is slow
+    assert adjusted[2] is new
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Pruebas del circuit breaker del checker y su persistencia (user-031)
+"""
+
+import scheduler
+from scheduler import DatasetMonitor
+from services.breaker import (
+    CircuitBreakerRegistry, CIRCUIT_OPEN_ERROR, CLOSED, OPEN, HALF_OPEN,
+    dataset_key, host_key
+)
+from services.sources import CatalogDiff
+
+DS = {'id': 'ds1', 'name': 'Dataset 1', 'category': 'test', 'url': 'https://a.example.cl/d1.csv'}
+OTHER = {'id': 'ds2', 'name': 'Dataset 2', 'category': 'test', 'url': 'https://a.example.cl/d2.csv'}
+
+
+def _state(registry, key):
+    return registry._states[key]
+
+
+def test_opens_after_threshold_and_skips_until_probe():
+    breakers = CircuitBreakerRegistry(failure_threshold=3, base_interval=60)
+    for i in range(2):
+        breakers.record(DS, 'down', 500, 'HTTPError', now=100 + i)
+        assert _state(breakers, dataset_key(DS)).state == CLOSED
+    breakers.record(DS, 'down', 500, 'HTTPError', now=102)
+    
+    st = _state(breakers, dataset_key(DS))
+    assert st.state == OPEN
+    assert st.next_probe_at == 162
+    assert breakers.allow(DS, now=150) is False
+    # El host respondió: su circuito sigue cerrado y los demás datasets pasan
+    assert breakers.allow(OTHER, now=150) is True
+
+
+def test_half_open_probe_closes_on_success():
+    breakers = CircuitBreakerRegistry(failure_threshold=1, base_interval=60)
+    breakers.record(DS, 'down', 500, 'HTTPError', now=0)
+    
+    assert breakers.allow(DS, now=60) is True
+    assert _state(breakers, dataset_key(DS)).state == HALF_OPEN
+    breakers.record(DS, 'up', 200, None, now=61)
+    
+    st = _state(breakers, dataset_key(DS))
+    assert (st.state, st.failures, st.opened_count, st.last_error) == (CLOSED, 0, 0, None)
+    assert breakers.allow(DS, now=62) is True
+
+
+def test_half_open_failure_reopens_with_exponential_backoff():
+    breakers = CircuitBreakerRegistry(failure_threshold=1, base_interval=60, max_interval=200)
+    breakers.record(DS, 'down', 500, 'HTTPError', now=0)
+    
+    assert breakers.allow(DS, now=60)
+    breakers.record(DS, 'down', 500, 'HTTPError', now=60)
+    st = _state(breakers, dataset_key(DS))
+    assert (st.state, st.opened_count, st.next_probe_at) == (OPEN, 2, 180)
+    
+    assert breakers.allow(DS, now=180)
+    breakers.record(DS, 'down', 500, 'HTTPError', now=180)
+    # 60 * 2**2 = 240 se acota a max_interval
+    assert st.next_probe_at == 380
+
+
+def test_open_host_lets_a_single_dataset_probe():
+    breakers = CircuitBreakerRegistry(host_failure_threshold=1, base_interval=60)
+    breakers.record(DS, 'down', None, 'ConnectionError', now=0)
+    assert _state(breakers, host_key(DS)).state == OPEN
+    
+    breakers.begin_cycle()
+    assert breakers.allow(OTHER, now=10) is False
+    assert breakers.allow(OTHER, now=60) is True
+    assert _state(breakers, host_key(DS)).state == HALF_OPEN
+    assert breakers.allow(DS, now=60) is False
+    
+    breakers.record(OTHER, 'up', 200, None, now=61)
+    assert _state(breakers, host_key(DS)).state == CLOSED
+    assert breakers.allow(DS, now=62) is True
+
+
+def test_state_is_restored_from_the_database(db):
+    breakers = CircuitBreakerRegistry(failure_threshold=1, base_interval=60)
+    breakers.record(DS, 'down', 500, 'HTTPError', now=1000)
+    breakers.allow(OTHER, now=1000)
+    breakers.record(OTHER, 'down', 500, 'HTTPError', now=1000)
+    assert breakers.allow(OTHER, now=1060)   # queda half-open
+    db.save_circuit_breakers(breakers.pop_dirty())
+    assert breakers.pop_dirty() == []
+    
+    monitor = DatasetMonitor(db)
+    monitor._load_state()
+    restored = monitor.breakers
+    st = _state(restored, dataset_key(DS))
+    assert (st.state, st.failures, st.next_probe_at, st.last_error) == (OPEN, 1, 1060, 'HTTPError')
+    # Un half-open interrumpido vuelve a open
+    assert _state(restored, dataset_key(OTHER)).state == OPEN
+    assert restored.allow(DS, now=1030) is False
+
+
+class _Catalog:
+    revision = 1
+    last_diff = CatalogDiff()
+    
+    def __init__(self, datasets):
+        self.datasets = datasets
+    
+    def load(self):
+        return self.datasets
+
+
+def test_open_circuit_results_are_not_persisted(db, monkeypatch):
+    monitor = DatasetMonitor(db, adaptive_timeouts=False)
+    results = [
+        {**DS, 'status': 'up', 'http_code': 200, 'latency_ms': 120.0},
+        {**OTHER, 'status': 'down', 'error': CIRCUIT_OPEN_ERROR},
+    ]
+    monkeypatch.setattr(scheduler, 'get_catalog', lambda: _Catalog([DS, OTHER]))
+    monkeypatch.setattr(scheduler, 'check_all', lambda datasets, **kwargs: results)
+    monkeypatch.setattr(scheduler, 'invalidate_datasets_cache', lambda: None)
+    published = []
+    monitor.add_subscriber(published.append)
+    
+    monitor._run_cycle()
+    
+    assert db.get_latest_dataset_status('ds1').status == 'up'
+    assert db.get_latest_dataset_status('ds2') is None
+    assert [r['id'] for r in published] == ['ds1']
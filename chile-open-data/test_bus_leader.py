@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Pruebas del bus de mensajes y la elección de líder entre workers (user-029)
+"""
+
+import time
+
+import pytest
+
+import bus
+from bus import LocalMessageBus, create_message_bus, init_message_bus, get_message_bus
+from leader import LeaderLease
+
+
+def test_local_bus_delivers_to_channel_subscribers():
+    message_bus = LocalMessageBus()
+    received = []
+    message_bus.subscribe('cycle', lambda m: received.append(('a', m)))
+    message_bus.subscribe('cycle', lambda m: received.append(('b', m)))
+    message_bus.subscribe('other', lambda m: received.append(('other', m)))
+    
+    message_bus.publish('cycle', {'n': 1})
+    message_bus.publish('nadie', {'n': 2})
+    assert received == [('a', {'n': 1}), ('b', {'n': 1})]
+
+
+def test_local_bus_isolates_failing_subscribers():
+    message_bus = LocalMessageBus()
+    received = []
+    message_bus.subscribe('cycle', lambda m: 1 / 0)
+    message_bus.subscribe('cycle', received.append)
+    
+    message_bus.publish('cycle', {'n': 1})
+    assert received == [{'n': 1}]
+
+
+def test_create_message_bus_picks_the_backend():
+    assert isinstance(create_message_bus(None), LocalMessageBus)
+    assert isinstance(create_message_bus('local'), LocalMessageBus)
+    with pytest.raises(ValueError):
+        create_message_bus('amqp://broker')
+
+
+def test_redis_bus_requires_the_redis_package(monkeypatch):
+    import builtins
+    real_import = builtins.__import__
+    
+    def no_redis(name, *args, **kwargs):
+        if name == 'redis':
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+    
+    monkeypatch.setattr(builtins, '__import__', no_redis)
+    with pytest.raises(RuntimeError, match='redis'):
+        create_message_bus('redis://localhost:6379/0')
+
+
+def test_init_message_bus_replaces_the_global(monkeypatch):
+    monkeypatch.setattr(bus, 'message_bus', bus.message_bus)
+    created = init_message_bus('local')
+    assert get_message_bus() is created
+
+
+def _lease(tmp_path, holder, ttl=30.0):
+    return LeaderLease(tmp_path / "lease.db", ttl=ttl, holder_id=holder)
+
+
+def test_single_leader_among_contenders(tmp_path):
+    a, b = _lease(tmp_path, 'a'), _lease(tmp_path, 'b')
+    
+    assert a.try_acquire() is True
+    assert b.try_acquire() is False
+    # El líder renueva sin perder el lease; el otro sigue esperando
+    assert a.try_acquire() is True
+    assert b.try_acquire() is False
+    assert (a.is_leader, b.is_leader) == (True, False)
+    assert b.get_info()['current_holder'] == 'a'
+
+
+def test_renewal_keeps_acquired_at(tmp_path):
+    a = _lease(tmp_path, 'a')
+    a.try_acquire()
+    conn = a._connect()
+    first = conn.execute("SELECT acquired_at, expires_at FROM leader_lease").fetchone()
+    time.sleep(0.01)
+    a.try_acquire()
+    renewed = conn.execute("SELECT acquired_at, expires_at FROM leader_lease").fetchone()
+    conn.close()
+    
+    assert renewed[0] == first[0]
+    assert renewed[1] > first[1]
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    a, b = _lease(tmp_path, 'a', ttl=0.2), _lease(tmp_path, 'b', ttl=0.2)
+    assert a.try_acquire() is True
+    assert b.try_acquire() is False
+    
+    time.sleep(0.3)
+    assert b.get_info()['current_holder'] is None
+    assert b.try_acquire() is True
+    # El líder anterior lo detecta en su próxima renovación
+    assert a.try_acquire() is False
+    assert (a.is_leader, b.is_leader) == (False, True)
+
+
+def test_release_hands_over_without_waiting(tmp_path):
+    a, b = _lease(tmp_path, 'a'), _lease(tmp_path, 'b')
+    a.try_acquire()
+    
+    b.release()   # sin el lease no hace nada
+    assert b.try_acquire() is False
+    a.release()
+    assert a.is_leader is False
+    assert b.try_acquire() is True
+
+
+def test_leases_are_independent_by_name(tmp_path):
+    monitor = LeaderLease(tmp_path / "lease.db", name='dataset_monitor', holder_id='a')
+    reports = LeaderLease(tmp_path / "lease.db", name='reports', holder_id='b')
+    assert monitor.try_acquire() and reports.try_acquire()
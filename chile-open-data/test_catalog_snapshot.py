@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los snapshots binarios del catálogo (user-039)
+"""
+
+import pickle
+
+import pytest
+
+from services import catalog_snapshot
+from services.catalog_snapshot import CACHE_DIRNAME, cached_parse, snapshot_path, source_hash
+from services.sources import SourceCatalog
+
+YAML = b"datasets:\n  - {id: a, name: A, category: salud, url: 'https://datos.example.cl/a'}\n"
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "sources.yaml"
+    path.write_bytes(YAML)
+    return path
+
+
+class Parser:
+    def __init__(self):
+        self.calls = 0
+    
+    def __call__(self, raw):
+        self.calls += 1
+        return [{'raw': raw.decode()}]
+
+
+def _snapshots(source):
+    return sorted(p.name for p in (source.parent / CACHE_DIRNAME).glob("*.pickle"))
+
+
+def test_snapshot_is_reused_while_the_yaml_is_unchanged(source):
+    parse = Parser()
+    first = cached_parse(source, YAML, "test", parse, kind=list)
+    second = cached_parse(source, YAML, "test", parse, kind=list)
+    
+    assert first == second == [{'raw': YAML.decode()}]
+    assert parse.calls == 1
+    assert snapshot_path(source, "test", source_hash(YAML)).exists()
+
+
+def test_changed_yaml_invalidates_the_snapshot(source):
+    parse = Parser()
+    cached_parse(source, YAML, "test", parse)
+    old = _snapshots(source)
+    
+    edited = YAML + b"# comentario\n"
+    assert cached_parse(source, edited, "test", parse) == [{'raw': edited.decode()}]
+    assert parse.calls == 2
+    # Solo queda el snapshot del contenido vigente
+    assert _snapshots(source) == [snapshot_path(source, "test", source_hash(edited)).name]
+    assert _snapshots(source) != old
+
+
+def test_namespaces_do_not_share_snapshots(source):
+    parse = Parser()
+    cached_parse(source, YAML, "sources", parse)
+    cached_parse(source, YAML, "scraper", parse)
+    assert parse.calls == 2
+    assert len(_snapshots(source)) == 2
+
+
+@pytest.mark.parametrize('payload', [
+    b"no es un pickle",
+    pickle.dumps([{'id': 'a'}])[:-5],                       # truncado
+    b"cno_existe_x\nCls\n.",                               # clase que ya no existe
+], ids=['garbage', 'truncated', 'missing-class'])
+def test_corrupt_snapshot_falls_back_to_parsing(source, payload):
+    path = snapshot_path(source, "test", source_hash(YAML))
+    path.parent.mkdir()
+    path.write_bytes(payload)
+    
+    parse = Parser()
+    assert cached_parse(source, YAML, "test", parse, kind=list) == [{'raw': YAML.decode()}]
+    assert parse.calls == 1
+    # El snapshot se reescribe con el valor válido
+    with open(path, "rb") as f:
+        assert pickle.load(f) == [{'raw': YAML.decode()}]
+
+
+def test_incompatible_snapshot_type_falls_back_to_parsing(source):
+    path = snapshot_path(source, "test", source_hash(YAML))
+    path.parent.mkdir()
+    path.write_bytes(pickle.dumps({'datasets': 'formato anterior'}))
+    
+    parse = Parser()
+    assert cached_parse(source, YAML, "test", parse, kind=list) == [{'raw': YAML.decode()}]
+    assert parse.calls == 1
+
+
+def test_snapshot_version_is_part_of_the_key(source, monkeypatch):
+    parse = Parser()
+    cached_parse(source, YAML, "test", parse)
+    monkeypatch.setattr(catalog_snapshot, 'SNAPSHOT_VERSION', catalog_snapshot.SNAPSHOT_VERSION + 1)
+    cached_parse(source, YAML, "test", parse)
+    assert parse.calls == 2
+
+
+def test_catalog_loads_despite_a_corrupt_snapshot(source):
+    SourceCatalog(source).load()
+    for path in (source.parent / CACHE_DIRNAME).glob("*.pickle"):
+        path.write_bytes(pickle.dumps("incompatible"))
+    
+    datasets = SourceCatalog(source).load()
+    assert [ds['id'] for ds in datasets] == ['a']
+
+
+def test_unwritable_cache_dir_still_parses(source):
+    (source.parent / CACHE_DIRNAME).write_text("no es un directorio")
+    parse = Parser()
+    assert cached_parse(source, YAML, "test", parse) == [{'raw': YAML.decode()}]
+    assert cached_parse(source, YAML, "test", parse) == [{'raw': YAML.decode()}]
+    assert parse.calls == 2
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los probes condicionales y con Range del checker (user-033)
+"""
+
+from contextlib import contextmanager
+
+import pytest
+import requests
+
+from services import checker
+from services.politeness import HostPoliteness
+
+DS = {'id': 'ds1', 'name': 'Dataset 1', 'category': 'test', 'url': 'https://a.example.cl/d1.csv'}
+VALIDATORS = {'etag': '"v1"', 'last_modified': 'Mon, 01 Sep 2025 10:00:00 GMT'}
+
+
+def _response(status, headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    return resp
+
+
+class FakeSession:
+    """Sesión HTTP que responde en orden y registra cada request"""
+    
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+    
+    def _request(self, method, url, headers=None, **kwargs):
+        self.calls.append((method, dict(headers or {})))
+        return self.responses.pop(0)
+    
+    def head(self, url, **kwargs):
+        return self._request('HEAD', url, **kwargs)
+    
+    def get(self, url, **kwargs):
+        return self._request('GET', url, **kwargs)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    fake = FakeSession([])
+    
+    @contextmanager
+    def timed_session(resolver=None):
+        yield fake
+    
+    monkeypatch.setattr(checker, 'timed_session', timed_session)
+    monkeypatch.setattr(checker.dns_cache, 'resolve', lambda host: 0.0)
+    monkeypatch.setattr(checker, 'host_politeness', HostPoliteness(min_delay=0, jitter=0))
+    return fake
+
+
+def test_probe_sends_validators_as_conditional_headers(session):
+    session.responses = [_response(200, {'ETag': '"v1"'})]
+    checker._check_one(DS, VALIDATORS)
+    
+    method, headers = session.calls[0]
+    assert method == 'HEAD'
+    assert headers == {'If-None-Match': '"v1"', 'If-Modified-Since': VALIDATORS['last_modified']}
+
+
+def test_probe_without_validators_is_unconditional(session):
+    session.responses = [_response(200)]
+    result = checker._check_one(DS)
+    
+    assert session.calls == [('HEAD', {})]
+    assert result.content_changed is None
+
+
+def test_not_modified_is_up_and_keeps_validators(session):
+    session.responses = [_response(304)]
+    result = checker._check_one(DS, VALIDATORS)
+    
+    assert (result.status, result.http_code, result.content_changed) == ('up', 304, False)
+    assert result.etag == VALIDATORS['etag']
+    assert result.last_modified == VALIDATORS['last_modified']
+
+
+def test_failed_head_falls_back_to_single_byte_get(session):
+    session.responses = [_response(405), _response(206, {'ETag': '"v2"'})]
+    result = checker._check_one(DS, VALIDATORS)
+    
+    assert [m for m, _ in session.calls] == ['HEAD', 'GET']
+    get_headers = session.calls[1][1]
+    assert get_headers['Range'] == 'bytes=0-0'
+    assert get_headers['If-None-Match'] == '"v1"'
+    assert (result.status, result.http_code, result.etag) == ('up', 206, '"v2"')
+    assert result.content_changed is True
+
+
+def test_get_datasets_always_use_range(session):
+    session.responses = [_response(206)]
+    checker._check_one({**DS, 'method': 'GET'})
+    
+    assert session.calls == [('GET', {'Range': 'bytes=0-0'})]
+
+
+def test_rate_limited_head_does_not_fall_back_to_get(session):
+    session.responses = [_response(429, {'Retry-After': '120'})]
+    result = checker._check_one(DS)
+    
+    assert [m for m, _ in session.calls] == ['HEAD']
+    assert (result.status, result.error) == ('unknown', checker.RATE_LIMITED_ERROR)
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'ETag': '"v1"'}, False),
+    ({'ETag': '"v2"'}, True),
+    ({'Last-Modified': VALIDATORS['last_modified']}, False),
+    ({'Last-Modified': 'Tue, 02 Sep 2025 10:00:00 GMT'}, True),
+    ({}, None),
+])
+def test_content_changed_compares_validators(headers, expected):
+    assert checker._content_changed(_response(200, headers), VALIDATORS) is expected
+
+
+def test_content_changed_is_unknown_on_errors():
+    assert checker._content_changed(_response(500, {'ETag': '"v2"'}), VALIDATORS) is None
+    assert checker._content_changed(_response(200, {'ETag': '"v2"'}), None) is None
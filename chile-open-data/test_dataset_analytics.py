@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los analytics por dataset vectorizados con numpy (user-046)
+"""
+
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import analytics
+from analytics import AnalyticsEngine, _window_metrics, _window_metrics_python
+from models import DatasetStatus, UP, DOWN
+
+MINUTE_MS = 60 * 1000
+
+
+def test_window_metrics_mttr_mtbf_and_percentiles():
+    # Dataset 1: U D D U U D U (una caída de 2 min y otra de 1 min)
+    # Dataset 2: U U D (caída abierta al final de la ventana)
+    statuses = {1: [UP, DOWN, DOWN, UP, UP, DOWN, UP], 2: [UP, UP, DOWN]}
+    rows = []
+    for key, sequence in statuses.items():
+        for minute, status in enumerate(sequence):
+            latency = 100.0 + 10 * minute * key if status == UP else np.nan
+            rows.append((key, minute * MINUTE_MS, status, latency))
+    rows.reverse()
+    metrics = _window_metrics(np.array(rows, dtype=np.float64))
+    
+    assert metrics['dataset_key'].tolist() == [1, 2]
+    assert metrics['total_checks'].tolist() == [7, 3]
+    assert metrics['successful_checks'].tolist() == [4, 2]
+    assert metrics['last_failure'].tolist() == [5 * MINUTE_MS, 2 * MINUTE_MS]
+    assert metrics['mttr'][0] == pytest.approx(1.5)
+    assert np.isnan(metrics['mttr'][1])
+    # Dataset 1: 6 min de ventana, 3 caídos, 2 caídas. Dataset 2: la caída abierta dura 0 al último chequeo
+    assert metrics['mtbf'][0] == pytest.approx(1.5)
+    assert metrics['mtbf'][1] == pytest.approx(2.0)
+    
+    for i, key in enumerate((1, 2)):
+        latencies = [100.0 + 10 * m * key for m, s in enumerate(statuses[key]) if s == UP]
+        assert metrics['avg_latency'][i] == pytest.approx(np.mean(latencies))
+        for q in (50, 95, 99):
+            assert metrics[f'p{q}'][i] == pytest.approx(np.percentile(latencies, q))
+
+
+def test_window_metrics_python_matches_numpy():
+    rng = random.Random(46)
+    rows = []
+    for key in range(1, 8):
+        up_probability = rng.random()
+        for minute in rng.sample(range(500), rng.randint(1, 120)):
+            status = UP if rng.random() < up_probability else DOWN
+            latency = rng.uniform(20, 900) if status == UP and rng.random() < 0.9 else None
+            rows.append((key, minute * MINUTE_MS, status, latency))
+    rng.shuffle(rows)
+    vectorized = _window_metrics(np.array(rows, dtype=np.float64))
+    python = _window_metrics_python(rows)
+    
+    assert set(python) == set(vectorized)
+    for field, expected in vectorized.items():
+        for i, (actual, wanted) in enumerate(zip(python[field], expected.tolist())):
+            if isinstance(wanted, float) and math.isnan(wanted):
+                assert math.isnan(actual), (field, i)
+            else:
+                assert actual == pytest.approx(wanted), (field, i)
+
+
+def test_numpy_matches_python_fallback(db, monkeypatch):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    for i in range(200):
+        checked_at = now - timedelta(minutes=10 * i)
+        for dataset_id, failing in (('stable', lambda i: i % 25 == 0),
+                                    ('declining', lambda i: i < 60 and i % 2 == 0),
+                                    ('down', lambda i: True)):
+            status = 'down' if failing(i) else 'up'
+            db.save_dataset_status(DatasetStatus(
+                id=dataset_id, name=dataset_id.title(), category='cat1', url='http://example.cl',
+                status=status, http_code=200 if status == 'up' else 500,
+                latency_ms=50.0 + i % 17 if status == 'up' else None, error=None, checked_at=checked_at
+            ))
+    
+    vectorized = AnalyticsEngine(db).generate_datasets_analytics(None, days=3)
+    monkeypatch.setattr(analytics, 'np', None)
+    fallback = AnalyticsEngine(db).generate_datasets_analytics(list(vectorized), days=3)
+    
+    assert set(vectorized) == set(fallback) == {'stable', 'declining', 'down'}
+    for dataset_id, expected in fallback.items():
+        actual = vectorized[dataset_id]
+        assert actual.to_dict() == pytest.approx(expected.to_dict()), dataset_id
+    assert vectorized['declining'].reliability_trend == 'declining'
+    assert vectorized['stable'].mttr_minutes == fallback['stable'].mttr_minutes == 10.0
+    assert vectorized['down'].mttr_minutes is None
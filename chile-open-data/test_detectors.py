@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los detectores online de degradación (user-050)
+"""
+
+import random
+
+from services.detectors import AnomalyDetectorRegistry, WARMUP_SAMPLES, DEGRADED, RECOVERED
+
+
+def feed(registry, dataset_id, checks, start=0):
+    """Aplica (status, latencia) en orden y devuelve los eventos con el índice del chequeo"""
+    events = []
+    for i, (status, latency) in enumerate(checks, start):
+        events += [(i, e) for e in registry.update(dataset_id, status, latency, now=float(i))]
+    return events
+
+
+def jittered(rng, n, latency, spread=0.2):
+    return [('up', latency * rng.uniform(1 - spread, 1 + spread)) for _ in range(n)]
+
+
+def test_stable_latency_with_jitter_does_not_alarm():
+    rng = random.Random(1)
+    assert feed(AnomalyDetectorRegistry(), 'ds', jittered(rng, 500, 200)) == []
+
+
+def test_no_alarm_during_warmup():
+    registry = AnomalyDetectorRegistry()
+    checks = [('up', 100.0)] * 5 + [('up', 5000.0)] * (WARMUP_SAMPLES - 6)
+    assert feed(registry, 'ds', checks) == []
+
+
+def test_latency_regression_degrades_and_recovers():
+    rng = random.Random(2)
+    registry = AnomalyDetectorRegistry()
+    feed(registry, 'ds', jittered(rng, 100, 200))
+    
+    events = feed(registry, 'ds', jittered(rng, 20, 600), start=100)
+    assert [(e['detector'], e['state']) for _, e in events] == [('latency', DEGRADED)]
+    assert events[0][0] < 105
+    assert events[0][1]['baseline'] < 260 < events[0][1]['value']
+    # Mientras dura la alarma la línea base no absorbe la degradación
+    baseline = registry._states['ds'].latency_mean
+    assert feed(registry, 'ds', jittered(rng, 30, 600), start=120) == []
+    assert registry._states['ds'].latency_mean == baseline
+    assert [d['dataset_id'] for d in registry.degraded()] == ['ds']
+    
+    events = feed(registry, 'ds', jittered(rng, 50, 200), start=150)
+    assert [(e['detector'], e['state']) for _, e in events] == [('latency', RECOVERED)]
+    assert registry.degraded() == []
+
+
+def test_intermittent_failures_degrade_failure_rate():
+    registry = AnomalyDetectorRegistry()
+    feed(registry, 'ds', [('up', 100.0)] * 100)
+    events = feed(registry, 'ds', [('down' if i % 2 else 'up', 100.0) for i in range(30)], start=100)
+    assert [(e['detector'], e['state']) for _, e in events] == [('failure_rate', DEGRADED)]
+    
+    events = feed(registry, 'ds', [('up', 100.0)] * 60, start=130)
+    assert [(e['detector'], e['state']) for _, e in events] == [('failure_rate', RECOVERED)]
+
+
+def test_state_round_trip_through_database(db):
+    rng = random.Random(3)
+    registry = AnomalyDetectorRegistry()
+    feed(registry, 'ds', jittered(rng, 100, 200))
+    feed(registry, 'ds', jittered(rng, 20, 600), start=100)
+    db.save_anomaly_detectors(registry.pop_dirty())
+    assert registry.pop_dirty() == []
+    
+    restored = AnomalyDetectorRegistry()
+    restored.load(db.get_anomaly_detectors())
+    assert restored._states == registry._states
+    assert restored.degraded() == registry.degraded()
+    # El estado restaurado sigue el mismo camino que el original
+    checks = jittered(rng, 50, 200)
+    assert feed(restored, 'ds', checks, start=120) == feed(registry, 'ds', checks, start=120)
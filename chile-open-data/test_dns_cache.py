@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Pruebas del cache DNS acotado a las sesiones HTTP del checker (user-035)
+"""
+
+import socket
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from services.dns_cache import DNSCache
+from services.http_timing import timed_session
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Registra las llamadas al resolver del sistema"""
+    calls = []
+    original = socket.getaddrinfo
+    
+    def counting(host, *args, **kwargs):
+        calls.append(host)
+        return original(host, *args, **kwargs)
+    
+    monkeypatch.setattr(socket, "getaddrinfo", counting)
+    return calls
+
+
+def test_session_resolves_each_host_once(server, lookups):
+    cache = DNSCache(ttl=60)
+    global_getaddrinfo = socket.getaddrinfo
+    for _ in range(3):
+        with timed_session(resolver=cache) as session:
+            assert session.get(f"http://localhost:{server}/").status_code == 200
+    
+    assert lookups.count("localhost") == 1
+    assert cache.stats()["hits"] >= 2
+    # El resolver global del proceso no se toca
+    assert socket.getaddrinfo is global_getaddrinfo
+
+
+def test_sessions_without_resolver_use_the_system_resolver(server, lookups):
+    for _ in range(2):
+        with timed_session() as session:
+            session.get(f"http://localhost:{server}/")
+    
+    assert lookups.count("localhost") == 2
+
+
+def test_failed_resolution_is_cached_and_mapped_to_connection_error(lookups):
+    import requests
+    
+    cache = DNSCache(negative_ttl=60)
+    for _ in range(2):
+        with timed_session(resolver=cache) as session, pytest.raises(requests.ConnectionError):
+            session.get("http://no-existe.invalid/", timeout=2)
+    
+    assert lookups.count("no-existe.invalid") == 1
+    assert cache.stats()["negative_entries"] == 1
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Pruebas del snapshot de conexión de los WebSockets (user-028)
+"""
+
+import json
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from models import DatasetStatus
+from notifications import notification_manager, create_system_notification
+from websockets import HelloSnapshot, ENCODING_JSON, ENCODING_MSGPACK
+
+
+@pytest.fixture(autouse=True)
+def empty_notifications():
+    notification_manager.clear_notifications()
+    yield
+    notification_manager.clear_notifications()
+
+
+def status(dataset_id, checked_at, state='up', latency=100.0):
+    return {'id': dataset_id, 'status': state, 'latency_ms': latency, 'checked_at': checked_at}
+
+
+def decode(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def test_last_checked_compares_instants_not_strings():
+    snapshot = HelloSnapshot()
+    snapshot.update_datasets([
+        # Como texto, 'T' > ' ' haría ganar a este aunque sea el más antiguo
+        status('iso', '2026-10-19T10:30:00+00:00'),
+        status('db', '2026-10-19 12:00:00.000+00:00'),
+        # 11:00 en Chile continental (-03:00) = 14:00 UTC: el más reciente
+        status('cycle', datetime(2026, 10, 19, 11, 0, tzinfo=timezone(timedelta(hours=-3)))),
+        status('naive', '2026-10-19 13:00:00'),
+        status('unknown', None),
+    ])
+    
+    stats = decode(snapshot.payload(ENCODING_JSON))['stats']
+    assert stats['last_checked'] == '2026-10-19T14:00:00+00:00'
+    assert stats['total_datasets'] == 5
+    assert stats['available_datasets'] == 5
+
+
+def test_payload_is_built_once_per_change():
+    snapshot = HelloSnapshot()
+    snapshot.update_datasets([status('a', '2026-10-19 12:00:00', latency=100.0),
+                              status('b', '2026-10-19 12:00:00', 'down', None)])
+    
+    first = snapshot.payload(ENCODING_JSON)
+    assert snapshot.payload(ENCODING_JSON) is first
+    body = decode(first)
+    assert body['version'] == 1
+    assert body['stats']['avg_latency'] == 100.0
+    assert body['stats']['unavailable_datasets'] == 1
+    
+    # Una notificación nueva invalida el snapshot
+    create_system_notification("Prueba", "mensaje")
+    body = decode(snapshot.payload(ENCODING_JSON))
+    assert body['version'] == 2
+    assert body['unread_count'] == 1
+    assert body['notifications'][0]['title'] == "Prueba"
+    
+    # Un ciclo nuevo también
+    snapshot.update_datasets([status('a', '2026-10-19 12:05:00')])
+    body = decode(snapshot.payload(ENCODING_JSON))
+    assert body['version'] == 3
+    assert [d['id'] for d in body['datasets']] == ['a']
+
+
+def test_msgpack_payload_matches_json():
+    msgpack = pytest.importorskip("msgpack")
+    snapshot = HelloSnapshot()
+    snapshot.update_datasets([status('a', datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc))])
+    
+    as_json = decode(snapshot.payload(ENCODING_JSON))
+    as_msgpack = msgpack.unpackb(snapshot.payload(ENCODING_MSGPACK), raw=False)
+    assert as_msgpack == as_json
+
+
+def test_first_snapshot_reads_latest_status_from_db(db):
+    checked_at = datetime.now(timezone.utc).replace(microsecond=0)
+    for dataset_id, offset in (('old', 10), ('new', 0)):
+        db.save_dataset_status(DatasetStatus(
+            id=dataset_id, name=dataset_id, category='cat', url='http://example.cl',
+            status='up', http_code=200, latency_ms=50.0, error=None,
+            checked_at=checked_at - timedelta(minutes=offset)
+        ))
+    
+    body = decode(HelloSnapshot(db).payload(ENCODING_JSON))
+    assert {d['id'] for d in body['datasets']} == {'old', 'new'}
+    assert body['stats']['last_checked'] == checked_at.isoformat()
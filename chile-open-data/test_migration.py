@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la migración del esquema original al historial normalizado y particionado (user-041)
+"""
+
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import Database, UP, DOWN, to_epoch_ms
+
+# Esquema original: estados y fechas en texto, una fila con nombre/categoría/url por chequeo
+BASELINE_SCHEMA = [
+    """
+    CREATE TABLE dataset_status (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dataset_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        category TEXT NOT NULL,
+        url TEXT NOT NULL,
+        status TEXT NOT NULL,
+        http_code INTEGER,
+        latency_ms REAL,
+        error TEXT,
+        checked_at TIMESTAMP NOT NULL,
+        FOREIGN KEY (dataset_id) REFERENCES datasets (id)
+    )
+    """,
+    """
+    CREATE TABLE datasets (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        category TEXT NOT NULL,
+        url TEXT NOT NULL,
+        description TEXT,
+        method TEXT DEFAULT 'HEAD',
+        timeout INTEGER DEFAULT 10,
+        active BOOLEAN DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE monitoring_summary (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date DATE NOT NULL UNIQUE,
+        total_datasets INTEGER NOT NULL,
+        available_count INTEGER NOT NULL,
+        avg_latency_ms REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX idx_dataset_status_dataset_id ON dataset_status (dataset_id)",
+    "CREATE INDEX idx_dataset_status_checked_at ON dataset_status (checked_at)",
+    "CREATE INDEX idx_dataset_status_dataset_checked ON dataset_status (dataset_id, checked_at)",
+]
+
+DATASETS = ('ds1', 'ds2', 'ds3')
+STATUSES = ('up', 'up', 'down', 'unknown')
+
+
+def legacy_rows(now):
+    """Chequeos cada 45 min durante 3 días, con los formatos de fecha que guardaba la versión original"""
+    rows = []
+    for i in range(96):
+        checked_at = now - timedelta(minutes=45 * i, milliseconds=250 * i)
+        for n, dataset_id in enumerate(DATASETS):
+            status = STATUSES[(i + n) % len(STATUSES)]
+            # datetime con zona (adaptador de sqlite3), ISO con 'T' o texto sin zona (UTC)
+            if i % 3 == 0:
+                stored = checked_at
+            elif i % 3 == 1:
+                stored = checked_at.isoformat()
+            else:
+                stored = checked_at.replace(tzinfo=None).isoformat(sep=' ')
+            rows.append((dataset_id, dataset_id.upper(), f'cat{n}', f'http://example.cl/{dataset_id}',
+                         status, 200 if status == 'up' else 500, 10.0 + i if status == 'up' else None,
+                         None if status == 'up' else 'HTTPError', stored, checked_at))
+    return rows
+
+
+def wait_for_migration():
+    for thread in threading.enumerate():
+        if thread.name == "history-migration":
+            thread.join(timeout=60)
+
+
+@pytest.fixture
+def baseline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "chile_data.db"
+    rows = legacy_rows(datetime.now(timezone.utc).replace(microsecond=0))
+    with sqlite3.connect(path) as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(statement)
+        conn.executemany("""
+            INSERT INTO dataset_status (dataset_id, name, category, url, status, http_code, latency_ms, error, checked_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [row[:9] for row in rows])
+        # Fila con fecha ilegible: no se puede ubicar en una partición y se descarta
+        conn.execute("""
+            INSERT INTO dataset_status (dataset_id, name, category, url, status, checked_at)
+            VALUES ('ds1', 'DS1', 'cat0', 'http://example.cl/ds1', 'up', 'ayer')
+        """)
+    return path, rows
+
+
+def migrated_db(path):
+    db = Database(str(path))
+    wait_for_migration()
+    assert not db._has_pending_migration()
+    return db
+
+
+def test_migration_converts_rows_and_keeps_read_api(baseline):
+    path, rows = baseline
+    db = migrated_db(path)
+    
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM check_history").fetchone()[0] == len(rows)
+        assert conn.execute("SELECT COUNT(*) FROM dataset_keys").fetchone()[0] == len(DATASETS)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert not {'dataset_status', 'dataset_status_legacy'} & tables
+        partitions = [row[0] for row in conn.execute("SELECT name FROM history_partitions")]
+        # Estados como enteros y fechas como epoch ms en las particiones
+        raw = conn.execute(f"SELECT DISTINCT status FROM {partitions[0]}").fetchall()
+        assert {row[0] for row in raw} <= {UP, DOWN, 0}
+        assert conn.execute(f"SELECT typeof(checked_at) FROM {partitions[0]} LIMIT 1").fetchone()[0] == 'integer'
+    # Una partición por día UTC con chequeos
+    assert len(partitions) == len({row[9].strftime('%Y%m%d') for row in rows})
+    
+    for dataset_id in DATASETS:
+        expected = sorted((row for row in rows if row[0] == dataset_id), key=lambda row: row[9], reverse=True)
+        history = [dict(row) for row in db.get_dataset_history(dataset_id, hours=24 * 4)]
+        assert len(history) == len(expected)
+        for got, row in zip(history, expected):
+            assert (got['dataset_id'], got['name'], got['category'], got['url']) == row[:4]
+            assert got['status'] == row[4]
+            assert (got['http_code'], got['latency_ms'], got['error']) == row[5:8]
+            assert to_epoch_ms(datetime.fromisoformat(got['checked_at'])) == to_epoch_ms(row[9])
+    
+    latest = {row['id']: dict(row) for row in db.get_latest_status()}
+    for dataset_id in DATASETS:
+        newest = max((row for row in rows if row[0] == dataset_id), key=lambda row: row[9])
+        assert latest[dataset_id]['status'] == newest[4]
+
+
+def test_running_the_migration_again_is_a_no_op(baseline):
+    path, rows = baseline
+    db = migrated_db(path)
+    with sqlite3.connect(path) as conn:
+        before = conn.execute("SELECT * FROM check_history ORDER BY id").fetchall()
+        intervals = conn.execute("SELECT * FROM status_intervals").fetchall()
+    
+    assert db.migrate_legacy_history() == 0
+    reopened = migrated_db(path)
+    assert reopened.migrate_legacy_history() == 0
+    
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT * FROM check_history ORDER BY id").fetchall() == before
+        assert conn.execute("SELECT * FROM status_intervals").fetchall() == intervals
+    assert len(before) == len(rows)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Pruebas del despacho cortés por host y los reintentos del scraper (user-037)
+"""
+
+import random
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from services.politeness import (
+    HostPoliteness, HostRateLimited, parse_retry_after, spread_by_host
+)
+from data_sources.scripts.scraper import fetch
+
+
+def _ds(ds_id, host):
+    return {'id': ds_id, 'url': f'https://{host}/{ds_id}.csv'}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Registra los sleeps sin esperar de verdad"""
+    calls = []
+    monkeypatch.setattr(time, 'sleep', calls.append)
+    return calls
+
+
+def test_slot_limits_concurrency_per_host():
+    politeness = HostPoliteness(max_per_host=2, min_delay=0, jitter=0)
+    lock = threading.Lock()
+    active = {'a': 0, 'b': 0}
+    peak = {'a': 0, 'b': 0}
+    
+    def probe(host):
+        with politeness.slot(host):
+            with lock:
+                active[host] += 1
+                peak[host] = max(peak[host], active[host])
+            time.sleep(0.05)
+            with lock:
+                active[host] -= 1
+    
+    threads = [threading.Thread(target=probe, args=(host,)) for host in 'aaaaab']
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert peak == {'a': 2, 'b': 1}
+
+
+def test_slot_spaces_starts_on_the_same_host(sleeps):
+    politeness = HostPoliteness(min_delay=0.5, jitter=0)
+    for _ in range(3):
+        with politeness.slot('a'):
+            pass
+    with politeness.slot('b'):
+        pass
+    
+    # El segundo y tercer inicio en 'a' esperan su turno; 'b' parte de inmediato
+    assert len(sleeps) == 2
+    assert sleeps[0] == pytest.approx(0.5, abs=0.05)
+    assert sleeps[1] == pytest.approx(1.0, abs=0.05)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('120', 120.0),
+    (formatdate(1_000_090, usegmt=True), 90.0),
+    (formatdate(999_000, usegmt=True), 0.0),
+    ('pronto', None),
+    (None, None),
+])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value, now=1_000_000) == expected
+
+
+def test_retry_after_blocks_and_defers_the_host():
+    politeness = HostPoliteness(max_wait=5)
+    assert politeness.record_response('a', 200, {'Retry-After': '120'}) is None
+    assert politeness.record_response('a', 429, {}) is None
+    assert politeness.record_response('a', 429, {'Retry-After': '120'}) == 120
+    
+    assert politeness.blocked_for('a') == pytest.approx(120, abs=1)
+    assert politeness.blocked_for('b') == 0
+    with pytest.raises(HostRateLimited) as exc:
+        with politeness.slot('a'):
+            pass
+    assert exc.value.retry_in == pytest.approx(120, abs=1)
+    assert politeness.stats()['deferred'] == 1
+    assert set(politeness.stats()['blocked_hosts']) == {'a'}
+
+
+def test_retry_after_is_capped_and_short_waits_block(sleeps):
+    politeness = HostPoliteness(min_delay=0, jitter=0, max_wait=5, max_backoff=60)
+    assert politeness.record_response('a', 503, {'Retry-After': '86400'}) == 60
+    
+    politeness = HostPoliteness(min_delay=0, jitter=0, max_wait=5)
+    politeness.record_response('a', 429, {'Retry-After': '3'})
+    with politeness.slot('a'):
+        pass
+    assert sleeps and sleeps[0] == pytest.approx(3, abs=0.5)
+
+
+def test_spread_by_host_gives_each_probe_its_own_slot():
+    random.seed(7)
+    datasets = [_ds('a1', 'a'), _ds('a2', 'a'), _ds('a3', 'a'), _ds('b1', 'b')]
+    planned = spread_by_host(datasets, 60)
+    
+    offsets = [offset for offset, _ in planned]
+    assert offsets == sorted(offsets)
+    by_id = {ds['id']: offset for offset, ds in planned}
+    for i, ds_id in enumerate(['a1', 'a2', 'a3']):
+        assert 20 * i <= by_id[ds_id] < 20 * (i + 1)
+    assert 0 <= by_id['b1'] < 60
+
+
+def test_spread_without_window_interleaves_hosts():
+    datasets = [_ds('a1', 'a'), _ds('a2', 'a'), _ds('b1', 'b')]
+    planned = spread_by_host(datasets, 0)
+    
+    assert [offset for offset, _ in planned] == [0.0, 0.0, 0.0]
+    assert [ds['id'] for _, ds in planned] == ['a1', 'b1', 'a2']
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+    
+    def get(self, url, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def _response(status, headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    return resp
+
+
+@pytest.fixture
+def politeness(monkeypatch):
+    politeness = HostPoliteness(min_delay=0, jitter=0, max_wait=30)
+    monkeypatch.setattr(fetch, 'host_politeness', politeness)
+    return politeness
+
+
+def test_scraper_retries_429_honoring_retry_after(politeness, sleeps):
+    client = fetch.HttpClient(max_retries=3)
+    client.session = FakeSession([_response(429, {'Retry-After': '10'}), _response(200)])
+    
+    resp = client.get('https://datos.example.cl/x')
+    assert resp.status_code == 200
+    assert client.session.calls == 2
+    # Backoff propio y luego la espera del Retry-After dentro de slot()
+    assert any(s == pytest.approx(10, abs=1) for s in sleeps)
+
+
+def test_scraper_gives_up_after_max_retries(politeness, sleeps):
+    client = fetch.HttpClient(max_retries=2)
+    client.session = FakeSession([_response(503), _response(429)])
+    
+    with pytest.raises(RuntimeError):
+        client.get('https://datos.example.cl/x')
+    assert client.session.calls == 2
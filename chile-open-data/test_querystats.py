@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Pruebas del guardián de planes de consultas (user-045)
+"""
+
+import sqlite3
+
+import pytest
+
+from models import QUERIES
+from querystats import QueryMonitor, QueryPlanError, table_scans
+
+
+def test_covering_index_scan_counts_as_table_scan(tmp_path):
+    conn = sqlite3.connect(tmp_path / "plans.db")
+    conn.execute("CREATE TABLE checks (id INTEGER PRIMARY KEY, key INTEGER, checked_at INTEGER)")
+    conn.execute("CREATE INDEX idx_checks_key_time ON checks (key, checked_at)")
+    
+    assert table_scans(conn, "SELECT key, MAX(checked_at) FROM checks GROUP BY key") == ['checks']
+    assert table_scans(conn, "SELECT checked_at FROM checks c WHERE key = ?", (1,)) == []
+    
+    monitor = QueryMonitor(guard=True)
+    monitor.register_hot('latest')
+    with pytest.raises(QueryPlanError):
+        monitor.run(conn, 'latest', "SELECT key, MAX(checked_at) FROM checks GROUP BY key")
+
+
+@pytest.mark.parametrize('partitions', [1, 3])
+def test_hot_queries_search_history_partitions(db, partitions):
+    with sqlite3.connect(db.db_path) as conn:
+        for day in range(partitions - 1):
+            db._ensure_partition(conn, 1700000000000 + day * 86400000)
+        conn.commit()
+    db.check_query_plans()
+    assert table_scans(db.reader(), QUERIES['recent_latencies'], (0, 100)) == []
+
+
+def test_sensitive_query_parameters_are_redacted(tmp_path):
+    conn = sqlite3.connect(tmp_path / "plans.db")
+    conn.execute("CREATE TABLE api_keys (key_hash TEXT PRIMARY KEY)")
+    
+    monitor = QueryMonitor(slow_ms=0)
+    monitor.register_sensitive('api_key_by_hash')
+    monitor.run(conn, 'api_key_by_hash', "SELECT * FROM api_keys WHERE key_hash = ?", ('secret-hash',))
+    monitor.run(conn, 'public', "SELECT * FROM api_keys WHERE key_hash = ?", ('visible',))
+    
+    slow = {entry['name']: entry['params'] for entry in monitor.stats()['slow_queries']}
+    assert slow == {'api_key_by_hash': ['<redacted>'], 'public': ['visible']}
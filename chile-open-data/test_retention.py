@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la retención por particiones con archivo previo (user-042)
+"""
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from models import DatasetStatus, to_epoch_ms
+
+
+class RecordingArchive:
+    """Archivo falso: registra si la base aceptaba escrituras durante la exportación"""
+    
+    def __init__(self, db_path, ok=True, on_export=None):
+        self.db_path = db_path
+        self.ok = ok
+        self.on_export = on_export
+        self.exported = []
+        self.writable_during_export = []
+    
+    def export_partition(self, db_path, partition):
+        with sqlite3.connect(self.db_path, timeout=0) as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.rollback()
+                self.writable_during_export.append(True)
+            except sqlite3.OperationalError:
+                self.writable_during_export.append(False)
+        if self.on_export:
+            self.on_export()
+        self.exported.append(partition)
+        return self.ok
+
+
+def save(db, checked_at, dataset_id='ds1'):
+    db.save_dataset_status(DatasetStatus(
+        id=dataset_id, name='Dataset', category='cat', url='http://example.cl',
+        status='up', http_code=200, latency_ms=10.0, error=None, checked_at=checked_at
+    ))
+
+
+def partitions(db):
+    with sqlite3.connect(db.db_path) as conn:
+        return [row[0] for row in conn.execute("SELECT name FROM history_partitions ORDER BY start_ms")]
+
+
+def old_and_new(db):
+    now = datetime.now(timezone.utc)
+    save(db, now - timedelta(days=10))
+    save(db, now)
+    return to_epoch_ms(now - timedelta(days=5))
+
+
+def test_export_runs_without_holding_the_write_lock(db):
+    cutoff = old_and_new(db)
+    old = partitions(db)[0]
+    db.archive = RecordingArchive(db.db_path)
+    
+    assert db.drop_partitions_before(cutoff) == [old]
+    assert db.archive.exported == [old]
+    assert db.archive.writable_during_export == [True]
+    assert old not in partitions(db)
+    assert len(db.get_dataset_history('ds1', hours=24)) == 1
+
+
+def test_failed_export_keeps_the_partition(db):
+    cutoff = old_and_new(db)
+    old = partitions(db)[0]
+    db.archive = RecordingArchive(db.db_path, ok=False)
+    
+    assert db.drop_partitions_before(cutoff) == []
+    assert old in partitions(db)
+
+
+def test_rows_written_during_export_keep_the_partition(db):
+    cutoff = old_and_new(db)
+    old = partitions(db)[0]
+    late = datetime.now(timezone.utc) - timedelta(days=10, minutes=5)
+    db.archive = RecordingArchive(db.db_path, on_export=lambda: save(db, late))
+    
+    assert db.drop_partitions_before(cutoff) == []
+    assert old in partitions(db)
+    # Sin escrituras nuevas, el siguiente intento la archiva y la elimina
+    db.archive.on_export = None
+    assert db.drop_partitions_before(cutoff) == [old]
+
+
+def test_incremental_vacuum_switch_happens_at_startup_only(tmp_path, monkeypatch):
+    from models import Database
+    
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "legacy.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE t (x)")
+    assert sqlite3.connect(path).execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    
+    db = Database(str(path))
+    assert sqlite3.connect(path).execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    
+    # El mantenimiento ya no reescribe el archivo completo
+    def no_full_vacuum():
+        raise AssertionError("VACUUM completo durante el mantenimiento")
+    monkeypatch.setattr(db, '_enable_incremental_vacuum', no_full_vacuum)
+    save(db, datetime.now(timezone.utc) - timedelta(days=10))
+    stats = db.cleanup_old_data(days=7)
+    assert len(stats['dropped_partitions']) == 1
+    assert 'full_vacuum' not in stats
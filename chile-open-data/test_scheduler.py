@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la exclusión entre ciclos del monitor (user-030)
+"""
+
+import threading
+
+from scheduler import DatasetMonitor, BackgroundScheduler
+
+
+def test_force_check_is_skipped_while_a_cycle_runs(db, monkeypatch):
+    monitor = DatasetMonitor(db)
+    started, release = threading.Event(), threading.Event()
+    cycles = []
+    
+    def slow_cycle(stop_event=None):
+        cycles.append(stop_event)
+        started.set()
+        release.wait(5)
+    
+    monkeypatch.setattr(monitor, '_run_cycle', slow_cycle)
+    loop = threading.Thread(target=monitor._check_datasets, args=(threading.Event(),))
+    loop.start()
+    assert started.wait(5)
+    
+    assert monitor.force_check() is False
+    release.set()
+    loop.join(5)
+    assert len(cycles) == 1
+    # Sin ciclo en curso la verificación forzada sí corre
+    assert monitor.force_check() is True
+    assert len(cycles) == 2
+
+
+def test_state_is_reloaded_inside_the_first_cycle_after_start(db, monkeypatch):
+    monitor = DatasetMonitor(db)
+    monkeypatch.setattr(monitor, '_run_cycle', lambda stop_event=None: None)
+    loads = []
+    original = monitor._load_state
+    monkeypatch.setattr(monitor, '_load_state', lambda: loads.append(1) or original())
+    monitor._state_stale = True
+    
+    monitor.force_check()
+    monitor.force_check()
+    assert loads == [1]
+
+
+def test_election_runs_a_single_initial_cycle(db, monkeypatch):
+    scheduler = BackgroundScheduler(db)
+    calls = []
+    monkeypatch.setattr(scheduler.monitor, 'start', lambda: calls.append('start'))
+    monkeypatch.setattr(scheduler.monitor, 'force_check', lambda: calls.append('force_check'))
+    
+    scheduler._become_leader()
+    assert calls == ['start']
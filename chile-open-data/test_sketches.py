@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los sketches de latencia (DDSketch) y sus percentiles (user-047)
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from sketches import LatencySketch, SKETCH_RELATIVE_ACCURACY
+from models import DatasetStatus
+from analytics import AnalyticsEngine
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def test_quantiles_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(5, 1) for _ in range(20000)]
+    sketch = LatencySketch()
+    sketch.update(values)
+    
+    assert sketch.count == len(values)
+    assert sketch.min == min(values) and sketch.max == max(values)
+    for q in QUANTILES:
+        exact = exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - exact) <= SKETCH_RELATIVE_ACCURACY * exact
+
+
+def test_merge_equals_single_sketch_and_survives_json():
+    rng = random.Random(11)
+    parts = [[rng.uniform(10, 2000) for _ in range(1000)] for _ in range(5)]
+    whole = LatencySketch()
+    merged = LatencySketch()
+    for part in parts:
+        whole.update(part)
+        sketch = LatencySketch()
+        sketch.update(part)
+        merged.merge(LatencySketch.from_json(sketch.to_json()))
+    
+    assert merged.bins == whole.bins
+    assert merged.count == whole.count
+    assert merged.sum == pytest.approx(whole.sum)
+    assert merged.summary() == whole.summary()
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        LatencySketch(0.01).merge(LatencySketch(0.02))
+
+
+def test_zero_and_empty_values():
+    sketch = LatencySketch()
+    assert sketch.quantile(0.5) is None
+    sketch.update([0.0, 0.0, 0.0, 50.0])
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(50.0, rel=SKETCH_RELATIVE_ACCURACY)
+
+
+def test_percentiles_endpoint_matches_exact_values(db):
+    rng = random.Random(3)
+    now = datetime.now(timezone.utc)
+    latencies = {'ds1': [], 'ds2': []}
+    for i in range(300):
+        for dataset_id, scale in (('ds1', 100), ('ds2', 400)):
+            latency = rng.uniform(0.5, 1.5) * scale
+            latencies[dataset_id].append(latency)
+            db.save_dataset_status(DatasetStatus(
+                id=dataset_id, name=dataset_id, category='cat1', url='http://example.cl',
+                status='up', http_code=200, latency_ms=latency, error=None,
+                checked_at=now - timedelta(minutes=i)
+            ))
+    # Los chequeos fallidos no aportan latencias
+    db.save_dataset_status(DatasetStatus(
+        id='ds1', name='ds1', category='cat1', url='http://example.cl',
+        status='down', http_code=500, latency_ms=99999.0, error=None, checked_at=now
+    ))
+    
+    engine = AnalyticsEngine(db)
+    by_dataset = {g['group']: g for g in engine.generate_latency_percentiles(24, 'dataset')['groups']}
+    system = engine.generate_latency_percentiles(24, 'system')['groups'][0]
+    for group, values in (*latencies.items(), (system['group'], latencies['ds1'] + latencies['ds2'])):
+        result = system if group == system['group'] else by_dataset[group]
+        assert result['samples'] == len(values)
+        for q in QUANTILES:
+            exact = exact_quantile(values, q)
+            assert result[f'p{int(q * 100)}'] == pytest.approx(exact, rel=SKETCH_RELATIVE_ACCURACY + 1e-3)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los intervalos de estado y del reporte SLA (user-048)
+"""
+
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import Database, DatasetStatus
+from analytics import AnalyticsEngine
+
+CHECK_EVERY = timedelta(minutes=30)
+# 144 chequeos (72 h) con una caída de 9 h: chequeos 50 a 67
+OUTAGE = range(50, 68)
+
+
+def check_times():
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    return [now - (144 - i) * CHECK_EVERY for i in range(144)]
+
+
+def status_at(i):
+    return 'down' if i in OUTAGE else 'up'
+
+
+def assert_known_sla(report):
+    observed_h = 143 * 0.5
+    assert report['uptime_percentage'] == pytest.approx((observed_h - 9) / observed_h * 100, abs=1e-3)
+    assert report['outages'] == 1
+    assert report['ongoing_outages'] == 0
+    assert report['mttr_minutes'] == 540
+    assert report['longest_outage_minutes'] == 540
+    assert report['datasets'][0]['current_status'] == 'up'
+
+
+def test_sla_from_saved_checks(db):
+    for i, checked_at in enumerate(check_times()):
+        db.save_dataset_status(DatasetStatus(
+            id='ds1', name='Dataset 1', category='cat1', url='http://example.cl',
+            status=status_at(i), http_code=200 if status_at(i) == 'up' else 500,
+            latency_ms=100.0, error=None, checked_at=checked_at
+        ))
+    
+    intervals = db.get_status_intervals(0)
+    assert [(i['status'], i['checks']) for i in intervals] == [('up', 50), ('down', 18), ('up', 76)]
+    assert_known_sla(AnalyticsEngine(db).generate_sla_report(hours=96))
+    
+    # Reconstruir desde el historial da los mismos intervalos que el registro incremental
+    with sqlite3.connect(db.db_path) as conn:
+        db._rebuild_status_intervals(conn)
+    assert db.get_status_intervals(0) == intervals
+
+
+def test_sla_after_upgrading_baseline_db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "chile_data.db"
+    # Esquema original: dataset_status con estados y fechas en texto
+    with sqlite3.connect(path) as conn:
+        conn.execute("""
+            CREATE TABLE dataset_status (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dataset_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                category TEXT NOT NULL,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                http_code INTEGER,
+                latency_ms REAL,
+                error TEXT,
+                checked_at TIMESTAMP NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE datasets (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                category TEXT NOT NULL,
+                url TEXT NOT NULL,
+                description TEXT,
+                method TEXT DEFAULT 'HEAD',
+                timeout INTEGER DEFAULT 10,
+                active BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.executemany("""
+            INSERT INTO dataset_status (dataset_id, name, category, url, status, http_code, latency_ms, error, checked_at)
+            VALUES ('ds1', 'Dataset 1', 'cat1', 'http://example.cl', ?, 200, 100.0, NULL, ?)
+        """, [(status_at(i), checked_at.isoformat(sep=' ')) for i, checked_at in enumerate(check_times())])
+    
+    db = Database(str(path))
+    # Antes de migrar, los intervalos ya incluyen el historial legacy
+    assert_known_sla(AnalyticsEngine(db).generate_sla_report(hours=96))
+    
+    for thread in threading.enumerate():
+        if thread.name == "history-migration":
+            thread.join(timeout=30)
+    assert not db._has_pending_migration()
+    assert_known_sla(AnalyticsEngine(db).generate_sla_report(hours=96))
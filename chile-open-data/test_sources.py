@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Pruebas del catálogo de fuentes: cache por mtime/hash, diff y shards (user-038)
+"""
+
+import os
+
+import pytest
+
+from services import sources
+from services.sources import CatalogShard, SourceCatalog, SourceConfigError, get_catalog
+
+
+def _dataset(ds_id, url=None):
+    return (f"  - id: {ds_id}\n"
+            f"    name: Dataset {ds_id}\n"
+            f"    url: {url or f'https://datos.example.cl/{ds_id}.csv'}\n")
+
+
+def _write(path, body, category="salud", mtime=None):
+    datasets = f"datasets:\n{body}" if body else "datasets: []\n"
+    path.write_text(f"category: {category}\n{datasets}", encoding="utf-8")
+    # mtime explícito: dos escrituras seguidas pueden caer en el mismo tick del reloj
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Cuenta los parseos reales de YAML (sin snapshot)"""
+    calls = []
+    original = CatalogShard._parse
+    
+    def counting(self, raw):
+        calls.append(self.name)
+        return original(self, raw)
+    
+    monkeypatch.setattr(CatalogShard, '_parse', counting)
+    monkeypatch.setattr(sources, 'cached_parse',
+                        lambda path, raw, namespace, parse, digest=None, kind=None: parse(raw))
+    return calls
+
+
+def test_unchanged_file_is_not_reparsed(tmp_path, parses):
+    path = tmp_path / "sources.yaml"
+    _write(path, _dataset("a") + _dataset("b"), mtime=1_000)
+    catalog = SourceCatalog(path)
+    
+    datasets = catalog.load()
+    assert [ds['id'] for ds in datasets] == ['a', 'b']
+    assert datasets[0]['category'] == 'salud'
+    assert (datasets[0]['method'], datasets[0]['timeout']) == ('HEAD', 6)
+    assert catalog.revision == 1
+    assert catalog.last_diff.summary() == {'added': 2, 'removed': 0, 'changed': 0}
+    
+    catalog.load()
+    # Mismo contenido con otro mtime: se relee pero el hash no cambia
+    os.utime(path, ns=(2_000, 2_000))
+    catalog.load()
+    assert parses == ['sources.yaml']
+    assert catalog.revision == 1
+
+
+def test_edited_file_is_reloaded_with_diff(tmp_path, parses):
+    path = tmp_path / "sources.yaml"
+    _write(path, _dataset("a") + _dataset("b") + _dataset("c"), mtime=1_000)
+    catalog = SourceCatalog(path)
+    catalog.load()
+    
+    _write(path, _dataset("a") + _dataset("b", "https://otro.example.cl/b.csv") + _dataset("d"),
+           mtime=2_000)
+    datasets = catalog.load()
+    
+    assert [ds['id'] for ds in datasets] == ['a', 'b', 'd']
+    assert catalog.revision == 2
+    diff = catalog.last_diff
+    assert [ds['id'] for ds in diff.added] == ['d']
+    assert diff.removed == ['c']
+    assert [ds['url'] for ds in diff.changed] == ['https://otro.example.cl/b.csv']
+
+
+def test_only_changed_shards_are_reparsed(tmp_path, parses):
+    _write(tmp_path / "salud.yaml", _dataset("a"), category="salud", mtime=1_000)
+    _write(tmp_path / "educacion.yml", _dataset("b"), category="educacion", mtime=1_000)
+    (tmp_path / "notas.txt").write_text("no es un shard")
+    catalog = SourceCatalog(tmp_path)
+    
+    datasets = catalog.load()
+    assert {ds['id']: ds['category'] for ds in datasets} == {'b': 'educacion', 'a': 'salud'}
+    assert sorted(parses) == ['educacion.yml', 'salud.yaml']
+    
+    _write(tmp_path / "salud.yaml", _dataset("a") + _dataset("c"), category="salud", mtime=2_000)
+    catalog.load()
+    assert parses[2:] == ['salud.yaml']
+    assert [ds['id'] for ds in catalog.last_diff.added] == ['c']
+    assert catalog.load_shard("salud.yaml")[-1]['id'] == 'c'
+
+
+def test_dataset_moved_between_shards_is_a_change_not_an_add(tmp_path, parses):
+    _write(tmp_path / "salud.yaml", _dataset("a") + _dataset("b"), category="salud", mtime=1_000)
+    _write(tmp_path / "educacion.yaml", "", category="educacion", mtime=1_000)
+    catalog = SourceCatalog(tmp_path)
+    catalog.load()
+    
+    _write(tmp_path / "salud.yaml", _dataset("a"), category="salud", mtime=2_000)
+    _write(tmp_path / "educacion.yaml", _dataset("b"), category="educacion", mtime=2_000)
+    catalog.load()
+    
+    diff = catalog.last_diff
+    assert (diff.added, diff.removed) == ([], [])
+    assert [(ds['id'], ds['category']) for ds in diff.changed] == [('b', 'educacion')]
+
+
+def test_removed_shard_drops_its_datasets(tmp_path, parses):
+    _write(tmp_path / "salud.yaml", _dataset("a"), mtime=1_000)
+    _write(tmp_path / "educacion.yaml", _dataset("b"), mtime=1_000)
+    catalog = SourceCatalog(tmp_path)
+    catalog.load()
+    
+    (tmp_path / "educacion.yaml").unlink()
+    assert [ds['id'] for ds in catalog.load()] == ['a']
+    assert catalog.last_diff.removed == ['b']
+    assert [s['name'] for s in catalog.info()['shards']] == ['salud.yaml']
+
+
+def test_duplicated_ids_across_shards_are_rejected(tmp_path, parses):
+    _write(tmp_path / "salud.yaml", _dataset("a"))
+    _write(tmp_path / "educacion.yaml", _dataset("a"))
+    with pytest.raises(SourceConfigError, match="duplicados"):
+        SourceCatalog(tmp_path).load()
+
+
+def test_invalid_edit_keeps_the_previous_catalog_revision(tmp_path, parses):
+    path = tmp_path / "sources.yaml"
+    _write(path, _dataset("a"), mtime=1_000)
+    catalog = SourceCatalog(path)
+    catalog.load()
+    
+    path.write_text("datasets:\n  - id: a\n", encoding="utf-8")
+    with pytest.raises(SourceConfigError):
+        catalog.load()
+    assert catalog.revision == 1
+
+
+def test_get_catalog_is_shared_per_path(tmp_path):
+    path = tmp_path / "sources.yaml"
+    _write(path, _dataset("a"))
+    
+    assert get_catalog(path) is get_catalog(tmp_path / "." / "sources.yaml")
+    assert get_catalog(path) is not get_catalog(tmp_path / "otro.yaml")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Pruebas del timeline incremental desde minute_rollups (user-049)
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from models import DatasetStatus, QUERIES
+from analytics import AnalyticsEngine
+from querystats import table_scans
+
+
+def save(db, dataset_id, category, status, checked_at, latency_ms=100.0):
+    db.save_dataset_status(DatasetStatus(
+        id=dataset_id, name=dataset_id, category=category, url='http://example.cl',
+        status=status, http_code=200 if status == 'up' else 500,
+        latency_ms=latency_ms if status == 'up' else None, error=None, checked_at=checked_at
+    ))
+
+
+def test_cached_timeline_matches_fresh_engine(db):
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    for i in range(120):
+        save(db, f'ds{i % 3}', 'cat1' if i % 3 else 'cat2', 'down' if i % 7 == 0 else 'up',
+             now - timedelta(minutes=2 * i), latency_ms=50.0 + i)
+    
+    engine = AnalyticsEngine(db)
+    assert engine.generate_timeline_series(24, 15) == AnalyticsEngine(db).generate_timeline_series(24, 15)
+    
+    # Chequeos nuevos y uno tardío para un minuto ya leído
+    save(db, 'ds1', 'cat1', 'up', now + timedelta(minutes=1))
+    save(db, 'ds2', 'cat1', 'down', now - timedelta(minutes=30))
+    cached = engine.generate_timeline_series(24, 15, fill='null')
+    assert cached == AnalyticsEngine(db).generate_timeline_series(24, 15, fill='null')
+
+
+def test_late_result_for_cached_minute(db):
+    minute = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(minutes=5)
+    timestamp = minute.strftime('%Y-%m-%d %H:%M:%S')
+    engine = AnalyticsEngine(db)
+    save(db, 'ds1', 'cat1', 'up', minute + timedelta(seconds=40))
+    save(db, 'ds3', 'cat1', 'up', minute + timedelta(minutes=1, seconds=5))
+    points = {p['timestamp']: p for p in engine.generate_timeline_data(1, 1)}
+    assert points[timestamp]['total_checks'] == 1
+    
+    # Resultado del mismo ciclo que se guarda después de leer un minuto posterior
+    save(db, 'ds2', 'cat1', 'down', minute + timedelta(seconds=10))
+    points = {p['timestamp']: p for p in engine.generate_timeline_data(1, 1)}
+    assert points[timestamp]['total_checks'] == 2
+    assert points[timestamp]['uptime_percentage'] == 50.0
+    assert engine.generate_timeline_data(1, 1) == AnalyticsEngine(db).generate_timeline_data(1, 1)
+
+
+def test_rollup_delta_query_uses_indexes(db):
+    with db.reader() as conn:
+        assert table_scans(conn, QUERIES['minute_rollups_after'], (0, 0, 0)) == []
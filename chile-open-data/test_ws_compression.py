@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la compresión del transporte websocket (user-027)
+"""
+
+import pytest
+
+pytest.importorskip("eventlet")
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from websockets import configure_websocket_compression
+
+OFFER = {'permessage-deflate': [{'server_max_window_bits': True, 'client_max_window_bits': True}]}
+
+
+def make_socketio(**kwargs):
+    return SocketIO(Flask(__name__), async_mode='eventlet', http_compression=True,
+                    compression_threshold=2048, **kwargs)
+
+
+def negotiate(socketio, extensions=OFFER):
+    eio = socketio.server.eio
+    ws = eio._async['websocket'](lambda ws: None, eio)
+    return ws._negotiate_permessage_deflate(extensions)
+
+
+def test_deflate_negotiated_with_configured_window():
+    socketio = make_socketio()
+    options = configure_websocket_compression(socketio, enabled=True, max_window_bits=10,
+                                              no_context_takeover=True)
+    
+    assert options == {
+        'async_mode': 'eventlet',
+        'http_compression': True,
+        'compression_threshold': 2048,
+        'permessage_deflate': True,
+        'deflate_max_window_bits': 10,
+        'deflate_no_context_takeover': True
+    }
+    config = negotiate(socketio)
+    assert config['server_max_window_bits'] == 10
+    assert config['server_no_context_takeover'] is True
+    # Sin oferta del cliente no hay extensión
+    assert negotiate(socketio, {}) is None
+
+
+def test_deflate_disabled_rejects_client_offer():
+    socketio = make_socketio()
+    options = configure_websocket_compression(socketio, enabled=False)
+    
+    assert options['permessage_deflate'] is False
+    assert negotiate(socketio) is None
+
+
+def test_configuration_is_per_server():
+    configured = make_socketio()
+    configure_websocket_compression(configured, enabled=False)
+    other = make_socketio()
+    
+    assert negotiate(configured) is None
+    assert negotiate(other) is not None
+
+
+def test_other_async_modes_report_no_deflate():
+    socketio = SocketIO(Flask(__name__), async_mode='threading')
+    
+    assert configure_websocket_compression(socketio)['permessage_deflate'] is False
@@ -3,15 +3,28 @@ Módulo de Analytics para la Biblioteca de Datos Abiertos de Chile
 Proporciona métricas avanzadas, reportes y análisis de tendencias
 """
 
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
-import sqlite3
-import json
+import math
 import statistics
-from collections import defaultdict, Counter
+import threading
+from collections import defaultdict
 
-from models import Database
+from models import Database, since_epoch_ms, UP, DOWN, MINUTE_MS
+
+try:
+    import numpy as np
+except ImportError:  # Sin numpy las métricas por dataset se calculan en Python (mismo resultado, más lento)
+    np = None
+
+DAY_MS = 86400 * 1000
+# Variación de uptime (fracción) entre el inicio y el fin de la ventana para marcar una tendencia
+TREND_THRESHOLD = 0.1
+# Timelines (ventana, intervalo) que se mantienen en memoria y se actualizan por delta
+TIMELINE_CACHE_SIZE = 32
+# Relleno de buckets sin chequeos: omitirlos, valores nulos o repetir el anterior
+TIMELINE_FILLS = ('none', 'null', 'previous')
 
 @dataclass
 class AnalyticsMetrics:
@@ -29,6 +42,9 @@ class AnalyticsMetrics:
     categories_count: int
     most_problematic_category: str
     reliability_score: float  # 0-100
+    p50_latency: Optional[float] = None
+    p95_latency: Optional[float] = None
+    p99_latency: Optional[float] = None
     
     def to_dict(self) -> Dict[str, Any]:
         result = asdict(self)
@@ -49,6 +65,11 @@ class DatasetAnalytics:
     last_failure: Optional[datetime]
     failure_frequency: float  # failures per day
     reliability_trend: str  # 'improving', 'declining', 'stable'
+    p50_latency: Optional[float] = None
+    p95_latency: Optional[float] = None
+    p99_latency: Optional[float] = None
+    mttr_minutes: Optional[float] = None  # tiempo medio hasta recuperarse de una caída
+    mtbf_minutes: Optional[float] = None  # tiempo medio operativo entre caídas
     
     def to_dict(self) -> Dict[str, Any]:
         result = asdict(self)
@@ -56,91 +77,248 @@ class DatasetAnalytics:
             result['last_failure'] = self.last_failure.isoformat()
         return result
 
+def _window_metrics(data: 'np.ndarray') -> Dict[str, 'np.ndarray']:
+    """Métricas por dataset de una ventana de chequeos
+
+    `data` tiene una fila (dataset_key, checked_at, status, latency_ms) por
+    chequeo. Las filas se ordenan por (dataset, tiempo) y cada agregado es un
+    bincount o una búsqueda sobre el índice de grupo, sin recorrer filas en Python.
+    """
+    data = data[np.lexsort((data[:, 1], data[:, 0]))]
+    ts = data[:, 1].astype(np.int64)
+    latency = data[:, 3]
+    up = data[:, 2] == UP
+    down = data[:, 2] == DOWN
+    
+    keys, starts, counts = np.unique(data[:, 0].astype(np.int64), return_index=True, return_counts=True)
+    n = len(keys)
+    ends = starts + counts
+    group = np.repeat(np.arange(n), counts)
+    span_ms = ts[ends - 1] - ts[starts]
+    successful = np.bincount(group, weights=up, minlength=n).astype(np.int64)
+    
+    # Latencia promedio y percentiles (interpolación lineal, como np.percentile) por dataset
+    measured = ~np.isnan(latency)
+    latency_group = group[measured]
+    latency_values = latency[measured]
+    latency_counts = np.bincount(latency_group, minlength=n)
+    latency_sums = np.bincount(latency_group, weights=latency_values, minlength=n)
+    avg_latency = np.divide(latency_sums, latency_counts, out=np.zeros(n), where=latency_counts > 0)
+    ordered = latency_values[np.lexsort((latency_values, latency_group))]
+    first = np.concatenate(([0], np.cumsum(latency_counts)[:-1]))
+    has_latency = latency_counts > 0
+    percentiles = {}
+    for q in (50, 95, 99):
+        position = first + q / 100 * np.maximum(latency_counts - 1, 0)
+        low = np.floor(position).astype(np.int64)[has_latency]
+        high = np.ceil(position).astype(np.int64)[has_latency]
+        values = np.full(n, np.nan)
+        values[has_latency] = ordered[low] + (ordered[high] - ordered[low]) * (position[has_latency] - low)
+        percentiles[q] = values
+    
+    last_failure = np.full(n, -1, dtype=np.int64)
+    np.maximum.at(last_failure, group[down], ts[down])
+    
+    # Tendencia: pendiente de mínimos cuadrados de (chequeo exitoso) contra tiempo,
+    # proyectada sobre la duración de la ventana de cada dataset
+    x = (ts - ts[starts][group]) / DAY_MS
+    y = up.astype(np.float64)
+    sx = np.bincount(group, weights=x, minlength=n)
+    sy = np.bincount(group, weights=y, minlength=n)
+    sxx = np.bincount(group, weights=x * x, minlength=n)
+    sxy = np.bincount(group, weights=x * y, minlength=n)
+    denominator = counts * sxx - sx * sx
+    slope = np.divide(counts * sxy - sx * sy, denominator, out=np.zeros(n), where=denominator > 0)
+    change = slope * span_ms / DAY_MS
+    trend = np.where(change > TREND_THRESHOLD, 'improving',
+                     np.where(change < -TREND_THRESHOLD, 'declining', 'stable'))
+    trend[counts < 6] = 'stable'
+    
+    # Caídas: una corre desde el primer chequeo 'down' hasta el siguiente chequeo que no lo es
+    previous_down = np.zeros_like(down)
+    previous_down[1:] = down[:-1]
+    previous_down[starts] = False
+    incident_idx = np.flatnonzero(down & ~previous_down)
+    recovery_idx = np.flatnonzero(~down & previous_down)
+    opened_idx = incident_idx[np.searchsorted(incident_idx, recovery_idx) - 1]
+    repair_ms = ts[recovery_idx] - ts[opened_idx]
+    recoveries = np.bincount(group[recovery_idx], minlength=n)
+    downtime_ms = np.bincount(group[recovery_idx], weights=repair_ms, minlength=n)
+    mttr = np.divide(downtime_ms, recoveries, out=np.full(n, np.nan), where=recoveries > 0) / 60000
+    # Una caída abierta al final de la ventana cuenta como tiempo caído hasta el último chequeo
+    still_down = down[ends - 1]
+    open_idx = incident_idx[np.searchsorted(incident_idx, ends[still_down] - 1, side='right') - 1]
+    downtime_ms[still_down] += ts[ends[still_down] - 1] - ts[open_idx]
+    incidents = np.bincount(group[incident_idx], minlength=n)
+    mtbf = np.divide(span_ms - downtime_ms, incidents, out=np.full(n, np.nan), where=incidents > 0) / 60000
+    
+    return {
+        'dataset_key': keys,
+        'total_checks': counts,
+        'successful_checks': successful,
+        'avg_latency': avg_latency,
+        'p50': percentiles[50],
+        'p95': percentiles[95],
+        'p99': percentiles[99],
+        'last_failure': last_failure,
+        'trend': trend,
+        'mttr': mttr,
+        'mtbf': mtbf
+    }
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    """Percentil con interpolación lineal (como np.percentile) de valores ordenados"""
+    position = q / 100 * (len(ordered) - 1)
+    low, high = math.floor(position), math.ceil(position)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def _window_metrics_python(rows: List[tuple]) -> Dict[str, list]:
+    """Las mismas métricas que `_window_metrics`, recorriendo los chequeos en Python
+
+    Se usa cuando numpy no está instalado; devuelve listas con las mismas
+    claves, en el mismo orden de datasets y con NaN donde numpy deja NaN.
+    """
+    by_key: Dict[int, List[tuple]] = defaultdict(list)
+    for key, checked_at, status, latency in rows:
+        by_key[int(key)].append((int(checked_at), status, latency))
+    
+    metrics: Dict[str, list] = defaultdict(list)
+    for key in sorted(by_key):
+        checks = sorted(by_key[key], key=lambda check: check[0])
+        count = len(checks)
+        first_ts = checks[0][0]
+        span_ms = checks[-1][0] - first_ts
+        latencies = sorted(lat for _, _, lat in checks if lat is not None and lat == lat)
+        
+        # Tendencia: pendiente de mínimos cuadrados de (chequeo exitoso) contra tiempo
+        sx = sy = sxx = sxy = 0.0
+        for ts, status, _ in checks:
+            x = (ts - first_ts) / DAY_MS
+            y = 1.0 if status == UP else 0.0
+            sx += x
+            sy += y
+            sxx += x * x
+            sxy += x * y
+        denominator = count * sxx - sx * sx
+        slope = (count * sxy - sx * sy) / denominator if denominator > 0 else 0.0
+        change = slope * span_ms / DAY_MS
+        if count < 6 or -TREND_THRESHOLD <= change <= TREND_THRESHOLD:
+            trend = 'stable'
+        else:
+            trend = 'improving' if change > 0 else 'declining'
+        
+        # Caídas: desde el primer chequeo 'down' hasta el siguiente que no lo es
+        last_failure = -1
+        incidents = recoveries = 0
+        downtime_ms = 0
+        opened = None
+        for ts, status, _ in checks:
+            if status == DOWN:
+                last_failure = ts
+                if opened is None:
+                    opened = ts
+                    incidents += 1
+            elif opened is not None:
+                recoveries += 1
+                downtime_ms += ts - opened
+                opened = None
+        mttr = downtime_ms / recoveries / 60000 if recoveries else math.nan
+        if opened is not None:
+            # Caída abierta al final de la ventana: tiempo caído hasta el último chequeo
+            downtime_ms += checks[-1][0] - opened
+        mtbf = (span_ms - downtime_ms) / incidents / 60000 if incidents else math.nan
+        
+        metrics['dataset_key'].append(key)
+        metrics['total_checks'].append(count)
+        metrics['successful_checks'].append(sum(1 for _, status, _ in checks if status == UP))
+        metrics['avg_latency'].append(sum(latencies) / len(latencies) if latencies else 0.0)
+        for q in (50, 95, 99):
+            metrics[f'p{q}'].append(_percentile(latencies, q) if latencies else math.nan)
+        metrics['last_failure'].append(last_failure)
+        metrics['trend'].append(trend)
+        metrics['mttr'].append(mttr)
+        metrics['mtbf'].append(mtbf)
+    return dict(metrics)
+
+
+def _optional_round(value: Optional[float]) -> Optional[float]:
+    """Redondea a 2 decimales; None si no hay valor (None de SQL o NaN de numpy)"""
+    if value is None or value != value:
+        return None
+    return round(float(value), 2)
+
+
 class AnalyticsEngine:
     """Motor de analytics para generar métricas y reportes"""
     
     def __init__(self, db: Database):
         self.db = db
+        # (horas, minutos por intervalo) -> agregados por (bucket, categoría) e id del último chequeo leído
+        self._timelines: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self._timelines_lock = threading.Lock()
         
     def generate_system_metrics(self, hours: int = 24) -> AnalyticsMetrics:
         """Genera métricas del sistema para las últimas X horas"""
         try:
-            with sqlite3.connect(self.db.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                
-                # Obtener datos de las últimas X horas
-                since_time = datetime.now(timezone.utc) - timedelta(hours=hours)
-                
-                # Métricas básicas
-                cursor = conn.execute("""
-                    SELECT 
-                        COUNT(DISTINCT dataset_id) as total_datasets,
-                        COUNT(*) as total_checks,
-                        SUM(CASE WHEN status = 'up' THEN 1 ELSE 0 END) as successful_checks,
-                        SUM(CASE WHEN status = 'down' THEN 1 ELSE 0 END) as failed_checks,
-                        AVG(CASE WHEN latency_ms IS NOT NULL THEN latency_ms ELSE 0 END) as avg_latency,
-                        MAX(CASE WHEN latency_ms IS NOT NULL THEN latency_ms ELSE 0 END) as max_latency,
-                        MIN(CASE WHEN latency_ms IS NOT NULL THEN latency_ms ELSE 0 END) as min_latency
-                    FROM dataset_status 
-                    WHERE checked_at >= ?
-                """, (since_time.isoformat(),))
-                
-                basic_metrics = cursor.fetchone()
-                
-                # Estados actuales por dataset
-                cursor = conn.execute("""
-                    SELECT 
-                        dataset_id,
-                        status,
-                        category,
-                        ROW_NUMBER() OVER (PARTITION BY dataset_id ORDER BY checked_at DESC) as rn
-                    FROM dataset_status
-                    WHERE checked_at >= ?
-                """, (since_time.isoformat(),))
-                
-                current_statuses = [row for row in cursor.fetchall() if row['rn'] == 1]
-                
-                # Contar estados actuales
-                available = sum(1 for row in current_statuses if row['status'] == 'up')
-                unavailable = sum(1 for row in current_statuses if row['status'] == 'down')
-                
-                # Contar categorías
-                categories = set(row['category'] for row in current_statuses if row['category'])
-                
-                # Categoría más problemática
-                category_problems = defaultdict(int)
-                for row in current_statuses:
-                    if row['status'] == 'down' and row['category']:
-                        category_problems[row['category']] += 1
-                
-                most_problematic = max(category_problems.items(), key=lambda x: x[1])[0] if category_problems else "Ninguna"
-                
-                # Calcular uptime y reliability
-                total_checks = max(basic_metrics['total_checks'] or 0, 1)  # Evitar división por cero
-                successful_checks = basic_metrics['successful_checks'] or 0
-                uptime_percentage = (successful_checks / total_checks) * 100
-                
-                # Reliability score (combina uptime y latencia) - Protegido contra división por cero
-                avg_latency = basic_metrics['avg_latency'] or 0
-                latency_penalty = min(avg_latency / 1000, 20) if avg_latency > 0 else 0  # Max 20 points penalty
-                reliability_score = max(0, uptime_percentage - latency_penalty)
-                
-                return AnalyticsMetrics(
-                    timestamp=datetime.now(timezone.utc),
-                    total_datasets=basic_metrics['total_datasets'] or 0,
-                    available_datasets=available,
-                    unavailable_datasets=unavailable,
-                    error_datasets=unavailable,  # For now, same as unavailable
-                    avg_latency=basic_metrics['avg_latency'] or 0,
-                    max_latency=basic_metrics['max_latency'] or 0,
-                    min_latency=basic_metrics['min_latency'] or 0,
-                    uptime_percentage=uptime_percentage,
-                    checks_performed=total_checks,
-                    categories_count=len(categories),
-                    most_problematic_category=most_problematic,
-                    reliability_score=reliability_score
-                )
-                
+            # Obtener datos de las últimas X horas (epoch ms, índice de checked_at)
+            since = since_epoch_ms(hours=hours)
+            
+            # Métricas básicas
+            basic_metrics = self.db.query('system_totals', (since,))[0]
+            
+            # Estado más reciente de cada dataset dentro de la ventana
+            current_statuses = self.db.query('window_latest_status', (since,))
+            
+            # Contar estados actuales
+            available = sum(1 for row in current_statuses if row['status'] == 'up')
+            unavailable = sum(1 for row in current_statuses if row['status'] == 'down')
+            
+            # Contar categorías
+            categories = set(row['category'] for row in current_statuses if row['category'])
+            
+            # Categoría más problemática
+            category_problems = defaultdict(int)
+            for row in current_statuses:
+                if row['status'] == 'down' and row['category']:
+                    category_problems[row['category']] += 1
+            
+            most_problematic = max(category_problems.items(), key=lambda x: x[1])[0] if category_problems else "Ninguna"
+            
+            # Calcular uptime y reliability
+            total_checks = max(basic_metrics['total_checks'] or 0, 1)  # Evitar división por cero
+            successful_checks = basic_metrics['successful_checks'] or 0
+            uptime_percentage = (successful_checks / total_checks) * 100
+            
+            # Reliability score (combina uptime y latencia) - Protegido contra división por cero
+            avg_latency = basic_metrics['avg_latency'] or 0
+            latency_penalty = min(avg_latency / 1000, 20) if avg_latency > 0 else 0  # Max 20 points penalty
+            reliability_score = max(0, uptime_percentage - latency_penalty)
+            
+            # Percentiles desde los sketches horarios (sin ordenar chequeos)
+            latency = self.db.get_latency_sketches(since).get('system')
+            percentiles = latency.summary() if latency else {}
+            
+            return AnalyticsMetrics(
+                timestamp=datetime.now(timezone.utc),
+                total_datasets=basic_metrics['total_datasets'] or 0,
+                available_datasets=available,
+                unavailable_datasets=unavailable,
+                error_datasets=unavailable,  # For now, same as unavailable
+                avg_latency=basic_metrics['avg_latency'] or 0,
+                max_latency=basic_metrics['max_latency'] or 0,
+                min_latency=basic_metrics['min_latency'] or 0,
+                uptime_percentage=uptime_percentage,
+                checks_performed=total_checks,
+                categories_count=len(categories),
+                most_problematic_category=most_problematic,
+                reliability_score=reliability_score,
+                p50_latency=percentiles.get('p50'),
+                p95_latency=percentiles.get('p95'),
+                p99_latency=percentiles.get('p99')
+            )
+            
         except Exception as e:
             # Return default metrics in case of error
             return AnalyticsMetrics(
@@ -153,237 +331,418 @@ class AnalyticsEngine:
     
     def generate_dataset_analytics(self, dataset_id: str, days: int = 7) -> Optional[DatasetAnalytics]:
         """Genera analytics para un dataset específico"""
+        return self.generate_datasets_analytics([dataset_id], days).get(dataset_id)
+    
+    def generate_datasets_analytics(self, dataset_ids: Optional[List[str]] = None,
+                                    days: int = 7) -> Dict[str, DatasetAnalytics]:
+        """Analytics de varios datasets (None = todos los que tienen chequeos en la ventana)
+        
+        Con numpy la ventana se lee en una sola consulta y se carga como arrays
+        (timestamps, estados, latencias); uptime, percentiles, frecuencia de fallos,
+        tendencia y MTTR/MTBF se calculan vectorizados para todos los datasets.
+        Sin numpy, `_window_metrics_python` calcula las mismas métricas fila a fila.
+        """
         try:
-            with sqlite3.connect(self.db.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                
-                since_time = datetime.now(timezone.utc) - timedelta(days=days)
-                
-                # Obtener datos del dataset
-                cursor = conn.execute("""
-                    SELECT * FROM dataset_status 
-                    WHERE dataset_id = ? AND checked_at >= ?
-                    ORDER BY checked_at DESC
-                """, (dataset_id, since_time.isoformat()))
-                
-                records = cursor.fetchall()
-                if not records:
-                    return None
-                
-                # Calcular métricas
-                total_checks = len(records)
-                successful_checks = sum(1 for r in records if r['status'] == 'up')
+            rows = self.db.get_history_window(since_epoch_ms(days=days), dataset_ids)
+            if not rows:
+                return {}
+            if np is not None:
+                metrics = _window_metrics(np.array(rows, dtype=np.float64))
+            else:
+                metrics = _window_metrics_python(rows)
+            names = self.db.get_dataset_names()
+            
+            results = {}
+            for i, key in enumerate(int(key) for key in metrics['dataset_key']):
+                info = names.get(key)
+                if info is None:
+                    continue
+                total_checks = int(metrics['total_checks'][i])
+                successful_checks = int(metrics['successful_checks'][i])
                 failed_checks = total_checks - successful_checks
-                uptime_percentage = (successful_checks / total_checks) * 100 if total_checks > 0 else 0
-                
-                # Latencia promedio
-                latencies = [r['latency_ms'] for r in records if r['latency_ms'] is not None]
-                avg_latency = statistics.mean(latencies) if latencies else 0
-                
-                # Último fallo
-                last_failure = None
-                for record in records:
-                    if record['status'] == 'down':
-                        last_failure = datetime.fromisoformat(record['checked_at'])
-                        break
-                
-                # Frecuencia de fallos (fallos por día)
-                failure_frequency = failed_checks / days if days > 0 else 0
-                
-                # Tendencia de confiabilidad (últimos 3 vs primeros 3 días)
-                reliability_trend = self._calculate_reliability_trend(records, days)
-                
-                dataset_info = records[0]  # Más reciente
-                
-                return DatasetAnalytics(
-                    dataset_id=dataset_id,
-                    dataset_name=dataset_info['name'],
-                    category=dataset_info['category'],
+                last_failure = int(metrics['last_failure'][i])
+                results[info['id']] = DatasetAnalytics(
+                    dataset_id=info['id'],
+                    dataset_name=info['name'],
+                    category=info['category'],
                     total_checks=total_checks,
                     successful_checks=successful_checks,
                     failed_checks=failed_checks,
-                    uptime_percentage=uptime_percentage,
-                    avg_latency=avg_latency,
-                    last_failure=last_failure,
-                    failure_frequency=failure_frequency,
-                    reliability_trend=reliability_trend
+                    uptime_percentage=successful_checks / total_checks * 100,
+                    avg_latency=float(metrics['avg_latency'][i]),
+                    last_failure=datetime.fromtimestamp(last_failure / 1000, tz=timezone.utc) if last_failure >= 0 else None,
+                    failure_frequency=failed_checks / days if days > 0 else 0,
+                    reliability_trend=str(metrics['trend'][i]),
+                    p50_latency=_optional_round(metrics['p50'][i]),
+                    p95_latency=_optional_round(metrics['p95'][i]),
+                    p99_latency=_optional_round(metrics['p99'][i]),
+                    mttr_minutes=_optional_round(metrics['mttr'][i]),
+                    mtbf_minutes=_optional_round(metrics['mtbf'][i])
                 )
-                
+            return results
+            
         except Exception as e:
-            return None
-    
-    def _calculate_reliability_trend(self, records: List, days: int) -> str:
-        """Calcula la tendencia de confiabilidad"""
-        if len(records) < 6:  # Necesitamos al menos 6 registros
-            return 'stable'
-        
-        mid_point = len(records) // 2
-        recent_records = records[:mid_point]
-        older_records = records[mid_point:]
-        
-        recent_uptime = sum(1 for r in recent_records if r['status'] == 'up') / len(recent_records)
-        older_uptime = sum(1 for r in older_records if r['status'] == 'up') / len(older_records)
-        
-        difference = recent_uptime - older_uptime
-        
-        if difference > 0.1:  # 10% improvement
-            return 'improving'
-        elif difference < -0.1:  # 10% decline
-            return 'declining'
-        else:
-            return 'stable'
+            return {}
     
     def generate_category_analytics(self, hours: int = 24) -> List[Dict[str, Any]]:
         """Genera analytics por categoría"""
         try:
-            with sqlite3.connect(self.db.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                
-                since_time = datetime.now(timezone.utc) - timedelta(hours=hours)
-                
-                cursor = conn.execute("""
-                    SELECT 
-                        category,
-                        COUNT(DISTINCT dataset_id) as total_datasets,
-                        COUNT(*) as total_checks,
-                        SUM(CASE WHEN status = 'up' THEN 1 ELSE 0 END) as successful_checks,
-                        AVG(CASE WHEN latency_ms IS NOT NULL THEN latency_ms ELSE 0 END) as avg_latency
-                    FROM dataset_status 
-                    WHERE checked_at >= ? AND category IS NOT NULL
-                    GROUP BY category
-                    ORDER BY total_datasets DESC
-                """, (since_time.isoformat(),))
-                
-                categories = []
-                for row in cursor.fetchall():
-                    uptime = (row['successful_checks'] / row['total_checks']) * 100 if row['total_checks'] > 0 else 0
-                    categories.append({
-                        'category': row['category'],
-                        'total_datasets': row['total_datasets'],
-                        'uptime_percentage': round(uptime, 2),
-                        'avg_latency': round(row['avg_latency'], 2),
-                        'total_checks': row['total_checks']
-                    })
-                
-                return categories
-                
+            rows = self.db.query('category_analytics', (since_epoch_ms(hours=hours),))
+            
+            categories = []
+            for row in rows:
+                uptime = (row['successful_checks'] / row['total_checks']) * 100 if row['total_checks'] > 0 else 0
+                categories.append({
+                    'category': row['category'],
+                    'total_datasets': row['total_datasets'],
+                    'uptime_percentage': round(uptime, 2),
+                    'avg_latency': _optional_round(row['avg_latency']),
+                    'total_checks': row['total_checks']
+                })
+            
+            return categories
+            
         except Exception as e:
             return []
     
-    def generate_timeline_data(self, hours: int = 24, interval_minutes: int = 60) -> List[Dict[str, Any]]:
+    def generate_timeline_data(self, hours: int = 24, interval_minutes: int = 60,
+                               fill: str = 'none') -> List[Dict[str, Any]]:
         """Genera datos de timeline para gráficos"""
         try:
-            with sqlite3.connect(self.db.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                
-                since_time = datetime.now(timezone.utc) - timedelta(hours=hours)
-                
-                cursor = conn.execute("""
-                    SELECT 
-                        strftime('%Y-%m-%d %H:00:00', checked_at) as hour_bucket,
-                        COUNT(*) as total_checks,
-                        SUM(CASE WHEN status = 'up' THEN 1 ELSE 0 END) as successful_checks,
-                        AVG(CASE WHEN latency_ms IS NOT NULL THEN latency_ms ELSE 0 END) as avg_latency
-                    FROM dataset_status 
-                    WHERE checked_at >= ?
-                    GROUP BY hour_bucket
-                    ORDER BY hour_bucket
-                """, (since_time.isoformat(),))
-                
-                timeline = []
-                for row in cursor.fetchall():
-                    uptime = (row['successful_checks'] / row['total_checks']) * 100 if row['total_checks'] > 0 else 0
-                    timeline.append({
-                        'timestamp': row['hour_bucket'],
-                        'uptime_percentage': round(uptime, 2),
-                        'avg_latency': round(row['avg_latency'], 2),
-                        'total_checks': row['total_checks']
-                    })
-                
-                return timeline
-                
+            return self.generate_timeline_series(hours, interval_minutes, fill)['timeline']
         except Exception as e:
             return []
     
+    def generate_timeline_series(self, hours: int = 24, interval_minutes: int = 60,
+                                 fill: str = 'none') -> Dict[str, Any]:
+        """Timeline total y por categoría con buckets de `interval_minutes`
+        
+        Se arma desde minute_rollups: uptime y latencia promedio de cada bucket se
+        ponderan por la cantidad de chequeos (y de latencias) de sus minutos. Los
+        buckets se alinean a múltiplos del intervalo; `fill` define qué hacer con
+        los que no tienen chequeos (ver TIMELINE_FILLS).
+        """
+        if fill not in TIMELINE_FILLS:
+            raise ValueError(f"fill debe ser uno de {TIMELINE_FILLS}")
+        interval_minutes = max(1, interval_minutes)
+        interval_ms = interval_minutes * MINUTE_MS
+        buckets = self._timeline_buckets(hours, interval_minutes)
+        
+        totals: Dict[int, List[float]] = {}
+        per_category: Dict[str, Dict[int, List[float]]] = defaultdict(dict)
+        for (start, category), values in buckets.items():
+            for target in (totals, per_category[category]):
+                current = target.setdefault(start, [0, 0, 0, 0.0, 0])
+                for i, value in enumerate(values):
+                    current[i] += value
+        
+        if fill == 'none':
+            starts = sorted(totals)
+        else:
+            since = since_epoch_ms(hours=hours)
+            now_ms = since_epoch_ms()
+            starts = list(range(since - since % interval_ms, now_ms + 1, interval_ms))
+        return {
+            'timeline': self._timeline_points(totals, starts, fill),
+            'categories': {
+                category: self._timeline_points(values, starts if fill != 'none' else sorted(values), fill)
+                for category, values in sorted(per_category.items())
+            }
+        }
+    
+    def _timeline_buckets(self, hours: int, interval_minutes: int) -> Dict[Tuple[int, str], List[float]]:
+        """Agregados [checks, up, down, latency_sum, latency_count] por (bucket, categoría)
+        
+        La primera lectura de una (ventana, intervalo) trae todos sus minutos; las
+        siguientes solo suman los chequeos con id posterior al último leído, así
+        también entran los que llegan tarde a minutos ya leídos (resultados fuera
+        de orden, otros workers, migración).
+        """
+        interval_ms = interval_minutes * MINUTE_MS
+        since = since_epoch_ms(hours=hours)
+        first_bucket = since - since % interval_ms
+        with self._timelines_lock:
+            entry = self._timelines.pop((hours, interval_minutes), None)
+            if entry is None:
+                entry = {'buckets': {}, 'last_id': None}
+            buckets = entry['buckets']
+            
+            rows, entry['last_id'] = self.db.get_minute_rollups(first_bucket, entry['last_id'])
+            for minute, category, *values in rows:
+                current = buckets.setdefault((minute - minute % interval_ms, category), [0, 0, 0, 0.0, 0])
+                for i, value in enumerate(values):
+                    current[i] += value
+            
+            # La ventana se desliza: se descartan los buckets que quedaron fuera
+            for key in [key for key in buckets if key[0] < first_bucket]:
+                del buckets[key]
+            
+            if entry['last_id'] is not None:
+                # Sin id (migración pendiente) no se puede continuar incrementalmente
+                self._timelines[(hours, interval_minutes)] = entry
+            while len(self._timelines) > TIMELINE_CACHE_SIZE:
+                self._timelines.pop(next(iter(self._timelines)))
+            return {key: list(values) for key, values in buckets.items()}
+    
+    def _timeline_points(self, values_by_start: Dict[int, List[float]], starts: List[int],
+                         fill: str) -> List[Dict[str, Any]]:
+        points = []
+        previous = None
+        for start in starts:
+            timestamp = datetime.fromtimestamp(start / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            checks, up, down, latency_sum, latency_count = values_by_start.get(start, (0, 0, 0, 0.0, 0))
+            if checks > 0:
+                previous = {
+                    'timestamp': timestamp,
+                    'uptime_percentage': round(up / checks * 100, 2),
+                    'avg_latency': round(latency_sum / latency_count, 2) if latency_count else None,
+                    'total_checks': int(checks)
+                }
+                points.append(previous)
+            elif fill != 'none':
+                carried = previous if fill == 'previous' and previous else {}
+                points.append({
+                    'timestamp': timestamp,
+                    'uptime_percentage': carried.get('uptime_percentage'),
+                    'avg_latency': carried.get('avg_latency'),
+                    'total_checks': 0,
+                    'filled': True
+                })
+        return points
+    
+    def generate_latency_breakdown(self, hours: int = 24, dataset_id: Optional[str] = None) -> Dict[str, Any]:
+        """Desglose de la latencia por fase (DNS, connect, TLS, TTFB) global y por dataset"""
+        phases = ('dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms')
+        try:
+            since = since_epoch_ms(hours=hours)
+            if dataset_id:
+                rows = self.db.query('latency_phases_dataset', (self.db.dataset_key(dataset_id), since))
+            else:
+                rows = self.db.query('latency_phases', (since,))
+                
+            def summarize(values: List[float]) -> Dict[str, Any]:
+                if not values:
+                    return {'samples': 0, 'avg': None, 'p50': None, 'p95': None}
+                ordered = sorted(values)
+                return {
+                    'samples': len(ordered),
+                    'avg': round(statistics.fmean(ordered), 2),
+                    'p50': round(ordered[int(0.5 * (len(ordered) - 1))], 2),
+                    'p95': round(ordered[int(0.95 * (len(ordered) - 1))], 2)
+                }
+            
+            overall = defaultdict(list)
+            per_dataset: Dict[str, Dict[str, Any]] = {}
+            for row in rows:
+                entry = per_dataset.setdefault(row['dataset_id'], {
+                    'dataset_id': row['dataset_id'],
+                    'name': row['name'],
+                    'category': row['category'],
+                    'values': defaultdict(list)
+                })
+                for phase in ('latency_ms',) + phases:
+                    if row[phase] is not None:
+                        overall[phase].append(row[phase])
+                        entry['values'][phase].append(row[phase])
+            
+            datasets = []
+            for entry in per_dataset.values():
+                values = entry.pop('values')
+                averages = {
+                    phase: round(statistics.fmean(values[phase]), 2) if values[phase] else None
+                    for phase in ('latency_ms',) + phases
+                }
+                measured = {p: v for p, v in averages.items() if p != 'latency_ms' and v is not None}
+                entry.update(averages)
+                # Fase que más aporta a la latencia: orienta el ajuste de pooling y timeouts
+                entry['dominant_phase'] = max(measured, key=measured.get) if measured else None
+                datasets.append(entry)
+            datasets.sort(key=lambda d: d['latency_ms'] or 0, reverse=True)
+            
+            return {
+                'phases': {phase: summarize(overall[phase]) for phase in ('latency_ms',) + phases},
+                'datasets': datasets
+            }
+                
+        except Exception as e:
+            return {'phases': {}, 'datasets': []}
+    
+    def generate_latency_percentiles(self, hours: int = 24, group_by: str = 'system',
+                                     dataset_id: Optional[str] = None) -> Dict[str, Any]:
+        """p50/p95/p99 de latencia por sistema, categoría o dataset combinando sketches horarios"""
+        if group_by not in ('system', 'category', 'dataset'):
+            raise ValueError("group_by debe ser 'system', 'category' o 'dataset'")
+        sketches = self.db.get_latency_sketches(since_epoch_ms(hours=hours), group_by, dataset_id)
+        groups = [dict(group=name, **sketch.summary()) for name, sketch in sketches.items()]
+        groups.sort(key=lambda g: g['p95'] or 0, reverse=True)
+        return {
+            'hours': hours,
+            'group_by': group_by,
+            'dataset_id': dataset_id,
+            'groups': groups
+        }
+    
+    def generate_sla_report(self, hours: int = 24 * 30, dataset_id: Optional[str] = None) -> Dict[str, Any]:
+        """Uptime ponderado por tiempo, caídas y MTTR desde los intervalos de estado
+        
+        Cada intervalo se recorta a la ventana; el costo depende de la cantidad de
+        transiciones, no de chequeos. El uptime es tiempo 'up' / (tiempo 'up' + 'down').
+        La caída más larga usa la duración dentro de la ventana y el MTTR la duración
+        completa de las caídas que terminaron (se recuperaron) dentro de ella.
+        """
+        now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+        since = since_epoch_ms(hours=hours)
+        intervals = sorted(self.db.get_status_intervals(since, dataset_id),
+                           key=lambda i: (i['dataset_id'], i['start_ms']))
+        
+        per_dataset: Dict[str, Dict[str, Any]] = {}
+        for i, interval in enumerate(intervals):
+            entry = per_dataset.setdefault(interval['dataset_id'], {
+                'dataset_id': interval['dataset_id'],
+                'name': interval['name'],
+                'category': interval['category'],
+                'up_ms': 0, 'down_ms': 0, 'unknown_ms': 0,
+                'outages': 0, 'longest_outage_ms': 0, 'repairs_ms': [],
+                'transitions': 0, 'current_status': None, 'in_outage_since': None
+            })
+            duration = max(0, min(interval['end_ms'], now_ms) - max(interval['start_ms'], since))
+            entry[f"{interval['status']}_ms"] += duration
+            if interval['start_ms'] >= since:
+                entry['transitions'] += 1
+            is_current = i + 1 == len(intervals) or intervals[i + 1]['dataset_id'] != interval['dataset_id']
+            if is_current:
+                entry['current_status'] = interval['status']
+            if interval['status'] == 'down':
+                entry['outages'] += 1
+                entry['longest_outage_ms'] = max(entry['longest_outage_ms'], duration)
+                if is_current:
+                    entry['in_outage_since'] = datetime.fromtimestamp(interval['start_ms'] / 1000, tz=timezone.utc).isoformat()
+                else:
+                    entry['repairs_ms'].append(interval['end_ms'] - interval['start_ms'])
+        
+        def finish(entry: Dict[str, Any]) -> Dict[str, Any]:
+            observed = entry['up_ms'] + entry['down_ms']
+            repairs = entry.pop('repairs_ms')
+            entry['uptime_percentage'] = round(entry['up_ms'] / observed * 100, 3) if observed else None
+            entry['mttr_minutes'] = round(statistics.fmean(repairs) / 60000, 2) if repairs else None
+            entry['longest_outage_minutes'] = round(entry.pop('longest_outage_ms') / 60000, 2)
+            return entry
+        
+        repairs = [r for entry in per_dataset.values() for r in entry['repairs_ms']]
+        datasets = [finish(entry) for entry in per_dataset.values()]
+        datasets.sort(key=lambda d: d['uptime_percentage'] if d['uptime_percentage'] is not None else 101)
+        
+        up_ms = sum(d['up_ms'] for d in datasets)
+        down_ms = sum(d['down_ms'] for d in datasets)
+        return {
+            'hours': hours,
+            'since': datetime.fromtimestamp(since / 1000, tz=timezone.utc).isoformat(),
+            'uptime_percentage': round(up_ms / (up_ms + down_ms) * 100, 3) if up_ms + down_ms else None,
+            'outages': sum(d['outages'] for d in datasets),
+            'ongoing_outages': sum(1 for d in datasets if d['in_outage_since']),
+            'mttr_minutes': round(statistics.fmean(repairs) / 60000, 2) if repairs else None,
+            'longest_outage_minutes': max((d['longest_outage_minutes'] for d in datasets), default=0),
+            'intervals': len(intervals),
+            'datasets': datasets
+        }
+    
+    def generate_uptime_report(self, days: int = 365, dataset_id: Optional[str] = None) -> Dict[str, Any]:
+        """Uptime de largo plazo combinando SQLite (días recientes) y el archivo frío (días anteriores)"""
+        now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+        since_ms = now_ms - days * 86400 * 1000
+        rows, hot_since = self.db.get_history_rollup(since_ms, dataset_id)
+        archive = self.db.archive
+        archived = []
+        if archive is not None and since_ms < hot_since:
+            # Solo lo anterior a la partición más antigua de SQLite, para no contar dos veces
+            archived = archive.daily_rollup(since_ms, hot_since, dataset_id)
+        
+        per_dataset: Dict[str, Dict[str, Any]] = {}
+        per_day: Dict[int, Dict[str, int]] = {}
+        for row in rows + archived:
+            entry = per_dataset.setdefault(row['dataset_id'], {
+                'dataset_id': row['dataset_id'],
+                'category': row['category'],
+                'checks': 0, 'up': 0, 'down': 0, 'latency_sum': 0.0, 'latency_count': 0
+            })
+            day = per_day.setdefault(row['day'], {'checks': 0, 'up': 0})
+            for key in ('checks', 'up', 'down', 'latency_sum', 'latency_count'):
+                entry[key] += row[key] or 0
+            day['checks'] += row['checks']
+            day['up'] += row['up'] or 0
+        
+        datasets = []
+        for entry in per_dataset.values():
+            latency_sum, latency_count = entry.pop('latency_sum'), entry.pop('latency_count')
+            entry['uptime_percentage'] = round(entry['up'] / entry['checks'] * 100, 3) if entry['checks'] else None
+            entry['avg_latency'] = round(latency_sum / latency_count, 2) if latency_count else None
+            datasets.append(entry)
+        datasets.sort(key=lambda d: (d['uptime_percentage'] is None, d['uptime_percentage'] or 0))
+        
+        total_checks = sum(d['checks'] for d in datasets)
+        total_up = sum(d['up'] for d in datasets)
+        return {
+            'days': days,
+            'since': datetime.fromtimestamp(since_ms / 1000, tz=timezone.utc).isoformat(),
+            'uptime_percentage': round(total_up / total_checks * 100, 3) if total_checks else None,
+            'total_checks': total_checks,
+            'sources': {
+                'sqlite_since': datetime.fromtimestamp(max(since_ms, hot_since) / 1000, tz=timezone.utc).isoformat(),
+                'archive': archive.stats() if archive is not None else None,
+                'archived_checks': sum(row['checks'] for row in archived)
+            },
+            'daily': [
+                {
+                    'date': datetime.fromtimestamp(day / 1000, tz=timezone.utc).date().isoformat(),
+                    'checks': values['checks'],
+                    'uptime_percentage': round(values['up'] / values['checks'] * 100, 3)
+                }
+                for day, values in sorted(per_day.items())
+            ],
+            'datasets': datasets
+        }
+    
     def get_top_performing_datasets(self, limit: int = 10, hours: int = 24) -> List[Dict[str, Any]]:
         """Obtiene los datasets con mejor rendimiento"""
         try:
-            with sqlite3.connect(self.db.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                
-                since_time = datetime.now(timezone.utc) - timedelta(hours=hours)
-                
-                cursor = conn.execute("""
-                    SELECT 
-                        dataset_id,
-                        name,
-                        category,
-                        COUNT(*) as total_checks,
-                        SUM(CASE WHEN status = 'up' THEN 1 ELSE 0 END) as successful_checks,
-                        AVG(CASE WHEN latency_ms IS NOT NULL THEN latency_ms ELSE 0 END) as avg_latency
-                    FROM dataset_status 
-                    WHERE checked_at >= ?
-                    GROUP BY dataset_id, name, category
-                    HAVING total_checks >= 3
-                    ORDER BY (successful_checks * 1.0 / total_checks) DESC, avg_latency ASC
-                    LIMIT ?
-                """, (since_time.isoformat(), limit))
-                
-                top_datasets = []
-                for row in cursor.fetchall():
-                    uptime = (row['successful_checks'] / row['total_checks']) * 100
-                    top_datasets.append({
-                        'dataset_id': row['dataset_id'],
-                        'name': row['name'],
-                        'category': row['category'],
-                        'uptime_percentage': round(uptime, 2),
-                        'avg_latency': round(row['avg_latency'], 2),
-                        'total_checks': row['total_checks']
-                    })
-                
-                return top_datasets
-                
+            rows = self.db.query('top_datasets', (since_epoch_ms(hours=hours), limit))
+            
+            top_datasets = []
+            for row in rows:
+                uptime = (row['successful_checks'] / row['total_checks']) * 100
+                top_datasets.append({
+                    'dataset_id': row['dataset_id'],
+                    'name': row['name'],
+                    'category': row['category'],
+                    'uptime_percentage': round(uptime, 2),
+                    'avg_latency': _optional_round(row['avg_latency']),
+                    'total_checks': row['total_checks']
+                })
+            
+            return top_datasets
+            
         except Exception as e:
             return []
     
     def get_problematic_datasets(self, limit: int = 10, hours: int = 24) -> List[Dict[str, Any]]:
         """Obtiene los datasets con más problemas"""
         try:
-            with sqlite3.connect(self.db.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                
-                since_time = datetime.now(timezone.utc) - timedelta(hours=hours)
-                
-                cursor = conn.execute("""
-                    SELECT 
-                        dataset_id,
-                        name,
-                        category,
-                        COUNT(*) as total_checks,
-                        SUM(CASE WHEN status = 'down' THEN 1 ELSE 0 END) as failed_checks,
-                        AVG(CASE WHEN latency_ms IS NOT NULL THEN latency_ms ELSE 0 END) as avg_latency
-                    FROM dataset_status 
-                    WHERE checked_at >= ?
-                    GROUP BY dataset_id, name, category
-                    HAVING total_checks >= 3
-                    ORDER BY (failed_checks * 1.0 / total_checks) DESC, avg_latency DESC
-                    LIMIT ?
-                """, (since_time.isoformat(), limit))
-                
-                problematic_datasets = []
-                for row in cursor.fetchall():
-                    failure_rate = (row['failed_checks'] / row['total_checks']) * 100
-                    problematic_datasets.append({
-                        'dataset_id': row['dataset_id'],
-                        'name': row['name'],
-                        'category': row['category'],
-                        'failure_rate': round(failure_rate, 2),
-                        'avg_latency': round(row['avg_latency'], 2),
-                        'total_checks': row['total_checks'],
-                        'failed_checks': row['failed_checks']
-                    })
-                
-                return problematic_datasets
-                
+            rows = self.db.query('problematic_datasets', (since_epoch_ms(hours=hours), limit))
+            
+            problematic_datasets = []
+            for row in rows:
+                failure_rate = (row['failed_checks'] / row['total_checks']) * 100
+                problematic_datasets.append({
+                    'dataset_id': row['dataset_id'],
+                    'name': row['name'],
+                    'category': row['category'],
+                    'failure_rate': round(failure_rate, 2),
+                    'avg_latency': _optional_round(row['avg_latency']),
+                    'total_checks': row['total_checks'],
+                    'failed_checks': row['failed_checks']
+                })
+            
+            return problematic_datasets
+            
         except Exception as e:
             return []
@@ -15,16 +15,21 @@ import logging
 # Imports locales
 from services.sources import load_sources, SourceConfigError
 from services.checker import check_all
+from services.dns_cache import configure_dns_cache
+from services.politeness import configure_politeness
 from models import Database
 from cache import cache, cached, invalidate_datasets_cache
 from scheduler import init_scheduler, get_scheduler
 from notifications import notification_manager, create_system_notification
-from websockets import WebSocketManager
-from analytics import AnalyticsEngine
+from bus import init_message_bus
+from websockets import WebSocketManager, GENERAL_ROOM, configure_websocket_compression
+from analytics import AnalyticsEngine, TIMELINE_FILLS
+from archive import HistoryArchive
 from reports import ReportGenerator, ScheduledReporter
 from error_handlers import safe_api_call, APIError
 from auth import require_api_key, optional_api_key, api_key_manager
 from developer_portal import developer_bp
+from querystats import query_monitor
 
 
 # Configurar logging
@@ -36,19 +41,71 @@ app = Flask(__name__)
 CORS(app)  # habilita CORS para el frontend
 
 # Configurar SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
-
-# Inicializar WebSocket Manager
-ws_manager = WebSocketManager(socketio)
+# http_compression cubre el transporte de long-polling; el websocket usa
+# permessage-deflate, configurado explícitamente abajo (solo con eventlet).
+# Los clientes pueden pedir payloads MessagePack con auth={'encoding': 'msgpack'}.
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    logger=True,
+    engineio_logger=True,
+    http_compression=os.getenv('WS_COMPRESSION', 'true').lower() == 'true',
+    compression_threshold=int(os.getenv('WS_COMPRESSION_THRESHOLD', '1024'))
+)
+ws_compression = configure_websocket_compression(
+    socketio,
+    enabled=os.getenv('WS_COMPRESSION', 'true').lower() == 'true',
+    max_window_bits=int(os.getenv('WS_DEFLATE_MAX_WINDOW_BITS', '15')),
+    no_context_takeover=os.getenv('WS_DEFLATE_NO_CONTEXT_TAKEOVER', 'false').lower() == 'true'
+)
 
 # Configuración
 app.config['DATABASE_PATH'] = os.getenv('DATABASE_PATH', 'data/chile_data.db')
 app.config['CACHE_DEFAULT_TIMEOUT'] = int(os.getenv('CACHE_DEFAULT_TIMEOUT', '300'))
 app.config['MONITOR_ENABLED'] = os.getenv('MONITOR_ENABLED', 'true').lower() == 'true'
 app.config['MONITOR_INTERVAL'] = int(os.getenv('MONITOR_INTERVAL', '300'))
+app.config['LEADER_LEASE_TTL'] = float(os.getenv('LEADER_LEASE_TTL', '30'))
+app.config['MONITOR_CHECK_SHARDS'] = int(os.getenv('MONITOR_CHECK_SHARDS', '1'))
+app.config['DNS_CACHE_TTL'] = float(os.getenv('DNS_CACHE_TTL', '300'))
+app.config['DNS_NEGATIVE_TTL'] = float(os.getenv('DNS_NEGATIVE_TTL', '30'))
+app.config['HOST_MAX_CONCURRENCY'] = int(os.getenv('HOST_MAX_CONCURRENCY', '2'))
+app.config['HOST_MIN_DELAY'] = float(os.getenv('HOST_MIN_DELAY', '0.2'))
+app.config['HOST_JITTER'] = float(os.getenv('HOST_JITTER', '0.5'))
+app.config['HOST_RETRY_AFTER_MAX_WAIT'] = float(os.getenv('HOST_RETRY_AFTER_MAX_WAIT', '30'))
+app.config['HOST_SPREAD_FRACTION'] = float(os.getenv('HOST_SPREAD_FRACTION', '0.5'))
+app.config['HISTORY_RETENTION_DAYS'] = int(os.getenv('HISTORY_RETENTION_DAYS', '7'))
+app.config['HISTORY_ARCHIVE_PATH'] = os.getenv('HISTORY_ARCHIVE_PATH', 'data/archive')
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', '250'))
+app.config['QUERY_PLAN_GUARD'] = os.getenv('QUERY_PLAN_GUARD', 'false').lower() == 'true'
+
+# Cache DNS en proceso para las verificaciones de datasets
+configure_dns_cache(app.config['DNS_CACHE_TTL'], app.config['DNS_NEGATIVE_TTL'])
+# Límites por host para no gatillar rate limiting en los servidores de gobierno
+configure_politeness(
+    max_per_host=app.config['HOST_MAX_CONCURRENCY'],
+    min_delay=app.config['HOST_MIN_DELAY'],
+    jitter=app.config['HOST_JITTER'],
+    max_wait=app.config['HOST_RETRY_AFTER_MAX_WAIT'],
+    spread_fraction=app.config['HOST_SPREAD_FRACTION']
+)
+
+# Inicializar base de datos (las particiones vencidas se archivan antes de eliminarse)
+history_archive = HistoryArchive(app.config['HISTORY_ARCHIVE_PATH']) if app.config['HISTORY_ARCHIVE_PATH'] else None
+db = Database(app.config['DATABASE_PATH'], archive=history_archive)
+
+# Tiempos por consulta y log de consultas lentas; con el guardián activo (pruebas/CI)
+# el arranque falla si una consulta caliente recorre una tabla completa
+query_monitor.configure(slow_ms=app.config['SLOW_QUERY_MS'], guard=app.config['QUERY_PLAN_GUARD'])
+if app.config['QUERY_PLAN_GUARD']:
+    db.check_query_plans()
+    api_key_manager.check_query_plans()
+
+# Bus de mensajes entre workers (vacío = un solo proceso, bus en memoria)
+message_bus = init_message_bus(os.getenv('MESSAGE_BUS_URL'))
+notification_manager.attach_bus(message_bus)
 
-# Inicializar base de datos
-db = Database(app.config['DATABASE_PATH'])
+# Inicializar WebSocket Manager
+ws_manager = WebSocketManager(socketio, db, bus=message_bus)
 
 # Inicializar analytics y reportes
 analytics_engine = AnalyticsEngine(db)
@@ -58,9 +115,23 @@ scheduled_reporter = ScheduledReporter(db)
 # Registrar blueprint del portal de desarrolladores
 # app.register_blueprint(developer_bp)  # Temporalmente comentado para pruebas
 
-# Inicializar scheduler si está habilitado
-if app.config['MONITOR_ENABLED']:
-    scheduler = init_scheduler(db)
+# Inicializar scheduler si está habilitado. Los procesos de verificación por
+# shards (spawn) importan este módulo como __mp_main__: ahí no hay monitor
+if app.config['MONITOR_ENABLED'] and __name__ != '__mp_main__':
+    # Con varios workers solo el líder (lease en SQLite) ejecuta el monitor
+    scheduler = init_scheduler(
+        db,
+        bus=message_bus,
+        lease_ttl=app.config['LEADER_LEASE_TTL'],
+        check_shards=app.config['MONITOR_CHECK_SHARDS'],
+        retention_days=app.config['HISTORY_RETENTION_DAYS']
+    )
+    # Publicar cada resultado en las salas dataset:<id> y category:<nombre>
+    scheduler.monitor.add_subscriber(ws_manager.broadcast_dataset_update)
+    # Reconstruir el snapshot de conexión una vez por ciclo
+    scheduler.monitor.add_cycle_subscriber(ws_manager.update_snapshot)
+    # Degradaciones/recuperaciones detectadas por los detectores online
+    scheduler.monitor.add_anomaly_subscriber(ws_manager.broadcast_dataset_anomaly)
     scheduler.start()
     logger.info("Monitoreo automático iniciado")
 
@@ -104,7 +175,14 @@ def status():
                     http_code=result.get('http_code'),
                     latency_ms=result.get('latency_ms'),
                     error=result.get('error'),
-                    checked_at=check_time
+                    checked_at=check_time,
+                    etag=result.get('etag'),
+                    last_modified=result.get('last_modified'),
+                    content_changed=result.get('content_changed'),
+                    dns_ms=result.get('dns_ms'),
+                    connect_ms=result.get('connect_ms'),
+                    tls_ms=result.get('tls_ms'),
+                    ttfb_ms=result.get('ttfb_ms')
                 )
                 db.save_dataset_status(status_obj)
             
@@ -232,7 +310,7 @@ def force_check():
             return jsonify({"error": "Monitoring is disabled"}), 503
         
         scheduler = get_scheduler()
-        scheduler.monitor.force_check()
+        scheduler.request_check()
         
         # Invalidar cache
         invalidate_datasets_cache()
@@ -269,6 +347,19 @@ def cache_stats():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route("/admin/query-stats", methods=['GET', 'DELETE'])
+def query_stats():
+    """Conteos e histogramas de latencia por consulta y consultas lentas recientes"""
+    try:
+        if request.method == 'DELETE':
+            query_monitor.reset()
+            return jsonify({"message": "Query stats reset successfully"})
+        return jsonify(query_monitor.stats())
+    except Exception as e:
+        logger.error(f"Error getting query stats: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
 @app.route("/admin/scheduler")
 def scheduler_status():
     """Estado del scheduler"""
@@ -333,10 +424,10 @@ def mark_notification_read(notification_id):
         
         if success:
             # Notificar via WebSocket
-            ws_manager.socketio.emit('notification_marked_read', {
+            ws_manager.broadcast('notification_marked_read', {
                 'notification_id': notification_id,
                 'unread_count': unread_count
-            }, room='general')
+            }, GENERAL_ROOM)
             
             return jsonify({
                 "success": True,
@@ -356,7 +447,7 @@ def clear_notifications():
         notification_manager.clear_notifications()
         
         # Notificar via WebSocket
-        ws_manager.socketio.emit('notifications_cleared', room='general')
+        ws_manager.broadcast('notifications_cleared', None, GENERAL_ROOM)
         
         return jsonify({"success": True, "message": "All notifications cleared"})
     except Exception as e:
@@ -399,7 +490,8 @@ def websocket_status():
         return jsonify({
             "websocket_enabled": True,
             "connected_clients": client_info['total_clients'],
-            "clients_info": client_info['clients']
+            "clients_info": client_info['clients'],
+            "compression": ws_compression
         })
     except Exception as e:
         logger.error(f"Error getting WebSocket status: {e}")
@@ -450,19 +542,128 @@ def get_timeline_analytics():
     try:
         hours = request.args.get('hours', 24, type=int)
         interval = request.args.get('interval', 60, type=int)
-        timeline = analytics_engine.generate_timeline_data(hours=hours, interval_minutes=interval)
-        
-        return jsonify({
+        fill = request.args.get('fill', 'none')
+        by_category = request.args.get('by_category', 'false').lower() == 'true'
+        if fill not in TIMELINE_FILLS:
+            return jsonify({"error": "Invalid fill parameter"}), 400
+        if interval < 1:
+            return jsonify({"error": "Invalid interval parameter"}), 400
+        series = analytics_engine.generate_timeline_series(hours=hours, interval_minutes=interval, fill=fill)
+        
+        response = {
             "success": True,
-            "timeline": timeline,
+            "timeline": series['timeline'],
             "period_hours": hours,
             "interval_minutes": interval
-        })
+        }
+        if by_category:
+            response["categories"] = series['categories']
+        return jsonify(response)
     except Exception as e:
         logger.error(f"Error getting timeline analytics: {e}")
         return jsonify({"error": "Failed to get timeline analytics"}), 500
 
 
+@app.route("/api/analytics/latency-breakdown")
+@optional_api_key
+def get_latency_breakdown():
+    """Obtiene el desglose de latencia por fase (DNS, connect, TLS, TTFB)"""
+    try:
+        hours = request.args.get('hours', 24, type=int)
+        dataset_id = request.args.get('dataset_id')
+        breakdown = analytics_engine.generate_latency_breakdown(hours=hours, dataset_id=dataset_id)
+        
+        return jsonify({
+            "success": True,
+            "breakdown": breakdown,
+            "period_hours": hours
+        })
+    except Exception as e:
+        logger.error(f"Error getting latency breakdown: {e}")
+        return jsonify({"error": "Failed to get latency breakdown"}), 500
+
+
+@app.route("/api/analytics/uptime-report")
+@optional_api_key
+def get_uptime_report():
+    """Obtiene el uptime de largo plazo (SQLite + archivo frío)"""
+    try:
+        days = request.args.get('days', 365, type=int)
+        dataset_id = request.args.get('dataset_id')
+        report = analytics_engine.generate_uptime_report(days=days, dataset_id=dataset_id)
+        
+        return jsonify({
+            "success": True,
+            "report": report,
+            "period_days": days
+        })
+    except Exception as e:
+        logger.error(f"Error getting uptime report: {e}")
+        return jsonify({"error": "Failed to get uptime report"}), 500
+
+
+@app.route("/api/analytics/sla")
+@optional_api_key
+def get_sla_report():
+    """Uptime ponderado por tiempo, caídas y MTTR desde los intervalos de estado"""
+    try:
+        hours = request.args.get('hours', 24 * 30, type=int)
+        dataset_id = request.args.get('dataset_id')
+        report = analytics_engine.generate_sla_report(hours=hours, dataset_id=dataset_id)
+        
+        return jsonify({
+            "success": True,
+            "report": report
+        })
+    except Exception as e:
+        logger.error(f"Error getting SLA report: {e}")
+        return jsonify({"error": "Failed to get SLA report"}), 500
+
+
+@app.route("/api/analytics/anomalies")
+@optional_api_key
+def get_anomalies():
+    """Estado de los detectores de degradación (por defecto solo los datasets en alarma)"""
+    try:
+        include_all = request.args.get('all', 'false').lower() == 'true'
+        detectors = [
+            d for d in db.get_anomaly_detectors()
+            if include_all or d['latency_degraded'] or d['failure_degraded']
+        ]
+        
+        return jsonify({
+            "success": True,
+            "detectors": detectors,
+            "count": len(detectors)
+        })
+    except Exception as e:
+        logger.error(f"Error getting anomalies: {e}")
+        return jsonify({"error": "Failed to get anomalies"}), 500
+
+
+@app.route("/api/analytics/latency-percentiles")
+@optional_api_key
+def get_latency_percentiles():
+    """Percentiles de latencia (p50/p95/p99) desde sketches horarios"""
+    try:
+        hours = request.args.get('hours', 24, type=int)
+        group_by = request.args.get('group_by', 'system')
+        dataset_id = request.args.get('dataset_id')
+        if group_by not in ('system', 'category', 'dataset'):
+            return jsonify({"error": "Invalid group_by parameter"}), 400
+        percentiles = analytics_engine.generate_latency_percentiles(
+            hours=hours, group_by=group_by, dataset_id=dataset_id
+        )
+        
+        return jsonify({
+            "success": True,
+            "percentiles": percentiles
+        })
+    except Exception as e:
+        logger.error(f"Error getting latency percentiles: {e}")
+        return jsonify({"error": "Failed to get latency percentiles"}), 500
+
+
 @app.route("/api/analytics/datasets/top")
 @optional_api_key
 def get_top_datasets():
@@ -523,6 +724,26 @@ def get_dataset_analytics(dataset_id):
         return jsonify({"error": "Failed to get dataset analytics"}), 500
 
 
+@app.route("/api/analytics/datasets/batch")
+@optional_api_key
+def get_datasets_analytics():
+    """Analytics de varios datasets en una sola lectura (?ids=a,b,c; sin ids = todos)"""
+    try:
+        days = request.args.get('days', 7, type=int)
+        ids = [i.strip() for i in request.args.get('ids', '').split(',') if i.strip()]
+        results = analytics_engine.generate_datasets_analytics(dataset_ids=ids or None, days=days)
+        
+        return jsonify({
+            "success": True,
+            "analytics": {dataset_id: analytics.to_dict() for dataset_id, analytics in results.items()},
+            "count": len(results),
+            "period_days": days
+        })
+    except Exception as e:
+        logger.error(f"Error getting datasets analytics: {e}")
+        return jsonify({"error": "Failed to get datasets analytics"}), 500
+
+
 # === ENDPOINTS DE REPORTES ===
 
 @app.route("/api/reports/daily")
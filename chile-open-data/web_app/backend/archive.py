@@ -0,0 +1,228 @@
+# /web_app/backend/archive.py
+"""
+Archivo frío del historial de chequeos
+
+Antes de que la retención elimine una partición diaria de SQLite, sus filas
+se exportan a un archivo columnar comprimido en `HISTORY_ARCHIVE_PATH`:
+Parquet (zstd) si pyarrow está instalado y, si no, columnas en JSON
+comprimido con gzip. Así la base caliente guarda pocos días y los reportes
+de largo plazo (p. ej. uptime anual) leen el archivo; con DuckDB instalado
+la agregación se hace directamente sobre los Parquet.
+"""
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+
+from models import HISTORY_PARTITION_PREFIX, STATUS_CODES
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Dependencia opcional: sin ella se usa JSON columnar comprimido
+    pa = None
+    pq = None
+
+try:
+    import duckdb
+except ImportError:  # Dependencia opcional: sin ella se agrega en Python
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Columnas archivadas: el dataset se guarda por id (texto) para que el archivo no dependa de dataset_keys
+ARCHIVE_COLUMNS = (
+    'id', 'dataset_id', 'category', 'checked_at', 'status', 'http_code', 'latency_ms', 'error',
+    'etag', 'last_modified', 'content_changed', 'dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms'
+)
+
+DAY_MS = 86400 * 1000
+
+
+def _arrow_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('dataset_id', pa.string()),
+        ('category', pa.string()),
+        ('checked_at', pa.int64()),
+        ('status', pa.int8()),
+        ('http_code', pa.int32()),
+        ('latency_ms', pa.float64()),
+        ('error', pa.string()),
+        ('etag', pa.string()),
+        ('last_modified', pa.string()),
+        ('content_changed', pa.bool_()),
+        ('dns_ms', pa.float64()),
+        ('connect_ms', pa.float64()),
+        ('tls_ms', pa.float64()),
+        ('ttfb_ms', pa.float64()),
+    ])
+
+
+class HistoryArchive:
+    """Exporta particiones del historial a archivos columnares y agrega sobre ellos"""
+
+    def __init__(self, path: str = "data/archive"):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.format = 'parquet' if pq is not None else 'json.gz'
+
+    @property
+    def engine(self) -> str:
+        """Motor usado para consultar el archivo"""
+        if duckdb is not None and pq is not None:
+            return 'duckdb'
+        return 'pyarrow' if pq is not None else 'python'
+
+    def _file_for(self, partition: str) -> Path:
+        return self.path / f"{partition}.{self.format}"
+
+    def files(self, since_ms: Optional[int] = None, until_ms: Optional[int] = None) -> List[Path]:
+        """Archivos cuyo día se cruza con [since_ms, until_ms), según el nombre de la partición"""
+        selected = []
+        for file in sorted(self.path.glob(f"{HISTORY_PARTITION_PREFIX}*")):
+            if not file.name.endswith(('.parquet', '.json.gz')):
+                continue
+            day = file.name[len(HISTORY_PARTITION_PREFIX):].split('.', 1)[0]
+            try:
+                start = int(datetime.strptime(day, '%Y%m%d').replace(tzinfo=timezone.utc).timestamp() * 1000)
+            except ValueError:
+                continue
+            if since_ms is not None and start + DAY_MS <= since_ms:
+                continue
+            if until_ms is not None and start >= until_ms:
+                continue
+            selected.append(file)
+        return selected
+
+    def export_partition(self, db_path: Path, partition: str) -> bool:
+        """Escribe la partición en el archivo; devuelve False si no se pudo (no debe eliminarse)"""
+        tmp = None
+        try:
+            with sqlite3.connect(db_path) as conn:
+                rows = conn.execute(f"""
+                    SELECT h.id, k.id, d.category, h.checked_at, h.status, h.http_code, h.latency_ms,
+                           h.error, h.etag, h.last_modified, h.content_changed,
+                           h.dns_ms, h.connect_ms, h.tls_ms, h.ttfb_ms
+                    FROM {partition} h
+                    JOIN dataset_keys k ON k.key = h.dataset_key
+                    LEFT JOIN datasets d ON d.id = k.id
+                    ORDER BY h.dataset_key, h.checked_at
+                """).fetchall()
+            columns: Dict[str, List[Any]] = {name: [] for name in ARCHIVE_COLUMNS}
+            for row in rows:
+                for name, value in zip(ARCHIVE_COLUMNS, row):
+                    columns[name].append(value)
+            columns['content_changed'] = [None if v is None else bool(v) for v in columns['content_changed']]
+
+            target = self._file_for(partition)
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            os.close(fd)
+            if pq is not None:
+                pq.write_table(pa.table(columns, schema=_arrow_schema()), tmp, compression='zstd')
+            else:
+                with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+                    json.dump(columns, f, separators=(',', ':'))
+            os.replace(tmp, target)
+            logger.info(f"Partición {partition} archivada en {target} ({len(rows)} filas)")
+            return True
+        except Exception as e:
+            logger.error(f"No se pudo archivar la partición {partition}: {e}")
+            if tmp:
+                Path(tmp).unlink(missing_ok=True)
+            return False
+
+    def daily_rollup(self, since_ms: int, until_ms: int, dataset_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Chequeos por día y dataset en [since_ms, until_ms)
+
+        Cada fila trae day (epoch ms del inicio del día UTC), dataset_id,
+        category, checks, up, down y la suma/cantidad de latencias exitosas.
+        """
+        files = self.files(since_ms, until_ms)
+        rows: List[Dict[str, Any]] = []
+        if self.engine == 'duckdb':
+            parquet = [f for f in files if f.name.endswith('.parquet')]
+            if parquet:
+                rows += self._rollup_duckdb(parquet, since_ms, until_ms, dataset_id)
+            # Archivos JSON escritos antes de instalar pyarrow
+            files = [f for f in files if not f.name.endswith('.parquet')]
+        return rows + self._rollup_python(files, since_ms, until_ms, dataset_id)
+
+    def _rollup_python(self, files: List[Path], since_ms: int, until_ms: int,
+                       dataset_id: Optional[str]) -> List[Dict[str, Any]]:
+        totals: Dict[tuple, Dict[str, Any]] = {}
+        for file in files:
+            columns = self._read_columns(file)
+            for i, checked_at in enumerate(columns['checked_at']):
+                if checked_at < since_ms or checked_at >= until_ms:
+                    continue
+                if dataset_id and columns['dataset_id'][i] != dataset_id:
+                    continue
+                day = checked_at - checked_at % DAY_MS
+                entry = totals.setdefault((day, columns['dataset_id'][i]), {
+                    'day': day, 'dataset_id': columns['dataset_id'][i], 'category': columns['category'][i],
+                    'checks': 0, 'up': 0, 'down': 0, 'latency_sum': 0.0, 'latency_count': 0
+                })
+                status = columns['status'][i]
+                entry['checks'] += 1
+                if status == STATUS_CODES['up']:
+                    entry['up'] += 1
+                    if columns['latency_ms'][i] is not None:
+                        entry['latency_sum'] += columns['latency_ms'][i]
+                        entry['latency_count'] += 1
+                elif status == STATUS_CODES['down']:
+                    entry['down'] += 1
+        return list(totals.values())
+
+    def _read_columns(self, file: Path) -> Dict[str, List[Any]]:
+        names = ['dataset_id', 'category', 'checked_at', 'status', 'latency_ms']
+        if file.name.endswith('.parquet'):
+            if pq is None:
+                raise RuntimeError(f"Leer {file.name} requiere el paquete 'pyarrow' instalado")
+            return pq.read_table(file, columns=names).to_pydict()
+        with gzip.open(file, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        return {name: data[name] for name in names}
+
+    def _rollup_duckdb(self, files: List[Path], since_ms: int, until_ms: int,
+                       dataset_id: Optional[str]) -> List[Dict[str, Any]]:
+        sources = ", ".join("'" + str(f).replace("'", "''") + "'" for f in files)
+        query = f"""
+            SELECT
+                checked_at - checked_at % {DAY_MS} AS day,
+                dataset_id,
+                any_value(category) AS category,
+                COUNT(*) AS checks,
+                COUNT(*) FILTER (WHERE status = {STATUS_CODES['up']}) AS up,
+                COUNT(*) FILTER (WHERE status = {STATUS_CODES['down']}) AS down,
+                COALESCE(SUM(latency_ms) FILTER (WHERE status = {STATUS_CODES['up']}), 0) AS latency_sum,
+                COUNT(latency_ms) FILTER (WHERE status = {STATUS_CODES['up']}) AS latency_count
+            FROM read_parquet([{sources}])
+            WHERE checked_at >= ? AND checked_at < ?
+        """
+        params: List[Any] = [since_ms, until_ms]
+        if dataset_id:
+            query += " AND dataset_id = ?"
+            params.append(dataset_id)
+        query += " GROUP BY 1, 2"
+        with duckdb.connect() as conn:
+            cursor = conn.execute(query, params)
+            names = [c[0] for c in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def stats(self) -> Dict[str, Any]:
+        files = self.files()
+        return {
+            'path': str(self.path),
+            'format': self.format,
+            'engine': self.engine,
+            'partitions': len(files),
+            'bytes': sum(f.stat().st_size for f in files),
+            'oldest': files[0].name.split('.', 1)[0] if files else None
+        }
@@ -16,8 +16,53 @@ from dataclasses import dataclass
 import json
 import logging
 
+from querystats import query_monitor
+
 logger = logging.getLogger(__name__)
 
+# Consultas de autenticación con nombre (se miden en query_monitor)
+AUTH_QUERIES = {
+    'api_key_by_hash': """
+        SELECT * FROM api_keys 
+        WHERE key_hash = ? AND is_active = 1
+    """,
+    'api_key_limits': """
+        SELECT rate_limit_per_hour, rate_limit_per_day 
+        FROM api_keys WHERE key_id = ?
+    """,
+    'api_usage_count': """
+        SELECT COUNT(*) FROM api_usage 
+        WHERE key_id = ? AND timestamp >= ?
+    """,
+    'api_usage_summary': """
+        SELECT 
+            COUNT(*) as total_requests,
+            AVG(response_time_ms) as avg_response_time,
+            MIN(timestamp) as first_request,
+            MAX(timestamp) as last_request
+        FROM api_usage 
+        WHERE key_id = ? AND timestamp >= ?
+    """,
+    'api_usage_top_endpoints': """
+        SELECT endpoint, COUNT(*) as count
+        FROM api_usage 
+        WHERE key_id = ? AND timestamp >= ?
+        GROUP BY endpoint
+        ORDER BY count DESC
+        LIMIT 10
+    """,
+    'api_usage_status_codes': """
+        SELECT status_code, COUNT(*) as count
+        FROM api_usage 
+        WHERE key_id = ? AND timestamp >= ?
+        GROUP BY status_code
+        ORDER BY count DESC
+    """,
+}
+
+# Se ejecutan en cada request autenticado: no deben recorrer api_keys ni api_usage completas
+HOT_AUTH_QUERIES = ('api_key_by_hash', 'api_key_limits', 'api_usage_count')
+
 @dataclass
 class APIKey:
     """Modelo para API Keys"""
@@ -53,6 +98,10 @@ class APIKeyManager:
     def __init__(self, db_path: str = "data/chile_data.db"):
         self.db_path = db_path
         self._init_auth_tables()
+        for name in HOT_AUTH_QUERIES:
+            query_monitor.register_hot(name)
+        for name in AUTH_QUERIES:
+            query_monitor.register_sensitive(name)
         
         # Configuración de tiers
         self.TIER_LIMITS = {
@@ -164,14 +213,10 @@ class APIKeyManager:
         
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT * FROM api_keys 
-                WHERE key_hash = ? AND is_active = 1
-            """, (key_hash,))
-            
-            row = cursor.fetchone()
-            if not row:
+            rows = query_monitor.run(conn, 'api_key_by_hash', AUTH_QUERIES['api_key_by_hash'], (key_hash,))
+            if not rows:
                 return None
+            row = rows[0]
             
             # Actualizar last_used
             conn.execute("""
@@ -203,33 +248,22 @@ class APIKeyManager:
         """
         with sqlite3.connect(self.db_path) as conn:
             # Obtener límites de la key
-            cursor = conn.execute("""
-                SELECT rate_limit_per_hour, rate_limit_per_day 
-                FROM api_keys WHERE key_id = ?
-            """, (key_id,))
-            
-            row = cursor.fetchone()
-            if not row:
+            rows = query_monitor.run(conn, 'api_key_limits', AUTH_QUERIES['api_key_limits'], (key_id,))
+            if not rows:
                 return False, {'error': 'API key not found'}
             
-            hour_limit, day_limit = row
+            hour_limit, day_limit = rows[0]
             now = datetime.now()
             
             # Contar requests en la última hora
             hour_ago = now - timedelta(hours=1)
-            cursor = conn.execute("""
-                SELECT COUNT(*) FROM api_usage 
-                WHERE key_id = ? AND timestamp >= ?
-            """, (key_id, hour_ago))
-            hour_count = cursor.fetchone()[0]
+            hour_count = query_monitor.run(conn, 'api_usage_count', AUTH_QUERIES['api_usage_count'],
+                                           (key_id, hour_ago))[0][0]
             
             # Contar requests en el último día
             day_ago = now - timedelta(days=1)
-            cursor = conn.execute("""
-                SELECT COUNT(*) FROM api_usage 
-                WHERE key_id = ? AND timestamp >= ?
-            """, (key_id, day_ago))
-            day_count = cursor.fetchone()[0]
+            day_count = query_monitor.run(conn, 'api_usage_count', AUTH_QUERIES['api_usage_count'],
+                                          (key_id, day_ago))[0][0]
             
             # Verificar límites
             hour_exceeded = hour_count >= hour_limit
@@ -246,6 +280,11 @@ class APIKeyManager:
                 'reset_time_day': (now + timedelta(days=1)).isoformat()
             }
     
+    def check_query_plans(self):
+        """Falla (QueryPlanError) si alguna consulta caliente de autenticación recorre una tabla completa"""
+        with sqlite3.connect(self.db_path) as conn:
+            query_monitor.verify(conn, AUTH_QUERIES)
+    
     def check_endpoint_permission(self, api_key: APIKey, endpoint: str) -> bool:
         """Verificar si la API key tiene permiso para el endpoint"""
         if '*' in api_key.allowed_endpoints:
@@ -275,40 +314,18 @@ class APIKeyManager:
             since = datetime.now() - timedelta(hours=hours)
             
             # Estadísticas generales
-            cursor = conn.execute("""
-                SELECT 
-                    COUNT(*) as total_requests,
-                    AVG(response_time_ms) as avg_response_time,
-                    MIN(timestamp) as first_request,
-                    MAX(timestamp) as last_request
-                FROM api_usage 
-                WHERE key_id = ? AND timestamp >= ?
-            """, (key_id, since))
-            
-            stats = dict(cursor.fetchone())
+            stats = dict(query_monitor.run(conn, 'api_usage_summary', AUTH_QUERIES['api_usage_summary'],
+                                           (key_id, since))[0])
             
             # Top endpoints
-            cursor = conn.execute("""
-                SELECT endpoint, COUNT(*) as count
-                FROM api_usage 
-                WHERE key_id = ? AND timestamp >= ?
-                GROUP BY endpoint
-                ORDER BY count DESC
-                LIMIT 10
-            """, (key_id, since))
-            
-            stats['top_endpoints'] = [dict(row) for row in cursor.fetchall()]
+            rows = query_monitor.run(conn, 'api_usage_top_endpoints', AUTH_QUERIES['api_usage_top_endpoints'],
+                                     (key_id, since))
+            stats['top_endpoints'] = [dict(row) for row in rows]
             
             # Códigos de status
-            cursor = conn.execute("""
-                SELECT status_code, COUNT(*) as count
-                FROM api_usage 
-                WHERE key_id = ? AND timestamp >= ?
-                GROUP BY status_code
-                ORDER BY count DESC
-            """, (key_id, since))
-            
-            stats['status_codes'] = [dict(row) for row in cursor.fetchall()]
+            rows = query_monitor.run(conn, 'api_usage_status_codes', AUTH_QUERIES['api_usage_status_codes'],
+                                     (key_id, since))
+            stats['status_codes'] = [dict(row) for row in rows]
             
             return stats
 
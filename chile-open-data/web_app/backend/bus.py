@@ -0,0 +1,134 @@
+# /web_app/backend/bus.py
+"""
+Bus de mensajes para distribuir eventos entre procesos del backend
+
+Con varios workers cada proceso atiende a sus propios clientes WebSocket y
+mantiene su propio estado en memoria (notificaciones, snapshot de conexión).
+Los eventos se publican una sola vez en el bus y cada worker los recibe y los
+aplica localmente. Los mensajes deben ser serializables a JSON.
+"""
+
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[Dict[str, Any]], None]
+
+
+class MessageBus(ABC):
+    """Interfaz común de los buses de mensajes"""
+
+    @abstractmethod
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel: str, callback: MessageHandler) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class LocalMessageBus(MessageBus):
+    """Bus en memoria para un solo proceso (y para pruebas): entrega síncrona"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[MessageHandler]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, []))
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"Error en suscriptor del canal {channel}: {e}")
+
+    def subscribe(self, channel: str, callback: MessageHandler) -> None:
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+
+class RedisMessageBus(MessageBus):
+    """Bus sobre Redis pub/sub (o cualquier servidor compatible)"""
+
+    def __init__(self, url: str, prefix: str = "chile_data"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("MESSAGE_BUS_URL requiere el paquete 'redis' instalado") from e
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._subscribers: Dict[str, List[MessageHandler]] = {}
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _channel(self, channel: str) -> str:
+        return f"{self.prefix}:{channel}"
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        self._client.publish(self._channel(channel), json.dumps(message, default=str))
+
+    def subscribe(self, channel: str, callback: MessageHandler) -> None:
+        with self._lock:
+            first = channel not in self._subscribers
+            self._subscribers.setdefault(channel, []).append(callback)
+            if first:
+                self._pubsub.subscribe(**{self._channel(channel): self._dispatch})
+            if self._listener is None:
+                self._listener = self._pubsub.run_in_thread(sleep_time=0.5, daemon=True)
+
+    def _dispatch(self, raw: Dict[str, Any]):
+        channel = raw['channel']
+        if isinstance(channel, bytes):
+            channel = channel.decode('utf-8')
+        channel = channel[len(self.prefix) + 1:]
+        try:
+            message = json.loads(raw['data'])
+        except (TypeError, ValueError) as e:
+            logger.error(f"Mensaje inválido en el canal {channel}: {e}")
+            return
+        for callback in list(self._subscribers.get(channel, [])):
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"Error en suscriptor del canal {channel}: {e}")
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        self._pubsub.close()
+
+
+def create_message_bus(url: Optional[str] = None) -> MessageBus:
+    """Crea el bus adecuado para la URL (vacía = bus local en memoria)"""
+    if not url or url == "local":
+        return LocalMessageBus()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisMessageBus(url)
+    raise ValueError(f"URL de bus de mensajes no soportada: {url}")
+
+
+# Instancia global del bus
+message_bus: MessageBus = LocalMessageBus()
+
+
+def init_message_bus(url: Optional[str] = None) -> MessageBus:
+    """Inicializa el bus global"""
+    global message_bus
+    message_bus = create_message_bus(url)
+    return message_bus
+
+
+def get_message_bus() -> MessageBus:
+    """Obtiene el bus global"""
+    return message_bus
@@ -0,0 +1,121 @@
+# /web_app/backend/leader.py
+"""
+Elección de líder entre workers mediante un lease en SQLite
+
+Solo el proceso que posee el lease ejecuta el monitor de datasets. El líder
+renueva el lease periódicamente (heartbeat); si deja de hacerlo, cualquier
+otro worker puede tomarlo cuando expira.
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """Lease con expiración guardado como una fila de SQLite"""
+
+    def __init__(self, db_path, name: str = "dataset_monitor", ttl: float = 30.0,
+                 holder_id: Optional[str] = None):
+        self.db_path = db_path
+        self.name = name
+        self.ttl = ttl
+        self.holder_id = holder_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._init_table()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None para controlar la transacción con BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+
+    def _init_table(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leader_lease (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT,
+                    acquired_at REAL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+
+    def try_acquire(self) -> bool:
+        """Toma o renueva el lease; devuelve True si este proceso es el líder"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR IGNORE INTO leader_lease (name, holder, acquired_at, expires_at) VALUES (?, NULL, NULL, 0)",
+                (self.name,)
+            )
+            cursor = conn.execute("""
+                UPDATE leader_lease
+                SET holder = ?,
+                    acquired_at = CASE WHEN holder = ? THEN acquired_at ELSE ? END,
+                    expires_at = ?
+                WHERE name = ? AND (holder = ? OR expires_at < ?)
+            """, (self.holder_id, self.holder_id, now, now + self.ttl,
+                  self.name, self.holder_id, now))
+            acquired = cursor.rowcount == 1
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.error(f"Error renovando lease de líder: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            # Ante la duda se deja de actuar como líder hasta poder renovar
+            acquired = False
+        finally:
+            conn.close()
+
+        if acquired != self.is_leader:
+            logger.info(f"{'Adquirido' if acquired else 'Perdido'} lease de líder '{self.name}' ({self.holder_id})")
+        self.is_leader = acquired
+        return acquired
+
+    def release(self):
+        """Libera el lease para que otro worker lo tome sin esperar la expiración"""
+        if not self.is_leader:
+            return
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE leader_lease SET expires_at = 0 WHERE name = ? AND holder = ?",
+                (self.name, self.holder_id)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Error liberando lease de líder: {e}")
+        finally:
+            conn.close()
+        self.is_leader = False
+
+    def get_info(self) -> Dict:
+        """Estado actual del lease"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute(
+                "SELECT holder, acquired_at, expires_at FROM leader_lease WHERE name = ?",
+                (self.name,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return {
+            'name': self.name,
+            'holder_id': self.holder_id,
+            'is_leader': self.is_leader,
+            'current_holder': row['holder'] if row and row['expires_at'] >= time.time() else None,
+            'expires_at': row['expires_at'] if row else None,
+            'ttl': self.ttl
+        }
@@ -6,9 +6,353 @@ Modelos de base de datos para la Biblioteca de Datos Abiertos de Chile
 from datetime import datetime, timezone
 import sqlite3
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
 from dataclasses import dataclass
 import json
+import logging
+import threading
+
+from querystats import query_monitor
+from sketches import LatencySketch
+
+logger = logging.getLogger(__name__)
+
+# Códigos enteros del estado de un chequeo en check_history
+STATUS_CODES = {'unknown': 0, 'up': 1, 'down': 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+# Filas de dataset_status legado que se migran por transacción
+HISTORY_MIGRATION_BATCH = 5000
+
+# Historial particionado por día (check_history_YYYYMMDD); la retención
+# elimina particiones completas en vez de borrar fila por fila
+HISTORY_PARTITION_PREFIX = "check_history_"
+UNPARTITIONED_HISTORY = "check_history_unpartitioned"
+HISTORY_RETENTION_DAYS = 7
+# SQLite admite hasta 500 SELECT por compuesto (SQLITE_MAX_COMPOUND_SELECT)
+HISTORY_VIEW_CHUNK = 400
+MINUTE_MS = 60 * 1000
+HOUR_MS = 3600 * 1000
+# Los sketches horarios de latencia pesan poco: se conservan más que el historial crudo
+LATENCY_SKETCH_RETENTION_DAYS = 400
+# Páginas libres que devuelve cada pasada de mantenimiento (PRAGMA incremental_vacuum(N))
+INCREMENTAL_VACUUM_PAGES = 10000
+# Intervalos de estado (una fila por transición): mismo horizonte que los sketches
+STATUS_INTERVAL_RETENTION_DAYS = 400
+# Ventana de las latencias para timeouts adaptativos: acota la lectura a las particiones recientes
+RECENT_LATENCY_HOURS = 24
+
+# Columnas de cada partición (y de latest_checks) además de id y dataset_key
+HISTORY_FIELDS = """
+                    checked_at INTEGER NOT NULL,
+                    status INTEGER NOT NULL,
+                    http_code INTEGER,
+                    latency_ms REAL,
+                    error TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_changed INTEGER,
+                    dns_ms REAL,
+                    connect_ms REAL,
+                    tls_ms REAL,
+                    ttfb_ms REAL
+"""
+HISTORY_INSERT_COLUMNS = (
+    'id', 'dataset_key', 'checked_at', 'status', 'http_code', 'latency_ms', 'error',
+    'etag', 'last_modified', 'content_changed', 'dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms'
+)
+
+# Columnas de un chequeo en el formato original (texto) de dataset_status;
+# se anteponen el id de la fila y/o el id del dataset según la consulta
+HISTORY_COLUMNS = """
+    d.name AS name,
+    d.category AS category,
+    d.url AS url,
+    CASE h.status WHEN 1 THEN 'up' WHEN 2 THEN 'down' ELSE 'unknown' END AS status,
+    h.http_code AS http_code,
+    h.latency_ms AS latency_ms,
+    h.error AS error,
+    strftime('%Y-%m-%d %H:%M:%f', h.checked_at / 1000.0, 'unixepoch') || '+00:00' AS checked_at,
+    h.etag AS etag,
+    h.last_modified AS last_modified,
+    h.content_changed AS content_changed,
+    h.dns_ms AS dns_ms,
+    h.connect_ms AS connect_ms,
+    h.tls_ms AS tls_ms,
+    h.ttfb_ms AS ttfb_ms
+"""
+HISTORY_VIEW_COLUMNS = "h.id AS id, k.id AS dataset_id," + HISTORY_COLUMNS
+LATEST_STATUS_COLUMNS = "k.id AS id," + HISTORY_COLUMNS
+HISTORY_JOINS = """
+    JOIN dataset_keys k ON k.key = h.dataset_key
+    JOIN datasets d ON d.id = k.id
+"""
+
+UP = STATUS_CODES['up']
+DOWN = STATUS_CODES['down']
+STATUS_NAME_SQL = f"CASE h.status WHEN {UP} THEN 'up' WHEN {DOWN} THEN 'down' ELSE 'unknown' END"
+# Conversión de las columnas de dataset_status_legacy (texto) al formato normalizado
+LEGACY_CHECKED_AT_SQL = "CAST(ROUND((julianday(l.checked_at) - 2440587.5) * 86400000) AS INTEGER)"
+LEGACY_STATUS_SQL = f"CASE l.status WHEN 'up' THEN {UP} WHEN 'down' THEN {DOWN} ELSE 0 END"
+
+# Sentencias preparadas que conserva cada conexión de lectura
+QUERY_STATEMENT_CACHE = 256
+
+# Chequeos por día y dataset (mismo formato que HistoryArchive.daily_rollup)
+HISTORY_ROLLUP_SELECT = f"""
+        SELECT
+            h.checked_at - h.checked_at % 86400000 AS day,
+            k.id AS dataset_id,
+            MAX(d.category) AS category,
+            COUNT(*) AS checks,
+            SUM(h.status = {UP}) AS up,
+            SUM(h.status = {DOWN}) AS down,
+            COALESCE(SUM(CASE WHEN h.status = {UP} THEN h.latency_ms END), 0) AS latency_sum,
+            COUNT(CASE WHEN h.status = {UP} THEN h.latency_ms END) AS latency_count
+        FROM check_history h {HISTORY_JOINS}
+"""
+# Columnas de minute_rollups calculadas desde chequeos (h + HISTORY_JOINS)
+MINUTE_ROLLUP_SELECT = f"""
+            h.checked_at - h.checked_at % {MINUTE_MS},
+            d.category,
+            COUNT(*),
+            SUM(h.status = {UP}),
+            SUM(h.status = {DOWN}),
+            COALESCE(SUM(CASE WHEN h.status = {UP} THEN h.latency_ms END), 0),
+            COUNT(CASE WHEN h.status = {UP} THEN h.latency_ms END)
+"""
+LATENCY_PHASES_SELECT = f"""
+        SELECT k.id as dataset_id, d.name as name, d.category as category,
+               h.latency_ms, h.dns_ms, h.connect_ms, h.tls_ms, h.ttfb_ms
+        FROM check_history h {HISTORY_JOINS}
+"""
+
+# Consultas de lectura con nombre. El SQL es constante (ventanas como epoch en ms
+# con parámetros enlazados), así cada conexión lo prepara una sola vez y los
+# rangos sobre checked_at usan los índices de las particiones.
+# Las consultas de un dataset reciben su clave entera (Database.dataset_key):
+# con ella el planificador usa el índice (dataset_key, checked_at) de cada partición.
+QUERIES: Dict[str, str] = {
+    'dataset_key': "SELECT key FROM dataset_keys WHERE id = ?",
+    'dataset_names': """
+        SELECT k.key, k.id, d.name, d.category
+        FROM dataset_keys k JOIN datasets d ON d.id = k.id
+    """,
+    'latest_status': f"""
+        SELECT {LATEST_STATUS_COLUMNS}, 1 as rn
+        FROM latest_checks h {HISTORY_JOINS}
+    """,
+    'latest_dataset_status': f"""
+        SELECT {LATEST_STATUS_COLUMNS}
+        FROM latest_checks h {HISTORY_JOINS}
+        WHERE k.id = ?
+    """,
+    'dataset_history': f"""
+        SELECT {HISTORY_VIEW_COLUMNS}
+        FROM check_history h {HISTORY_JOINS}
+        WHERE h.dataset_key = ? AND h.checked_at >= ?
+        ORDER BY h.checked_at DESC
+    """,
+    # Columnas crudas de la ventana (sin joins) para cargarlas como arrays
+    'history_window': """
+        SELECT h.dataset_key, h.checked_at, h.status, h.latency_ms
+        FROM check_history h
+        WHERE h.checked_at >= ?
+    """,
+    # Varios datasets en una lectura: claves como arreglo JSON, búsqueda por (dataset_key, checked_at)
+    'datasets_window': """
+        SELECT h.dataset_key, h.checked_at, h.status, h.latency_ms
+        FROM check_history h
+        WHERE h.dataset_key IN (SELECT value FROM json_each(?)) AND h.checked_at >= ?
+    """,
+    'recent_latencies': f"""
+        WITH recent AS MATERIALIZED (
+            SELECT dataset_key, checked_at, latency_ms
+            FROM check_history
+            WHERE checked_at >= ? AND status = {UP} AND latency_ms IS NOT NULL
+        )
+        SELECT k.id, h.latency_ms FROM (
+            SELECT
+                dataset_key,
+                latency_ms,
+                ROW_NUMBER() OVER (PARTITION BY dataset_key ORDER BY checked_at DESC) as rn
+            FROM recent
+        ) h
+        JOIN dataset_keys k ON k.key = h.dataset_key
+        WHERE h.rn <= ?
+    """,
+    'availability_totals': f"""
+        SELECT
+            COUNT(DISTINCT h.dataset_key) as total_datasets,
+            COUNT(*) as total_checks,
+            SUM(h.status = {UP}) as successful_checks,
+            AVG(h.latency_ms) as avg_latency
+        FROM check_history h
+        WHERE h.checked_at >= ?
+    """,
+    'availability_by_category': f"""
+        SELECT
+            d.category as category,
+            COUNT(DISTINCT h.dataset_key) as dataset_count,
+            COUNT(*) as check_count,
+            SUM(h.status = {UP}) as successful_count,
+            AVG(h.latency_ms) as avg_latency
+        FROM check_history h {HISTORY_JOINS}
+        WHERE h.checked_at >= ?
+        GROUP BY d.category
+        ORDER BY d.category
+    """,
+    'history_rollup': HISTORY_ROLLUP_SELECT + """
+        WHERE h.checked_at >= ?
+        GROUP BY 1, 2
+    """,
+    'history_rollup_dataset': HISTORY_ROLLUP_SELECT + """
+        WHERE h.dataset_key = ? AND h.checked_at >= ?
+        GROUP BY 1, 2
+    """,
+    'system_totals': f"""
+        SELECT
+            COUNT(DISTINCT h.dataset_key) as total_datasets,
+            COUNT(*) as total_checks,
+            SUM(h.status = {UP}) as successful_checks,
+            SUM(h.status = {DOWN}) as failed_checks,
+            AVG(h.latency_ms) as avg_latency,
+            MAX(h.latency_ms) as max_latency,
+            MIN(h.latency_ms) as min_latency
+        FROM check_history h
+        WHERE h.checked_at >= ?
+    """,
+    # Último chequeo de cada dataset dentro de la ventana (columnas del MAX)
+    'window_latest_status': f"""
+        SELECT k.id as dataset_id, {STATUS_NAME_SQL} as status, d.category as category
+        FROM (
+            SELECT dataset_key, status, MAX(checked_at) AS checked_at
+            FROM check_history
+            WHERE checked_at >= ?
+            GROUP BY +dataset_key
+        ) h {HISTORY_JOINS}
+    """,
+    'category_analytics': f"""
+        SELECT
+            d.category as category,
+            COUNT(DISTINCT h.dataset_key) as total_datasets,
+            COUNT(*) as total_checks,
+            SUM(h.status = {UP}) as successful_checks,
+            AVG(h.latency_ms) as avg_latency
+        FROM check_history h {HISTORY_JOINS}
+        WHERE h.checked_at >= ? AND d.category IS NOT NULL
+        GROUP BY d.category
+        ORDER BY total_datasets DESC
+    """,
+    # Agregados por minuto y categoría desde since (minuto inclusive)
+    'minute_rollups': """
+        SELECT minute_ms, category, checks, up, down, latency_sum, latency_count
+        FROM minute_rollups
+        WHERE minute_ms >= ?
+    """,
+    # Los mismos agregados, solo de los chequeos con id en (después, hasta] (ids de history_sequence)
+    'minute_rollups_after': f"""
+        SELECT {MINUTE_ROLLUP_SELECT}
+        FROM check_history h {HISTORY_JOINS}
+        WHERE h.id > ? AND h.id <= ? AND h.checked_at >= ?
+        GROUP BY 1, 2
+    """,
+    'latency_phases': LATENCY_PHASES_SELECT + f"""
+        WHERE h.checked_at >= ? AND h.status = {UP} AND h.latency_ms IS NOT NULL
+    """,
+    'latency_phases_dataset': LATENCY_PHASES_SELECT + f"""
+        WHERE h.dataset_key = ? AND h.checked_at >= ? AND h.status = {UP} AND h.latency_ms IS NOT NULL
+    """,
+    # Sketches horarios (la hora parcial del inicio de la ventana se incluye completa)
+    'latency_sketches': """
+        SELECT k.id AS dataset_id, d.category AS category, s.sketch AS sketch
+        FROM latency_sketches s
+        JOIN dataset_keys k ON k.key = s.dataset_key
+        JOIN datasets d ON d.id = k.id
+        WHERE s.hour_ms >= ?
+    """,
+    'latency_sketches_dataset': """
+        SELECT k.id AS dataset_id, d.category AS category, s.sketch AS sketch
+        FROM latency_sketches s
+        JOIN dataset_keys k ON k.key = s.dataset_key
+        JOIN datasets d ON d.id = k.id
+        WHERE s.dataset_key = ? AND s.hour_ms >= ?
+    """,
+    # Intervalos de estado que se cruzan con la ventana (un intervalo abierto termina en su último chequeo)
+    'status_intervals': """
+        SELECT k.id AS dataset_id, d.name AS name, d.category AS category,
+               i.status AS status, i.start_ms AS start_ms, i.end_ms AS end_ms, i.checks AS checks
+        FROM status_intervals i
+        JOIN dataset_keys k ON k.key = i.dataset_key
+        JOIN datasets d ON d.id = k.id
+        WHERE i.end_ms >= ?
+    """,
+    'status_intervals_dataset': """
+        SELECT k.id AS dataset_id, d.name AS name, d.category AS category,
+               i.status AS status, i.start_ms AS start_ms, i.end_ms AS end_ms, i.checks AS checks
+        FROM status_intervals i
+        JOIN dataset_keys k ON k.key = i.dataset_key
+        JOIN datasets d ON d.id = k.id
+        WHERE i.dataset_key = ? AND i.end_ms >= ?
+    """,
+    'top_datasets': f"""
+        SELECT
+            k.id as dataset_id,
+            d.name as name,
+            d.category as category,
+            COUNT(*) as total_checks,
+            SUM(h.status = {UP}) as successful_checks,
+            AVG(h.latency_ms) as avg_latency
+        FROM check_history h {HISTORY_JOINS}
+        WHERE h.checked_at >= ?
+        GROUP BY +h.dataset_key
+        HAVING total_checks >= 3
+        ORDER BY (successful_checks * 1.0 / total_checks) DESC, avg_latency ASC NULLS LAST
+        LIMIT ?
+    """,
+    'problematic_datasets': f"""
+        SELECT
+            k.id as dataset_id,
+            d.name as name,
+            d.category as category,
+            COUNT(*) as total_checks,
+            SUM(h.status = {DOWN}) as failed_checks,
+            AVG(h.latency_ms) as avg_latency
+        FROM check_history h {HISTORY_JOINS}
+        WHERE h.checked_at >= ?
+        GROUP BY +h.dataset_key
+        HAVING total_checks >= 3
+        ORDER BY (failed_checks * 1.0 / total_checks) DESC, avg_latency DESC
+        LIMIT ?
+    """,
+}
+
+# Consultas que corren en cada ciclo o request: el guardián de planes exige que no
+# recorran tablas completas. latest_status lee todos los datasets a propósito.
+HOT_QUERIES: Dict[str, tuple] = {name: () for name in QUERIES}
+HOT_QUERIES['latest_status'] = ('dataset_keys', 'latest_checks')
+HOT_QUERIES['dataset_names'] = ('dataset_keys', 'datasets')
+
+
+def to_epoch_ms(value) -> int:
+    """Convierte un datetime (naive = UTC) o un string ISO a epoch en milisegundos"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def since_epoch_ms(hours: float = 0, days: float = 0) -> int:
+    """Inicio (epoch ms) de una ventana que termina ahora"""
+    return to_epoch_ms(datetime.now(timezone.utc)) - int((hours * 3600 + days * 86400) * 1000)
+
+
+def partition_for(ms: int) -> Tuple[str, int, int]:
+    """Nombre y rango [inicio, fin) en epoch ms de la partición diaria (UTC) que contiene `ms`"""
+    day = datetime.fromtimestamp(ms / 1000, tz=timezone.utc).date()
+    start = to_epoch_ms(datetime(day.year, day.month, day.day))
+    return f"{HISTORY_PARTITION_PREFIX}{day:%Y%m%d}", start, start + 86400 * 1000
 
 
 @dataclass
@@ -23,6 +367,13 @@ class DatasetStatus:
     latency_ms: Optional[float]
     error: Optional[str]
     checked_at: datetime
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_changed: Optional[bool] = None
+    dns_ms: Optional[float] = None
+    connect_ms: Optional[float] = None
+    tls_ms: Optional[float] = None
+    ttfb_ms: Optional[float] = None
     
     def to_dict(self) -> Dict:
         return {
@@ -34,37 +385,52 @@ class DatasetStatus:
             'http_code': self.http_code,
             'latency_ms': self.latency_ms,
             'error': self.error,
-            'checked_at': self.checked_at.isoformat()
+            'checked_at': self.checked_at.isoformat(),
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'content_changed': self.content_changed,
+            'dns_ms': self.dns_ms,
+            'connect_ms': self.connect_ms,
+            'tls_ms': self.tls_ms,
+            'ttfb_ms': self.ttfb_ms
         }
 
 
 class Database:
     """Manejador de base de datos SQLite"""
     
-    def __init__(self, db_path: str = "data/chile_data.db"):
+    def __init__(self, db_path: str = "data/chile_data.db", archive=None):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Archivo frío (archive.HistoryArchive) donde se exportan las particiones antes de eliminarlas
+        self.archive = archive
+        # dataset id (texto) -> clave entera en dataset_keys
+        self._dataset_keys: Dict[str, int] = {}
+        # Particiones diarias ya creadas (evita consultar el catálogo en cada escritura)
+        self._partitions: Set[str] = set()
+        # Conexión de lectura por hilo: conserva su caché de sentencias preparadas
+        self._readers = threading.local()
+        for name, allowed_scans in HOT_QUERIES.items():
+            query_monitor.register_hot(name, allowed_scans)
         self._init_db()
+        if self._has_pending_migration():
+            # Migración en línea: se copia por lotes mientras la app sigue escribiendo.
+            # El paso a auto_vacuum INCREMENTAL queda para el próximo arranque
+            threading.Thread(target=self.migrate_legacy_history, daemon=True,
+                             name="history-migration").start()
+        else:
+            # Al arrancar, antes del scheduler: el VACUUM completo no compite con el monitor
+            if self._enable_incremental_vacuum():
+                logger.info("Base convertida a auto_vacuum INCREMENTAL (VACUUM completo al arrancar)")
     
     def _init_db(self):
         """Inicializa las tablas de la base de datos"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS dataset_status (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    dataset_id TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    category TEXT NOT NULL,
-                    url TEXT NOT NULL,
-                    status TEXT NOT NULL,
-                    http_code INTEGER,
-                    latency_ms REAL,
-                    error TEXT,
-                    checked_at TIMESTAMP NOT NULL,
-                    FOREIGN KEY (dataset_id) REFERENCES datasets (id)
-                )
-            """)
-            
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+                # Base nueva: el espacio de las particiones eliminadas se libera con incremental_vacuum
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            # Un solo worker a la vez crea tablas, particiones y vistas
+            conn.execute("BEGIN IMMEDIATE")
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS datasets (
                     id TEXT PRIMARY KEY,
@@ -91,149 +457,697 @@ class Database:
                 )
             """)
             
-            # Índices para mejor performance
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_dataset_status_dataset_id ON dataset_status (dataset_id)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_dataset_status_checked_at ON dataset_status (checked_at)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_dataset_status_status ON dataset_status (status)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_dataset_status_category ON dataset_status (category)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_dataset_status_dataset_checked ON dataset_status (dataset_id, checked_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS circuit_breakers (
+                    key TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    failures INTEGER NOT NULL DEFAULT 0,
+                    opened_count INTEGER NOT NULL DEFAULT 0,
+                    next_probe_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    updated_at REAL NOT NULL DEFAULT 0
+                )
+            """)
+            
+            # Estado de los detectores de degradación (services.detectors) por dataset
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS anomaly_detectors (
+                    dataset_id TEXT PRIMARY KEY,
+                    samples INTEGER NOT NULL DEFAULT 0,
+                    checks INTEGER NOT NULL DEFAULT 0,
+                    latency_mean REAL NOT NULL DEFAULT 0,
+                    latency_var REAL NOT NULL DEFAULT 0,
+                    latency_cusum REAL NOT NULL DEFAULT 0,
+                    latency_degraded BOOLEAN NOT NULL DEFAULT 0,
+                    failure_base REAL NOT NULL DEFAULT 0,
+                    failure_rate REAL NOT NULL DEFAULT 0,
+                    failure_cusum REAL NOT NULL DEFAULT 0,
+                    failure_degraded BOOLEAN NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL DEFAULT 0
+                )
+            """)
+            
+            # Clave entera estable para cada dataset (datasets.id es texto)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dataset_keys (
+                    key INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE REFERENCES datasets (id)
+                )
+            """)
+            
+            # Particiones diarias del historial (check_history es una vista sobre ellas)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS history_partitions (
+                    name TEXT PRIMARY KEY,
+                    start_ms INTEGER NOT NULL,
+                    end_ms INTEGER NOT NULL
+                )
+            """)
+            
+            # Secuencia global de ids: las filas conservan un id único entre particiones
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS history_sequence (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    seq INTEGER NOT NULL
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO history_sequence (id, seq) VALUES (0, 0)")
+            
+            # Último chequeo de cada dataset, para no recorrer las particiones
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS latest_checks (
+                    dataset_key INTEGER PRIMARY KEY REFERENCES dataset_keys (key),
+                    id INTEGER NOT NULL,
+                    {HISTORY_FIELDS}
+                )
+            """)
+            
+            # Sketch de cuantiles de latencia (sketches.LatencySketch) por dataset y hora
+            backfill_sketches = not self._table_exists(conn, 'latency_sketches')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS latency_sketches (
+                    hour_ms INTEGER NOT NULL,
+                    dataset_key INTEGER NOT NULL REFERENCES dataset_keys (key),
+                    sketch TEXT NOT NULL,
+                    PRIMARY KEY (hour_ms, dataset_key)
+                ) WITHOUT ROWID
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_latency_sketches_dataset ON latency_sketches (dataset_key, hour_ms)"
+            )
+            
+            # Períodos continuos en un mismo estado: [start_ms, end_ms] por dataset. El último
+            # de cada dataset está abierto y termina en su chequeo más reciente
+            rebuild_intervals = not self._table_exists(conn, 'status_intervals')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS status_intervals (
+                    dataset_key INTEGER NOT NULL REFERENCES dataset_keys (key),
+                    start_ms INTEGER NOT NULL,
+                    end_ms INTEGER NOT NULL,
+                    status INTEGER NOT NULL,
+                    checks INTEGER NOT NULL DEFAULT 1,
+                    PRIMARY KEY (dataset_key, start_ms)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_status_intervals_end ON status_intervals (end_ms)")
+            
+            # Chequeos por minuto y categoría: el timeline se reagrupa desde aquí a cualquier intervalo
+            backfill_rollups = not self._table_exists(conn, 'minute_rollups')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS minute_rollups (
+                    minute_ms INTEGER NOT NULL,
+                    category TEXT NOT NULL,
+                    checks INTEGER NOT NULL,
+                    up INTEGER NOT NULL,
+                    down INTEGER NOT NULL,
+                    latency_sum REAL NOT NULL,
+                    latency_count INTEGER NOT NULL,
+                    PRIMARY KEY (minute_ms, category)
+                ) WITHOUT ROWID
+            """)
+            
+            self._migrate_dataset_status(conn)
+            self._migrate_unpartitioned_history(conn)
+            self._ensure_partition(conn, to_epoch_ms(datetime.now(timezone.utc)))
+            self._create_history_views(conn)
+            if backfill_sketches:
+                self._backfill_latency_sketches(conn)
+            if rebuild_intervals:
+                self._rebuild_status_intervals(conn)
+            if backfill_rollups:
+                for (name,) in conn.execute("SELECT name FROM history_partitions ORDER BY start_ms").fetchall():
+                    self._add_minute_rollups(conn, name)
+            
+            # Índices para mejor performance (cada partición tiene los suyos)
             conn.execute("CREATE INDEX IF NOT EXISTS idx_datasets_category ON datasets (category)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_datasets_active ON datasets (active)")
             
             conn.commit()
     
+    def _migrate_dataset_status(self, conn: sqlite3.Connection):
+        """Prepara la migración de dataset_status (tabla de texto) al historial normalizado
+        
+        La tabla original se renombra a dataset_status_legacy y en su lugar queda
+        una vista con las mismas columnas. Las filas se copian después por lotes
+        (`migrate_legacy_history`), sin bloquear el arranque.
+        """
+        kind = conn.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'dataset_status'"
+        ).fetchone()
+        if kind and kind[0] == 'table':
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(dataset_status)")}
+            for column, ddl in (
+                ('etag', 'TEXT'),
+                ('last_modified', 'TEXT'),
+                ('content_changed', 'BOOLEAN'),
+                ('dns_ms', 'REAL'),
+                ('connect_ms', 'REAL'),
+                ('tls_ms', 'REAL'),
+                ('ttfb_ms', 'REAL'),
+            ):
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE dataset_status ADD COLUMN {column} {ddl}")
+            for index in ('dataset_id', 'checked_at', 'status', 'category', 'dataset_checked'):
+                conn.execute(f"DROP INDEX IF EXISTS idx_dataset_status_{index}")
+            conn.execute("ALTER TABLE dataset_status RENAME TO dataset_status_legacy")
+            # Los datasets que solo existen en el historial quedan registrados como inactivos
+            conn.execute("""
+                INSERT OR IGNORE INTO datasets (id, name, category, url, active)
+                SELECT dataset_id, name, category, url, 0
+                FROM dataset_status_legacy
+                GROUP BY dataset_id
+            """)
+            conn.execute("INSERT OR IGNORE INTO dataset_keys (id) SELECT id FROM datasets")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_dataset_status_legacy_id ON dataset_status_legacy (id)")
+            conn.execute("DROP VIEW IF EXISTS dataset_status")
+    
+    def _migrate_unpartitioned_history(self, conn: sqlite3.Connection):
+        """Aparta la tabla check_history sin particionar para copiarla por lotes a las particiones"""
+        kind = conn.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'check_history'"
+        ).fetchone()
+        if not kind or kind[0] != 'table':
+            return
+        # Las vistas se recrean después; si no, RENAME reescribiría sus referencias
+        conn.execute("DROP VIEW IF EXISTS dataset_status")
+        conn.execute(f"ALTER TABLE check_history RENAME TO {UNPARTITIONED_HISTORY}")
+        conn.execute(f"""
+            UPDATE history_sequence
+            SET seq = MAX(seq, (SELECT COALESCE(MAX(id), 0) FROM {UNPARTITIONED_HISTORY}))
+        """)
+        # El último chequeo de cada dataset queda disponible antes de migrar las filas
+        conn.execute(f"""
+            INSERT OR IGNORE INTO latest_checks ({', '.join(HISTORY_INSERT_COLUMNS)})
+            SELECT id, dataset_key, MAX(checked_at), {', '.join(HISTORY_INSERT_COLUMNS[3:])}
+            FROM {UNPARTITIONED_HISTORY}
+            GROUP BY dataset_key
+        """)
+    
+    def _backfill_latency_sketches(self, conn: sqlite3.Connection):
+        """Construye los sketches de las particiones existentes (el historial por migrar se agrega al copiarse)"""
+        for (name,) in conn.execute("SELECT name FROM history_partitions ORDER BY start_ms").fetchall():
+            rows = conn.execute(f"""
+                SELECT id, dataset_key, checked_at, status, http_code, latency_ms
+                FROM {name} WHERE status = ? AND latency_ms IS NOT NULL
+            """, (UP,)).fetchall()
+            self._add_to_sketches(conn, rows)
+    
+    def _rebuild_status_intervals(self, conn: sqlite3.Connection):
+        """Reconstruye los intervalos desde el historial completo (incluye el que falta migrar)
+        
+        check_history ya incluye la tabla sin particionar; las filas de
+        dataset_status_legacy se convierten al vuelo.
+        """
+        conn.execute("DELETE FROM status_intervals")
+        sql = "SELECT dataset_key, checked_at, status FROM check_history"
+        if self._has_legacy_history(conn):
+            sql += f"""
+                UNION ALL
+                SELECT k.key, {LEGACY_CHECKED_AT_SQL}, {LEGACY_STATUS_SQL}
+                FROM dataset_status_legacy l
+                JOIN dataset_keys k ON k.id = l.dataset_id
+                WHERE julianday(l.checked_at) IS NOT NULL
+            """
+        intervals = []
+        current = None
+        for key, checked_at, status in conn.execute(sql + " ORDER BY 1, 2"):
+            if current and current[0] == key and current[3] == status:
+                current[2] = checked_at
+                current[4] += 1
+                continue
+            if current and current[0] == key:
+                # El estado anterior dura hasta que se observa el nuevo
+                current[2] = checked_at
+            if current:
+                intervals.append(tuple(current))
+            current = [key, checked_at, checked_at, status, 1]
+        if current:
+            intervals.append(tuple(current))
+        conn.executemany(
+            "INSERT INTO status_intervals (dataset_key, start_ms, end_ms, status, checks) VALUES (?, ?, ?, ?, ?)",
+            intervals
+        )
+    
+    def _record_transition(self, conn: sqlite3.Connection, key: int, checked_at: int, status: int):
+        """Extiende el intervalo abierto del dataset o, si cambió el estado, lo cierra y abre otro"""
+        last = conn.execute("""
+            SELECT start_ms, end_ms, status FROM status_intervals
+            WHERE dataset_key = ? ORDER BY start_ms DESC LIMIT 1
+        """, (key,)).fetchone()
+        if last is not None and checked_at < last[1]:
+            # Chequeo más viejo que el último registrado: no altera los intervalos
+            return
+        if last is not None:
+            conn.execute("""
+                UPDATE status_intervals SET end_ms = ?, checks = checks + ?
+                WHERE dataset_key = ? AND start_ms = ?
+            """, (checked_at, 1 if last[2] == status else 0, key, last[0]))
+            if last[2] == status:
+                return
+        conn.execute(
+            "INSERT OR IGNORE INTO status_intervals (dataset_key, start_ms, end_ms, status) VALUES (?, ?, ?, ?)",
+            (key, checked_at, checked_at, status)
+        )
+    
+    def _add_minute_rollups(self, conn: sqlite3.Connection, partition: str,
+                            where: str = "WHERE true", params: tuple = ()):
+        """Suma a minute_rollups los chequeos de una partición (filtrados por `where`)"""
+        conn.execute(f"""
+            INSERT INTO minute_rollups (minute_ms, category, checks, up, down, latency_sum, latency_count)
+            SELECT {MINUTE_ROLLUP_SELECT}
+            FROM {partition} h {HISTORY_JOINS}
+            {where}
+            GROUP BY 1, 2
+            ON CONFLICT (minute_ms, category) DO UPDATE SET
+                checks = checks + excluded.checks,
+                up = up + excluded.up,
+                down = down + excluded.down,
+                latency_sum = latency_sum + excluded.latency_sum,
+                latency_count = latency_count + excluded.latency_count
+        """, params)
+    
+    def _add_to_sketches(self, conn: sqlite3.Connection, rows: List[tuple]):
+        """Suma las latencias de chequeos exitosos al sketch de su dataset y hora"""
+        values: Dict[Tuple[int, int], List[float]] = {}
+        for row in rows:
+            if row[3] == UP and row[5] is not None:
+                values.setdefault((row[2] - row[2] % HOUR_MS, row[1]), []).append(row[5])
+        for (hour, key), latencies in values.items():
+            existing = conn.execute(
+                "SELECT sketch FROM latency_sketches WHERE hour_ms = ? AND dataset_key = ?", (hour, key)
+            ).fetchone()
+            sketch = LatencySketch.from_json(existing[0]) if existing else LatencySketch()
+            sketch.update(latencies)
+            conn.execute(
+                "INSERT OR REPLACE INTO latency_sketches (hour_ms, dataset_key, sketch) VALUES (?, ?, ?)",
+                (hour, key, sketch.to_json())
+            )
+    
+    def _table_exists(self, conn: sqlite3.Connection, name: str) -> bool:
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone() is not None
+    
+    def _ensure_partition(self, conn: sqlite3.Connection, ms: int) -> str:
+        """Crea (si falta) la partición diaria que contiene el instante `ms`"""
+        name, start, end = partition_for(ms)
+        if name in self._partitions:
+            return name
+        if not conn.execute("SELECT 1 FROM history_partitions WHERE name = ?", (name,)).fetchone():
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {name} (
+                    id INTEGER PRIMARY KEY,
+                    dataset_key INTEGER NOT NULL REFERENCES dataset_keys (key),
+                    {HISTORY_FIELDS}
+                )
+            """)
+            # Índices cubrientes para las consultas por dataset y por rango de tiempo
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_key_time ON {name} (dataset_key, checked_at, status, latency_ms)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_time ON {name} (checked_at, dataset_key, status, latency_ms)")
+            conn.execute(
+                "INSERT OR IGNORE INTO history_partitions (name, start_ms, end_ms) VALUES (?, ?, ?)",
+                (name, start, end)
+            )
+            self._create_history_views(conn)
+        self._partitions.add(name)
+        return name
+    
+    def _history_sources(self, conn: sqlite3.Connection) -> List[str]:
+        """Tablas que componen check_history: particiones (más la tabla sin particionar si queda)"""
+        names = [row[0] for row in conn.execute("SELECT name FROM history_partitions ORDER BY start_ms")]
+        if self._table_exists(conn, UNPARTITIONED_HISTORY):
+            names.append(UNPARTITIONED_HISTORY)
+        return names
+    
+    def _create_history_views(self, conn: sqlite3.Connection):
+        """Vistas check_history (UNION ALL de particiones) y dataset_status (formato original)"""
+        columns = ', '.join(HISTORY_INSERT_COLUMNS)
+        selects = [f"SELECT {columns} FROM {name}" for name in self._history_sources(conn)]
+        chunks = [
+            " UNION ALL ".join(selects[i:i + HISTORY_VIEW_CHUNK])
+            for i in range(0, len(selects), HISTORY_VIEW_CHUNK)
+        ]
+        if len(chunks) > 1:
+            # SQLite limita los SELECT de un compuesto: se anidan por bloques
+            history = " UNION ALL ".join(f"SELECT * FROM ({chunk})" for chunk in chunks)
+        else:
+            history = chunks[0]
+        status = f"SELECT {HISTORY_VIEW_COLUMNS} FROM check_history h {HISTORY_JOINS}"
+        if self._has_legacy_history(conn):
+            status += """
+                UNION ALL
+                SELECT id, dataset_id, name, category, url, status, http_code, latency_ms, error,
+                       checked_at, etag, last_modified, content_changed, dns_ms, connect_ms, tls_ms, ttfb_ms
+                FROM dataset_status_legacy
+            """
+        for view, sql in (('check_history', history), ('dataset_status', status)):
+            sql = f"CREATE VIEW {view} AS {sql}"
+            current = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'view' AND name = ?", (view,)
+            ).fetchone()
+            if current and current[0] == sql:
+                continue
+            conn.execute(f"DROP VIEW IF EXISTS {view}")
+            conn.execute(sql)
+    
+    def _has_legacy_history(self, conn: Optional[sqlite3.Connection] = None) -> bool:
+        if conn is None:
+            with sqlite3.connect(self.db_path) as conn:
+                return self._has_legacy_history(conn)
+        return self._table_exists(conn, 'dataset_status_legacy')
+    
+    def _has_pending_migration(self, conn: Optional[sqlite3.Connection] = None) -> bool:
+        """Si quedan filas del historial fuera de las particiones"""
+        if conn is None:
+            with sqlite3.connect(self.db_path) as conn:
+                return self._has_pending_migration(conn)
+        return self._has_legacy_history(conn) or self._table_exists(conn, UNPARTITIONED_HISTORY)
+    
+    def migrate_legacy_history(self, batch_size: int = HISTORY_MIGRATION_BATCH) -> int:
+        """Copia el historial pendiente a las particiones por lotes, de las filas más nuevas a las más viejas
+        
+        Primero check_history_unpartitioned (esquema normalizado sin particionar) y
+        luego dataset_status_legacy (texto). Cada lote es una transacción corta
+        (copiar + borrar), así que puede correr en paralelo con el monitor y
+        retomarse si el proceso se detiene.
+        """
+        migrated = 0
+        columns = ', '.join(HISTORY_INSERT_COLUMNS)
+        legacy_select = f"""
+            SELECT
+                NULL,
+                k.key,
+                {LEGACY_CHECKED_AT_SQL},
+                {LEGACY_STATUS_SQL},
+                l.http_code, l.latency_ms, l.error,
+                l.etag, l.last_modified, l.content_changed,
+                l.dns_ms, l.connect_ms, l.tls_ms, l.ttfb_ms
+            FROM dataset_status_legacy l
+            JOIN dataset_keys k ON k.id = l.dataset_id
+            WHERE l.id > ? AND l.id <= ? AND julianday(l.checked_at) IS NOT NULL
+        """
+        sources = (
+            (UNPARTITIONED_HISTORY, f"SELECT {columns} FROM {UNPARTITIONED_HISTORY} WHERE id > ? AND id <= ?"),
+            ('dataset_status_legacy', legacy_select),
+        )
+        try:
+            for table, select in sources:
+                while True:
+                    with sqlite3.connect(self.db_path, timeout=30) as conn:
+                        if not self._table_exists(conn, table):
+                            break
+                        conn.execute("BEGIN IMMEDIATE")
+                        top = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+                        if top is None:
+                            conn.execute(f"DROP TABLE {table}")
+                            self._create_history_views(conn)
+                            # Las filas copiadas no pasan por _record_transition
+                            self._rebuild_status_intervals(conn)
+                            conn.commit()
+                            logger.info(f"Migración de {table} completada ({migrated} filas)")
+                            break
+                        low = top - batch_size
+                        if table == 'dataset_status_legacy':
+                            conn.execute("INSERT OR IGNORE INTO dataset_keys (id) SELECT DISTINCT dataset_id FROM dataset_status_legacy WHERE id > ? AND id <= ?", (low, top))
+                        rows = conn.execute(select, (low, top)).fetchall()
+                        self._insert_checks(conn, rows)
+                        migrated += len(rows)
+                        conn.execute(f"DELETE FROM {table} WHERE id > ? AND id <= ?", (low, top))
+                        conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error migrando historial (se retomará en el próximo arranque): {e}")
+        return migrated
+    
+    def _insert_checks(self, conn: sqlite3.Connection, rows: List[tuple]):
+        """Inserta chequeos (tuplas en el orden de HISTORY_INSERT_COLUMNS) en su partición diaria
+        
+        Las filas con id None reciben uno de history_sequence. También actualiza
+        latest_checks cuando el chequeo es más nuevo que el registrado.
+        """
+        if not rows:
+            return
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        missing = sum(1 for row in rows if row[0] is None)
+        if missing:
+            seq = conn.execute(
+                "UPDATE history_sequence SET seq = seq + ? WHERE id = 0 RETURNING seq", (missing,)
+            ).fetchone()[0]
+            next_id = iter(range(seq - missing + 1, seq + 1))
+            rows = [row if row[0] is not None else (next(next_id),) + tuple(row[1:]) for row in rows]
+        
+        by_partition: Dict[str, List[tuple]] = {}
+        for row in rows:
+            by_partition.setdefault(partition_for(row[2])[0], []).append(row)
+        
+        columns = ', '.join(HISTORY_INSERT_COLUMNS)
+        placeholders = ', '.join('?' * len(HISTORY_INSERT_COLUMNS))
+        for name, partition_rows in by_partition.items():
+            try:
+                self._ensure_partition(conn, partition_rows[0][2])
+                conn.executemany(f"INSERT INTO {name} ({columns}) VALUES ({placeholders})", partition_rows)
+            except sqlite3.OperationalError:
+                # Otro proceso pudo haber eliminado la partición por retención
+                self._partitions.discard(name)
+                self._ensure_partition(conn, partition_rows[0][2])
+                conn.executemany(f"INSERT INTO {name} ({columns}) VALUES ({placeholders})", partition_rows)
+            self._add_minute_rollups(conn, name, "WHERE h.id IN (SELECT value FROM json_each(?))",
+                                     (json.dumps([row[0] for row in partition_rows]),))
+        
+        updates = ', '.join(f"{c} = excluded.{c}" for c in HISTORY_INSERT_COLUMNS if c != 'dataset_key')
+        conn.executemany(f"""
+            INSERT INTO latest_checks ({columns}) VALUES ({placeholders})
+            ON CONFLICT(dataset_key) DO UPDATE SET {updates}
+            WHERE excluded.checked_at >= latest_checks.checked_at
+        """, rows)
+        self._add_to_sketches(conn, rows)
+    
+    def reader(self) -> sqlite3.Connection:
+        """Conexión de lectura del hilo actual (se reutiliza entre consultas)"""
+        conn = getattr(self._readers, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, cached_statements=QUERY_STATEMENT_CACHE)
+            conn.row_factory = sqlite3.Row
+            self._readers.conn = conn
+        return conn
+    
+    def query(self, name: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """Ejecuta una consulta de QUERIES por nombre con parámetros enlazados"""
+        return query_monitor.run(self.reader(), name, QUERIES[name], params)
+    
+    def check_query_plans(self):
+        """Falla (QueryPlanError) si alguna consulta caliente recorre una tabla completa"""
+        query_monitor.verify(self.reader(), QUERIES)
+    
+    def _dataset_key(self, conn: sqlite3.Connection, status: 'DatasetStatus') -> int:
+        """Clave entera del dataset, registrándolo si aún no existe"""
+        key = self._dataset_keys.get(status.id)
+        if key is None:
+            conn.execute(
+                "INSERT OR IGNORE INTO datasets (id, name, category, url) VALUES (?, ?, ?, ?)",
+                (status.id, status.name, status.category, status.url)
+            )
+            conn.execute("INSERT OR IGNORE INTO dataset_keys (id) VALUES (?)", (status.id,))
+            key = conn.execute("SELECT key FROM dataset_keys WHERE id = ?", (status.id,)).fetchone()[0]
+            self._dataset_keys[status.id] = key
+        return key
+    
     def save_dataset_status(self, status: DatasetStatus):
         """Guarda el estado de un dataset"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO dataset_status 
-                (dataset_id, name, category, url, status, http_code, latency_ms, error, checked_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                status.id, status.name, status.category, status.url,
-                status.status, status.http_code, status.latency_ms,
-                status.error, status.checked_at
-            ))
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            key = self._dataset_key(conn, status)
+            checked_at = to_epoch_ms(status.checked_at)
+            code = STATUS_CODES.get(status.status, 0)
+            self._insert_checks(conn, [(
+                None, key, checked_at, code, status.http_code, status.latency_ms,
+                status.error,
+                status.etag, status.last_modified, status.content_changed,
+                status.dns_ms, status.connect_ms, status.tls_ms, status.ttfb_ms
+            )])
+            self._record_transition(conn, key, checked_at, code)
             conn.commit()
     
+    def dataset_key(self, dataset_id: str) -> Optional[int]:
+        """Clave entera de un dataset (None si nunca se registró)"""
+        key = self._dataset_keys.get(dataset_id)
+        if key is None:
+            rows = self.query('dataset_key', (dataset_id,))
+            if not rows:
+                return None
+            key = self._dataset_keys[dataset_id] = rows[0][0]
+        return key
+    
     def get_latest_status(self) -> List[Dict]:
         """Obtiene el estado más reciente de todos los datasets"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT 
-                    dataset_id as id,
-                    name,
-                    category,
-                    url,
-                    status,
-                    http_code,
-                    latency_ms,
-                    error,
-                    checked_at,
-                    ROW_NUMBER() OVER (PARTITION BY dataset_id ORDER BY checked_at DESC) as rn
-                FROM dataset_status
-            """)
-            
-            rows = cursor.fetchall()
-            # Filtrar solo los más recientes
-            latest = [dict(row) for row in rows if row['rn'] == 1]
-            return latest
+        return [dict(row) for row in self.query('latest_status')]
     
     def get_dataset_history(self, dataset_id: str, hours: int = 24) -> List[Dict]:
         """Obtiene el histórico de un dataset específico"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT * FROM dataset_status 
-                WHERE dataset_id = ? 
-                AND checked_at >= datetime('now', '-{} hours')
-                ORDER BY checked_at DESC
-            """.format(hours), (dataset_id,))
-            
-            return [dict(row) for row in cursor.fetchall()]
+        key = self.dataset_key(dataset_id)
+        if key is None:
+            return []
+        return [dict(row) for row in self.query('dataset_history', (key, since_epoch_ms(hours=hours)))]
+    
+    def get_history_window(self, since_ms: int, dataset_ids: Optional[List[str]] = None) -> List[tuple]:
+        """Tuplas (dataset_key, checked_at, status, latency_ms) desde since_ms, sin orden
+
+        dataset_ids=None lee todos los datasets. Las filas son tuplas simples
+        (no sqlite3.Row) para cargarlas directamente en arrays.
+        """
+        cursor = self.reader().cursor()
+        cursor.row_factory = None
+        if dataset_ids is None:
+            return query_monitor.run(cursor, 'history_window', QUERIES['history_window'], (since_ms,))
+        keys = [key for key in (self.dataset_key(dataset_id) for dataset_id in dataset_ids) if key is not None]
+        if not keys:
+            return []
+        return query_monitor.run(cursor, 'datasets_window', QUERIES['datasets_window'], (json.dumps(keys), since_ms))
+    
+    def get_dataset_names(self) -> Dict[int, sqlite3.Row]:
+        """Clave entera -> (key, id, name, category) de cada dataset registrado"""
+        return {row['key']: row for row in self.query('dataset_names')}
+    
+    def get_latency_sketches(self, since_ms: int, group_by: str = 'system',
+                             dataset_id: Optional[str] = None) -> Dict[str, LatencySketch]:
+        """Sketches horarios desde since_ms combinados por 'system', 'category' o 'dataset'"""
+        if dataset_id:
+            key = self.dataset_key(dataset_id)
+            if key is None:
+                return {}
+            rows = self.query('latency_sketches_dataset', (key, since_ms - since_ms % HOUR_MS))
+        else:
+            rows = self.query('latency_sketches', (since_ms - since_ms % HOUR_MS,))
+        merged: Dict[str, LatencySketch] = {}
+        for row in rows:
+            if group_by == 'dataset':
+                group = row['dataset_id']
+            elif group_by == 'category':
+                group = row['category']
+            else:
+                group = 'system'
+            sketch = LatencySketch.from_json(row['sketch'])
+            if group in merged:
+                merged[group].merge(sketch)
+            else:
+                merged[group] = sketch
+        return merged
+    
+    def get_minute_rollups(self, since_ms: int, after_id: Optional[int] = None) -> Tuple[List[tuple], Optional[int]]:
+        """Agregados por minuto y categoría desde since_ms y el último id de chequeo que incluyen
+        
+        Con after_id solo se suman los chequeos escritos desde esa lectura, sean del
+        minuto que sean (resultados tardíos, otros workers). Ambas lecturas se hacen
+        en una transacción para que filas e id sean consistentes. Mientras queda
+        historial por migrar el id es None: las filas copiadas conservan ids viejos.
+        """
+        conn = self.reader()
+        conn.execute("BEGIN")
+        try:
+            last_id = conn.execute("SELECT seq FROM history_sequence WHERE id = 0").fetchone()[0]
+            if after_id is None:
+                rows = self.query('minute_rollups', (since_ms,))
+            else:
+                rows = self.query('minute_rollups_after', (after_id, last_id, since_ms))
+            if self._has_pending_migration(conn):
+                last_id = None
+        finally:
+            conn.commit()
+        return [tuple(row) for row in rows], last_id
+    
+    def get_status_intervals(self, since_ms: int, dataset_id: Optional[str] = None) -> List[Dict]:
+        """Intervalos de estado que terminan en o después de since_ms (status como 'up'/'down'/'unknown')"""
+        if dataset_id:
+            key = self.dataset_key(dataset_id)
+            if key is None:
+                return []
+            rows = self.query('status_intervals_dataset', (key, since_ms))
+        else:
+            rows = self.query('status_intervals', (since_ms,))
+        return [dict(row, status=STATUS_NAMES.get(row['status'], 'unknown')) for row in rows]
+    
+    def get_recent_latencies(self, per_dataset: int = 100,
+                             hours: float = RECENT_LATENCY_HOURS) -> Dict[str, List[float]]:
+        """Obtiene las últimas latencias exitosas de cada dataset (ms) dentro de las últimas `hours`"""
+        latencies: Dict[str, List[float]] = {}
+        for dataset_id, latency_ms in self.query('recent_latencies', (since_epoch_ms(hours=hours), per_dataset)):
+            latencies.setdefault(dataset_id, []).append(latency_ms)
+        return latencies
     
     def get_latest_dataset_status(self, dataset_id: str) -> Optional[DatasetStatus]:
         """Obtiene el estado más reciente de un dataset específico"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT 
-                    dataset_id as id,
-                    name,
-                    category,
-                    url,
-                    status,
-                    http_code,
-                    latency_ms,
-                    error,
-                    checked_at
-                FROM dataset_status 
-                WHERE dataset_id = ? 
-                ORDER BY checked_at DESC 
-                LIMIT 1
-            """, (dataset_id,))
-            
-            row = cursor.fetchone()
-            if row:
-                return DatasetStatus(**dict(row))
-            return None
+        rows = self.query('latest_dataset_status', (dataset_id,))
+        if rows:
+            return DatasetStatus(**dict(rows[0]))
+        return None
+    
+    def get_history_rollup(self, since_ms: int, dataset_id: Optional[str] = None) -> Tuple[List[Dict], int]:
+        """Chequeos por día y dataset desde `since_ms` en las particiones de SQLite
+        
+        Devuelve las filas (mismo formato que HistoryArchive.daily_rollup) y el
+        inicio en epoch ms de la partición más antigua: lo anterior está en el archivo.
+        """
+        oldest = self.reader().execute("SELECT MIN(start_ms) FROM history_partitions").fetchone()[0]
+        if dataset_id:
+            rows = self.query('history_rollup_dataset', (self.dataset_key(dataset_id), since_ms))
+        else:
+            rows = self.query('history_rollup', (since_ms,))
+        return [dict(row) for row in rows], oldest if oldest is not None else since_ms
     
     def get_availability_stats(self, hours: int = 24) -> Dict:
         """Obtiene estadísticas de disponibilidad"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
-            # Estadísticas generales
-            cursor = conn.execute("""
-                SELECT 
-                    COUNT(DISTINCT dataset_id) as total_datasets,
-                    COUNT(*) as total_checks,
-                    SUM(CASE WHEN status = 'up' THEN 1 ELSE 0 END) as successful_checks,
-                    AVG(CASE WHEN latency_ms IS NOT NULL THEN latency_ms END) as avg_latency
-                FROM dataset_status 
-                WHERE checked_at >= datetime('now', '-{} hours')
-            """.format(hours))
-            
-            stats = dict(cursor.fetchone())
-            
-            # Estadísticas por categoría
-            cursor = conn.execute("""
-                SELECT 
-                    category,
-                    COUNT(DISTINCT dataset_id) as dataset_count,
-                    COUNT(*) as check_count,
-                    SUM(CASE WHEN status = 'up' THEN 1 ELSE 0 END) as successful_count,
-                    AVG(CASE WHEN latency_ms IS NOT NULL THEN latency_ms END) as avg_latency
-                FROM dataset_status 
-                WHERE checked_at >= datetime('now', '-{} hours')
-                GROUP BY category
-                ORDER BY category
-            """.format(hours))
-            
-            stats['by_category'] = [dict(row) for row in cursor.fetchall()]
-            
-            return stats
+        since = since_epoch_ms(hours=hours)
+        stats = dict(self.query('availability_totals', (since,))[0])
+        stats['by_category'] = [dict(row) for row in self.query('availability_by_category', (since,))]
+        return stats
     
-    def register_datasets(self, datasets: List[Dict]):
-        """Registra/actualiza datasets en la base de datos"""
+    def register_datasets(self, datasets: List[Dict]) -> Dict[str, int]:
+        """Sincroniza la tabla datasets con el catálogo escribiendo solo las diferencias"""
+        columns = ('name', 'category', 'url', 'description', 'method', 'timeout')
         with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            existing = {
+                row['id']: row
+                for row in conn.execute(f"SELECT id, active, {', '.join(columns)} FROM datasets")
+            }
+            now = datetime.now(timezone.utc)
+            upserts = []
             for dataset in datasets:
-                conn.execute("""
-                    INSERT OR REPLACE INTO datasets 
-                    (id, name, category, url, description, method, timeout, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    dataset['id'],
+                values = (
                     dataset['name'],
                     dataset['category'],
                     dataset['url'],
                     dataset.get('description'),
                     dataset.get('method', 'HEAD'),
-                    dataset.get('timeout', 10),
-                    datetime.now(timezone.utc)
-                ))
+                    dataset.get('timeout', 10)
+                )
+                row = existing.get(dataset['id'])
+                if row is None or not row['active'] or tuple(row[c] for c in columns) != values:
+                    upserts.append((dataset['id'],) + values + (now,))
+            
+            # Los datasets que salieron del catálogo se desactivan (se conserva su historial)
+            catalog_ids = {dataset['id'] for dataset in datasets}
+            removed = [(now, i) for i, row in existing.items() if row['active'] and i not in catalog_ids]
+            
+            if upserts:
+                conn.executemany("""
+                    INSERT INTO datasets 
+                    (id, name, category, url, description, method, timeout, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        name = excluded.name,
+                        category = excluded.category,
+                        url = excluded.url,
+                        description = excluded.description,
+                        method = excluded.method,
+                        timeout = excluded.timeout,
+                        active = 1,
+                        updated_at = excluded.updated_at
+                """, upserts)
+            if removed:
+                conn.executemany("UPDATE datasets SET active = 0, updated_at = ? WHERE id = ?", removed)
             conn.commit()
+            return {'upserted': len(upserts), 'deactivated': len(removed)}
     
     def get_registered_datasets(self, active_only: bool = True) -> List[Dict]:
         """Obtiene los datasets registrados"""
@@ -247,11 +1161,146 @@ class Database:
             cursor = conn.execute(query)
             return [dict(row) for row in cursor.fetchall()]
     
-    def cleanup_old_data(self, days: int = 30):
-        """Limpia datos antiguos para mantener la base de datos ligera"""
+    def get_circuit_breakers(self) -> List[Dict]:
+        """Obtiene el estado persistido de los circuit breakers del checker"""
         with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                DELETE FROM dataset_status 
-                WHERE checked_at < datetime('now', '-{} days')
-            """.format(days))
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT key, state, failures, opened_count, next_probe_at, last_error, updated_at
+                FROM circuit_breakers
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def save_circuit_breakers(self, states: List[Dict]):
+        """Guarda (upsert) el estado de los circuit breakers modificados"""
+        if not states:
+            return
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO circuit_breakers
+                (key, state, failures, opened_count, next_probe_at, last_error, updated_at)
+                VALUES (:key, :state, :failures, :opened_count, :next_probe_at, :last_error, :updated_at)
+            """, states)
+            conn.commit()
+    
+    def get_anomaly_detectors(self) -> List[Dict]:
+        """Obtiene el estado persistido de los detectores de degradación"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute("""
+                SELECT dataset_id, samples, checks, latency_mean, latency_var, latency_cusum,
+                       latency_degraded, failure_base, failure_rate, failure_cusum,
+                       failure_degraded, updated_at
+                FROM anomaly_detectors
+            """)
+            return [
+                {**row, 'latency_degraded': bool(row['latency_degraded']),
+                 'failure_degraded': bool(row['failure_degraded'])}
+                for row in map(dict, cursor.fetchall())
+            ]
+    
+    def save_anomaly_detectors(self, states: List[Dict]):
+        """Guarda (upsert) el estado de los detectores modificados"""
+        if not states:
+            return
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO anomaly_detectors
+                (dataset_id, samples, checks, latency_mean, latency_var, latency_cusum,
+                 latency_degraded, failure_base, failure_rate, failure_cusum,
+                 failure_degraded, updated_at)
+                VALUES (:dataset_id, :samples, :checks, :latency_mean, :latency_var, :latency_cusum,
+                        :latency_degraded, :failure_base, :failure_rate, :failure_cusum,
+                        :failure_degraded, :updated_at)
+            """, states)
+            conn.commit()
+    
+    def drop_partitions_before(self, cutoff_ms: int) -> List[str]:
+        """Elimina (archivándolas antes, si hay archivo) las particiones que terminan antes de `cutoff_ms`
+        
+        La exportación se hace fuera de la transacción: las particiones vencidas
+        ya no reciben escrituras y el lock de escritura solo se toma para
+        eliminarlas y recrear la vista, sin bloquear al monitor durante el archivo.
+        """
+        exported: Dict[str, int] = {}
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            names = [row[0] for row in conn.execute(
+                "SELECT name FROM history_partitions WHERE end_ms <= ? ORDER BY start_ms", (cutoff_ms,)
+            )]
+            if self.archive is not None:
+                exported = {name: conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0] for name in names}
+        if names and self.archive is not None:
+            # Una partición que no se pudo archivar se conserva hasta el próximo intento
+            names = [name for name in names if self.archive.export_partition(self.db_path, name)]
+        if not names:
+            return []
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Otro worker pudo eliminarlas mientras se exportaban
+            registered = {row[0] for row in conn.execute("SELECT name FROM history_partitions")}
+            names = [name for name in names if name in registered]
+            if self.archive is not None:
+                # Filas llegadas después de exportar: se re-archiva en el próximo intento
+                names = [name for name in names
+                         if conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0] == exported[name]]
+            if names:
+                conn.executemany("DELETE FROM history_partitions WHERE name = ?", [(name,) for name in names])
+                # La vista deja de referenciarlas antes de eliminarlas
+                self._create_history_views(conn)
+                for name in names:
+                    conn.execute(f"DROP TABLE IF EXISTS {name}")
             conn.commit()
+        self._partitions.difference_update(names)
+        return names
+    
+    def _enable_incremental_vacuum(self) -> bool:
+        """Pasa una base existente a auto_vacuum INCREMENTAL (requiere un VACUUM completo, una sola vez)
+        
+        Solo se llama al arrancar; el mantenimiento periódico nunca reescribe el archivo.
+        """
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            if self._has_pending_migration(conn):
+                # Se espera a que la migración termine para reescribir el archivo una sola vez
+                return False
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return True
+    
+    def cleanup_old_data(self, days: int = HISTORY_RETENTION_DAYS) -> Dict:
+        """Aplica la retención del historial eliminando particiones completas
+        
+        Las particiones cuyo día terminó hace más de `days` días se eliminan con
+        DROP TABLE y hasta INCREMENTAL_VACUUM_PAGES páginas liberadas se devuelven
+        al sistema con `PRAGMA incremental_vacuum(N)` (sin efecto mientras la base
+        no esté en modo INCREMENTAL). También deja creada la partición del día
+        siguiente para que el cambio de día no agregue DDL a las escrituras.
+        """
+        now = to_epoch_ms(datetime.now(timezone.utc))
+        dropped = self.drop_partitions_before(now - max(days, 1) * 86400 * 1000)
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._ensure_partition(conn, now + 86400 * 1000)
+            pruned = conn.execute(
+                "DELETE FROM latency_sketches WHERE hour_ms < ?",
+                (now - LATENCY_SKETCH_RETENTION_DAYS * 86400 * 1000,)
+            ).rowcount
+            conn.execute("DELETE FROM minute_rollups WHERE minute_ms < ?", (now - max(days, 1) * 86400 * 1000,))
+            conn.execute(
+                "DELETE FROM status_intervals WHERE end_ms < ?",
+                (now - STATUS_INTERVAL_RETENTION_DAYS * 86400 * 1000,)
+            )
+            conn.commit()
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # Cada paso de la pragma libera una página: hay que consumir el cursor completo
+            conn.execute(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES})").fetchall()
+            freed = free_pages - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            partitions = conn.execute("SELECT COUNT(*) FROM history_partitions").fetchone()[0]
+        return {
+            'dropped_partitions': dropped,
+            'partitions': partitions,
+            'freed_pages': freed,
+            'pruned_sketches': pruned
+        }
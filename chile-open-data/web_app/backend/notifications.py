@@ -9,6 +9,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Canal del bus de mensajes para replicar notificaciones entre procesos
+NOTIFICATIONS_CHANNEL = 'notifications'
+
 @dataclass
 class Notification:
     """Estructura de una notificación"""
@@ -25,6 +28,11 @@ class Notification:
         result = asdict(self)
         result['timestamp'] = self.timestamp.isoformat()
         return result
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Notification':
+        """Reconstruye una notificación desde su diccionario JSON"""
+        return cls(**{**data, 'timestamp': datetime.fromisoformat(data['timestamp'])})
 
 class NotificationManager:
     """Gestor centralizado de notificaciones"""
@@ -33,6 +41,9 @@ class NotificationManager:
         self._notifications: List[Notification] = []
         self._subscribers: List[callable] = []
         self._max_notifications = 100  # Límite de notificaciones en memoria
+        self._bus = None
+        # Se incrementa con cada cambio para que los cachés sepan si están al día
+        self.revision = 0
         
         # Configurar limpieza automática cada 1 hora
         import threading
@@ -56,8 +67,35 @@ class NotificationManager:
         ]
         cleaned = before_count - len(self._notifications)
         if cleaned > 0:
+            self.revision += 1
             logger.info(f"Limpiadas {cleaned} notificaciones antiguas")
         
+    def attach_bus(self, bus):
+        """
+        Replica las notificaciones entre procesos a través del bus de mensajes
+        
+        Cada cambio se aplica de inmediato en el proceso que lo origina y se
+        publica en el bus; los demás procesos lo aplican al recibirlo (el
+        proceso de origen lo ignora porque ya lo tiene).
+        """
+        self._bus = bus
+        bus.subscribe(NOTIFICATIONS_CHANNEL, self._handle_bus_message)
+    
+    def _publish(self, message: Dict[str, Any]):
+        if self._bus is not None:
+            self._bus.publish(NOTIFICATIONS_CHANNEL, message)
+    
+    def _handle_bus_message(self, message: Dict[str, Any]):
+        action = message.get('action')
+        if action == 'created':
+            notification = Notification.from_dict(message['notification'])
+            if not any(n.id == notification.id for n in self._notifications):
+                self._store(notification)
+        elif action == 'read':
+            self._mark_as_read_local(message['notification_id'])
+        elif action == 'cleared':
+            self._clear_local()
+    
     def add_subscriber(self, callback: callable):
         """Añade un callback que se ejecutará cuando haya nuevas notificaciones"""
         self._subscribers.append(callback)
@@ -82,18 +120,24 @@ class NotificationManager:
             data=data or {}
         )
         
+        self._store(notification)
+        self._publish({'action': 'created', 'notification': notification.to_dict()})
+        
+        logger.info(f"Notificación creada: {notification.type} - {notification.title}")
+        return notification
+    
+    def _store(self, notification: Notification):
+        """Guarda una notificación y avisa a los suscriptores locales"""
         # Añadir a la lista
         self._notifications.append(notification)
         
         # Mantener solo las últimas notificaciones
         if len(self._notifications) > self._max_notifications:
             self._notifications = self._notifications[-self._max_notifications:]
+        self.revision += 1
         
         # Notificar a todos los suscriptores
         self._notify_subscribers(notification)
-        
-        logger.info(f"Notificación creada: {notification.type} - {notification.title}")
-        return notification
     
     def _notify_subscribers(self, notification: Notification):
         """Notifica a todos los suscriptores sobre la nueva notificación"""
@@ -110,9 +154,17 @@ class NotificationManager:
     
     def mark_as_read(self, notification_id: str) -> bool:
         """Marca una notificación como leída"""
+        if not self._mark_as_read_local(notification_id):
+            return False
+        self._publish({'action': 'read', 'notification_id': notification_id})
+        return True
+    
+    def _mark_as_read_local(self, notification_id: str) -> bool:
         for notification in self._notifications:
             if notification.id == notification_id:
-                notification.read = True
+                if not notification.read:
+                    notification.read = True
+                    self.revision += 1
                 return True
         return False
     
@@ -122,8 +174,14 @@ class NotificationManager:
     
     def clear_notifications(self):
         """Limpia todas las notificaciones"""
-        self._notifications.clear()
+        self._clear_local()
+        self._publish({'action': 'cleared'})
         logger.info("Todas las notificaciones han sido eliminadas")
+    
+    def _clear_local(self):
+        if self._notifications:
+            self._notifications.clear()
+            self.revision += 1
 
 # Instancia global del gestor de notificaciones
 notification_manager = NotificationManager()
@@ -166,6 +224,35 @@ def create_dataset_change_notification(dataset_name: str, change_type: str, deta
         }
     )
 
+def create_dataset_anomaly_notification(dataset_name: str, event: Dict[str, Any]):
+    """Crea una notificación por una degradación o recuperación detectada por los detectores"""
+    if event['detector'] == 'latency':
+        subject = 'latencia'
+        detail = f"{event['value']:.0f} ms frente a una línea base de {event['baseline']:.0f} ms"
+    else:
+        subject = 'tasa de fallos'
+        detail = f"{event['value']:.0%} frente a una línea base de {event['baseline']:.0%}"
+    
+    if event['state'] == 'degraded':
+        notification_type = 'warning'
+        title = f'Dataset {dataset_name} degradado'
+        message = f'Aumento sostenido de {subject} en {dataset_name}: {detail}'
+    else:
+        notification_type = 'success'
+        title = f'Dataset {dataset_name} recuperado'
+        message = f'La {subject} de {dataset_name} volvió a su nivel habitual: {detail}'
+    
+    return notification_manager.create_notification(
+        notification_type=notification_type,
+        title=title,
+        message=message,
+        data={
+            'dataset_name': dataset_name,
+            'change_type': 'anomaly',
+            'details': event
+        }
+    )
+
 def create_system_notification(title: str, message: str, notification_type: str = 'info', data: Optional[Dict[str, Any]] = None):
     """Crea una notificación del sistema"""
     return notification_manager.create_notification(
@@ -0,0 +1,226 @@
+# /web_app/backend/querystats.py
+"""
+Instrumentación de las consultas SQLite
+
+Cada consulta con nombre (Database.query y las de autenticación) pasa por
+`query_monitor.run`, que mide su duración y acumula por nombre la cantidad
+de ejecuciones y un histograma de latencias. Las consultas que superan
+`SLOW_QUERY_MS` se registran en el log junto con su EXPLAIN QUERY PLAN.
+
+Las consultas calientes se registran con `register_hot`. Con el guardián de
+planes activo (`QUERY_PLAN_GUARD=true`, pensado para pruebas y CI) una
+consulta caliente cuyo plan recorre una tabla completa lanza QueryPlanError
+en lugar de ejecutarse.
+
+Las consultas registradas con `register_sensitive` (autenticación) no
+guardan ni registran sus parámetros.
+"""
+
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (ms) de los buckets del histograma; el último bucket es "+Inf"
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Consultas lentas recientes que se conservan para el endpoint de administración
+SLOW_QUERY_LOG_SIZE = 50
+# Reemplazo de cada parámetro de una consulta sensible en el log
+REDACTED = '<redacted>'
+
+_TABLE_REFERENCE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_SQL_KEYWORDS = {
+    'where', 'join', 'left', 'inner', 'cross', 'on', 'group', 'order', 'limit',
+    'union', 'using', 'natural', 'set', 'values', 'having', 'window'
+}
+
+
+class QueryPlanError(Exception):
+    """Una consulta caliente recorre una tabla completa"""
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Iterable[Any] = ()) -> List[str]:
+    """Líneas del EXPLAIN QUERY PLAN de una consulta"""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, tuple(params)).fetchall()]
+
+
+def table_scans(conn: sqlite3.Connection, sql: str, params: Iterable[Any] = ()) -> List[str]:
+    """Tablas que el plan recorre completas
+
+    Un SCAN cuenta aunque use un índice (USING [COVERING] INDEX): sigue leyendo
+    todas sus entradas; solo SEARCH está acotado. El plan nombra las tablas por su alias, así que los alias se resuelven
+    desde el propio SQL. Los SCAN de subconsultas, CTE y vistas materializadas
+    no cuentan: sus tablas base aparecen como líneas propias del plan.
+    """
+    aliases = {}
+    for table, alias in _TABLE_REFERENCE.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    scans = []
+    for detail in explain(conn, sql, params):
+        if not detail.startswith('SCAN '):
+            continue
+        name = detail.split()[1]
+        table = aliases.get(name, name)
+        if table in tables and table not in scans:
+            scans.append(table)
+    return scans
+
+
+class QueryMonitor:
+    """Tiempos por consulta con nombre, log de consultas lentas y guardián de planes"""
+
+    def __init__(self, slow_ms: float = 250.0, guard: bool = False):
+        self.slow_ms = slow_ms
+        self.guard = guard
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._slow = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self._hot: Dict[str, tuple] = {}
+        self._sensitive = set()
+        self._verified = set()
+
+    def configure(self, slow_ms: Optional[float] = None, guard: Optional[bool] = None):
+        """Ajusta el umbral de consultas lentas y el guardián de planes"""
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if guard is not None:
+            self.guard = guard
+            self._verified.clear()
+
+    def register_hot(self, name: str, allow_scans: Iterable[str] = ()):
+        """Marca una consulta como caliente; allow_scans son tablas pequeñas que puede recorrer"""
+        self._hot[name] = tuple(allow_scans)
+        self._verified.discard(name)
+
+    def register_sensitive(self, name: str):
+        """Marca una consulta cuyos parámetros (hashes de API keys, ids) no deben exponerse"""
+        self._sensitive.add(name)
+
+    def check_plan(self, conn: sqlite3.Connection, name: str, sql: str, params: Iterable[Any] = ()) -> List[str]:
+        """Tablas recorridas completas por una consulta caliente (fuera de las permitidas)"""
+        allowed = self._hot.get(name, ())
+        return [table for table in table_scans(conn, sql, params) if table not in allowed]
+
+    def verify(self, conn: sqlite3.Connection, queries: Dict[str, str]):
+        """Revisa el plan de todas las consultas calientes de `queries` sin ejecutarlas
+
+        Lanza QueryPlanError con todas las consultas que recorren tablas completas.
+        """
+        violations = {}
+        for name, sql in queries.items():
+            if name not in self._hot:
+                continue
+            scans = self.check_plan(conn, name, sql, (None,) * sql.count('?'))
+            if scans:
+                violations[name] = scans
+        if violations:
+            raise QueryPlanError(
+                "Consultas calientes con recorrido completo de tabla: " +
+                ", ".join(f"{name} ({', '.join(tables)})" for name, tables in violations.items())
+            )
+
+    def run(self, conn: sqlite3.Connection, name: str, sql: str, params: Iterable[Any] = ()) -> list:
+        """Ejecuta la consulta, registra su duración y devuelve todas las filas"""
+        params = tuple(params)
+        if self.guard and name in self._hot and name not in self._verified:
+            scans = self.check_plan(conn, name, sql, params)
+            if scans:
+                raise QueryPlanError(f"La consulta '{name}' recorre completas las tablas: {', '.join(scans)}")
+            self._verified.add(name)
+
+        started = time.perf_counter()
+        rows = conn.execute(sql, params).fetchall()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.record(name, elapsed_ms)
+
+        if elapsed_ms >= self.slow_ms:
+            self._log_slow(conn, name, sql, params, elapsed_ms, len(rows))
+        return rows
+
+    def record(self, name: str, elapsed_ms: float):
+        """Acumula una ejecución en el contador e histograma de la consulta"""
+        with self._lock:
+            entry = self._stats.get(name)
+            if entry is None:
+                entry = self._stats[name] = {
+                    'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'slow': 0,
+                    'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1)
+                }
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            if elapsed_ms >= self.slow_ms:
+                entry['slow'] += 1
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    entry['buckets'][i] += 1
+                    break
+            else:
+                entry['buckets'][-1] += 1
+
+    def _log_slow(self, conn: sqlite3.Connection, name: str, sql: str, params: tuple,
+                  elapsed_ms: float, row_count: int):
+        try:
+            plan = explain(conn, sql, params)
+        except sqlite3.Error as e:
+            plan = [f"EXPLAIN QUERY PLAN falló: {e}"]
+        if name in self._sensitive:
+            params = (REDACTED,) * len(params)
+        logger.warning(
+            f"Consulta lenta '{name}': {elapsed_ms:.1f} ms, {row_count} filas, parámetros {params}\n  " +
+            "\n  ".join(plan)
+        )
+        with self._lock:
+            self._slow.append({
+                'name': name,
+                'duration_ms': round(elapsed_ms, 2),
+                'rows': row_count,
+                'params': [p if isinstance(p, (int, float, str)) or p is None else str(p) for p in params],
+                'plan': plan,
+                'at': time.time()
+            })
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores e histogramas por nombre de consulta y consultas lentas recientes"""
+        labels = [str(bound) for bound in LATENCY_BUCKETS_MS] + ['+Inf']
+        with self._lock:
+            queries = {
+                name: {
+                    'count': entry['count'],
+                    'avg_ms': round(entry['total_ms'] / entry['count'], 3),
+                    'max_ms': round(entry['max_ms'], 3),
+                    'total_ms': round(entry['total_ms'], 3),
+                    'slow': entry['slow'],
+                    'hot': name in self._hot,
+                    'histogram_ms': dict(zip(labels, entry['buckets']))
+                }
+                for name, entry in sorted(self._stats.items())
+            }
+            slow = list(self._slow)
+        return {
+            'slow_query_ms': self.slow_ms,
+            'plan_guard': self.guard,
+            'hot_queries': sorted(self._hot),
+            'queries': queries,
+            'slow_queries': slow
+        }
+
+    def reset(self):
+        """Borra contadores, histogramas y el log de consultas lentas"""
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+
+# Instancia global del monitor
+query_monitor = QueryMonitor()
@@ -6,15 +6,22 @@ Scheduler para monitoreo automático de datasets
 import threading
 import time
 import logging
+from dataclasses import asdict
 from datetime import datetime, timezone
-from typing import List, Dict
+from typing import List, Dict, Callable, Optional
 import signal
 import sys
 
-from services.sources import load_sources
-from services.checker import check_all
-from models import Database, DatasetStatus
+from services.sources import get_catalog
+from services.checker import check_all, check_sharded, shutdown_shard_pool, with_adaptive_timeouts
+from services.breaker import CircuitBreakerRegistry, CIRCUIT_OPEN_ERROR
+from services.detectors import AnomalyDetectorRegistry
+from services.dns_cache import dns_cache
+from services.politeness import host_politeness, RATE_LIMITED_ERROR
+from models import Database, DatasetStatus, HISTORY_RETENTION_DAYS
 from cache import invalidate_datasets_cache
+from bus import MessageBus, LocalMessageBus
+from leader import LeaderLease
 
 
 # Configurar logging
@@ -28,12 +35,37 @@ logger = logging.getLogger(__name__)
 class DatasetMonitor:
     """Monitor automático de datasets"""
     
-    def __init__(self, db: Database, check_interval: int = 300):  # 5 minutos por defecto
+    def __init__(self, db: Database, check_interval: int = 300,  # 5 minutos por defecto
+                 adaptive_timeouts: bool = True, check_shards: int = 1,
+                 retention_days: int = HISTORY_RETENTION_DAYS, maintenance_interval: int = 3600):
         self.db = db
         self.check_interval = check_interval
+        # Retención del historial: job propio, independiente del ciclo de chequeo
+        self.retention_days = retention_days
+        self.maintenance_interval = maintenance_interval
+        self.last_maintenance: Optional[Dict] = None
+        self._maintenance_thread = None
+        self.adaptive_timeouts = adaptive_timeouts
+        # Con más de un shard los datasets se reparten por host entre procesos
+        self.check_shards = check_shards
+        self.last_shard_stats: List[Dict] = []
+        # Revisión del catálogo ya sincronizada con la tabla datasets
+        self._registered_revision: Optional[int] = None
         self.running = False
         self.thread = None
         self._stop_event = threading.Event()
+        # Lo asigna BackgroundScheduler: sin lease vigente un ciclo no se persiste
+        self.lease_check: Optional[Callable[[], bool]] = None
+        self._subscribers: List[Callable[[Dict], None]] = []
+        self._cycle_subscribers: List[Callable[[List[Dict]], None]] = []
+        self._anomaly_subscribers: List[Callable[[Dict], None]] = []
+        
+        # Circuit breakers por dataset/host y detectores de degradación, persistidos entre reinicios
+        self._load_state()
+        self._state_stale = False
+        # Un solo ciclo a la vez: los breakers y detectores no son thread-safe
+        # y dos ciclos simultáneos guardarían resultados duplicados
+        self._cycle_lock = threading.Lock()
         
         # Registrar manejador de señales para cierre limpio
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -45,6 +77,59 @@ class DatasetMonitor:
         self.stop()
         sys.exit(0)
     
+    def _load_state(self):
+        """Carga breakers y detectores desde la BD
+        
+        Se repite en el primer ciclo tras cada arranque: si otro worker fue
+        líder mientras tanto, el estado en memoria de este proceso está
+        desactualizado.
+        """
+        self.breakers = CircuitBreakerRegistry()
+        self.breakers.load(self.db.get_circuit_breakers())
+        self.detectors = AnomalyDetectorRegistry()
+        self.detectors.load(self.db.get_anomaly_detectors())
+    
+    def add_subscriber(self, callback: Callable[[Dict], None]):
+        """Añade un callback que recibe cada resultado de verificación"""
+        self._subscribers.append(callback)
+    
+    def remove_subscriber(self, callback: Callable[[Dict], None]):
+        """Remueve un callback de la lista de suscriptores"""
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+    
+    def add_cycle_subscriber(self, callback: Callable[[List[Dict]], None]):
+        """Añade un callback que recibe todos los resultados al terminar cada ciclo"""
+        self._cycle_subscribers.append(callback)
+    
+    def add_anomaly_subscriber(self, callback: Callable[[Dict], None]):
+        """Añade un callback que recibe cada degradación o recuperación detectada"""
+        self._anomaly_subscribers.append(callback)
+    
+    def _publish_result(self, result: Dict):
+        """Publica un resultado a todos los suscriptores"""
+        for callback in self._subscribers:
+            try:
+                callback(result)
+            except Exception as e:
+                logger.error(f"Error notificando suscriptor del monitor: {e}")
+    
+    def _publish_cycle(self, results: List[Dict]):
+        """Publica los resultados de un ciclo completo"""
+        for callback in self._cycle_subscribers:
+            try:
+                callback(results)
+            except Exception as e:
+                logger.error(f"Error notificando suscriptor de ciclo: {e}")
+    
+    def _publish_anomaly(self, event: Dict):
+        """Publica un evento de degradación/recuperación"""
+        for callback in self._anomaly_subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Error notificando suscriptor de anomalías: {e}")
+    
     def start(self):
         """Inicia el monitoreo en un hilo separado"""
         if self.running:
@@ -53,9 +138,15 @@ class DatasetMonitor:
         
         logger.info(f"Iniciando monitor de datasets (intervalo: {self.check_interval}s)")
         self.running = True
-        self._stop_event.clear()
-        self.thread = threading.Thread(target=self._monitor_loop, daemon=True)
+        # Evento propio de este arranque: un loop anterior que aún no terminó sigue detenido
+        stop_event = self._stop_event = threading.Event()
+        # Se recarga dentro del ciclo (con el lock): un ciclo anterior puede seguir en curso
+        self._state_stale = True
+        self.thread = threading.Thread(target=self._monitor_loop, args=(stop_event,), daemon=True)
         self.thread.start()
+        self._maintenance_thread = threading.Thread(target=self._maintenance_loop, args=(stop_event,),
+                                                    daemon=True, name="history-maintenance")
+        self._maintenance_thread.start()
     
     def stop(self):
         """Detiene el monitoreo"""
@@ -68,53 +159,112 @@ class DatasetMonitor:
         
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=5)
+        if self._maintenance_thread and self._maintenance_thread.is_alive():
+            self._maintenance_thread.join(timeout=5)
+        if self.check_shards > 1:
+            shutdown_shard_pool()
         
         logger.info("Monitor detenido")
     
-    def _monitor_loop(self):
+    def _monitor_loop(self, stop_event: threading.Event):
         """Loop principal de monitoreo"""
         logger.info("Monitor iniciado")
         
-        while self.running and not self._stop_event.is_set():
+        while not stop_event.is_set():
+            cycle_start = time.monotonic()
             try:
-                self._check_datasets()
-                
-                # Limpiar datos antiguos periódicamente (cada hora)
-                if int(time.time()) % 3600 == 0:
-                    self._cleanup_old_data()
+                self._check_datasets(stop_event)
                 
             except Exception as e:
                 logger.error(f"Error en check de datasets: {e}")
             
-            # Esperar el intervalo o hasta que se solicite parada
-            self._stop_event.wait(self.check_interval)
+            # Esperar el resto del intervalo (los probes repartidos ya consumieron
+            # parte de él) o hasta que se solicite parada
+            stop_event.wait(max(0.0, self.check_interval - (time.monotonic() - cycle_start)))
         
         logger.info("Loop de monitoreo terminado")
     
-    def _check_datasets(self):
+    def _may_persist(self, stop_event: Optional[threading.Event]) -> bool:
+        """Si el ciclo en curso puede guardarse: su loop sigue activo y este worker tiene el lease"""
+        if stop_event is not None and stop_event.is_set():
+            return False
+        return self.lease_check is None or self.lease_check()
+    
+    def _check_datasets(self, stop_event: Optional[threading.Event] = None, wait: bool = True) -> bool:
+        """Ejecuta un ciclo de verificación; con wait=False se omite si ya hay uno en curso"""
+        if not self._cycle_lock.acquire(blocking=wait):
+            logger.info("Ya hay un ciclo de verificación en curso; se omite")
+            return False
+        try:
+            if self._state_stale:
+                self._load_state()
+                self._state_stale = False
+            self._run_cycle(stop_event)
+        finally:
+            self._cycle_lock.release()
+        return True
+    
+    def _run_cycle(self, stop_event: Optional[threading.Event] = None):
         """Verifica todos los datasets y guarda resultados"""
         try:
-            # Cargar datasets desde sources.yaml
-            datasets = load_sources()
+            # Cargar datasets desde sources.yaml (solo se re-parsea si el archivo cambió)
+            catalog = get_catalog()
+            datasets = catalog.load()
             logger.info(f"Verificando {len(datasets)} datasets...")
             
-            # Registrar datasets en la BD si no existen
-            self.db.register_datasets(datasets)
+            # Sincronizar la tabla datasets solo cuando cambia el catálogo
+            if catalog.revision != self._registered_revision:
+                synced = self.db.register_datasets(datasets)
+                self._registered_revision = catalog.revision
+                logger.info(f"Catálogo revisión {catalog.revision}: {catalog.last_diff.summary()}, BD: {synced}")
             
             # Obtener estados anteriores para detectar cambios
             previous_states = {}
+            latest_statuses = {}
+            validators = {}
             for dataset in datasets:
                 prev_status = self.db.get_latest_dataset_status(dataset['id'])
                 if prev_status:
                     previous_states[dataset['id']] = prev_status.status
+                    latest_statuses[dataset['id']] = prev_status
+                    # ETag/Last-Modified para probes condicionales
+                    validators[dataset['id']] = {
+                        'etag': prev_status.etag,
+                        'last_modified': prev_status.last_modified
+                    }
             
             # Verificar estado de cada dataset
-            results = check_all(datasets)
+            # Timeouts derivados de la latencia histórica de cada dataset
+            if self.adaptive_timeouts:
+                datasets = with_adaptive_timeouts(datasets, self.db.get_recent_latencies())
+            
+            # Probes de cada host repartidos en una fracción del intervalo
+            spread = host_politeness.spread_window(self.check_interval) if stop_event is not None else 0.0
+            if self.check_shards > 1:
+                results, self.last_shard_stats = check_sharded(
+                    datasets, self.check_shards, breaker=self.breakers, validators=validators,
+                    spread=spread
+                )
+            else:
+                results = check_all(datasets, breaker=self.breakers, validators=validators, spread=spread)
             check_time = datetime.now(timezone.utc)
+            if not self._may_persist(stop_event):
+                # El lease se perdió durante el chequeo: otro worker ya puede ser líder
+                logger.warning("Ciclo descartado: este worker ya no es líder")
+                return
+            self.db.save_circuit_breakers(self.breakers.pop_dirty())
             
             # Guardar resultados y detectar cambios
             changes_detected = []
+            anomalies = []
+            cycle_statuses = []
             for result in results:
+                if result.get('error') == CIRCUIT_OPEN_ERROR:
+                    # Circuito abierto: no hubo probe, se conserva el último estado real
+                    # (guardarlo como 'down' inflaría fallos y uptime con chequeos inexistentes)
+                    if result['id'] in latest_statuses:
+                        cycle_statuses.append(asdict(latest_statuses[result['id']]))
+                    continue
                 status = DatasetStatus(
                     id=result['id'],
                     name=result['name'],
@@ -124,13 +274,32 @@ class DatasetMonitor:
                     http_code=result.get('http_code'),
                     latency_ms=result.get('latency_ms'),
                     error=result.get('error'),
-                    checked_at=check_time
+                    checked_at=check_time,
+                    etag=result.get('etag'),
+                    last_modified=result.get('last_modified'),
+                    content_changed=result.get('content_changed'),
+                    dns_ms=result.get('dns_ms'),
+                    connect_ms=result.get('connect_ms'),
+                    tls_ms=result.get('tls_ms'),
+                    ttfb_ms=result.get('ttfb_ms')
                 )
                 self.db.save_dataset_status(status)
+                cycle_statuses.append(status.to_dict())
+                
+                # Detectores online; los resultados sin probe real no cuentan
+                if result.get('error') != RATE_LIMITED_ERROR:
+                    for event in self.detectors.update(result['id'], result['status'], result.get('latency_ms')):
+                        anomalies.append({**event, 'name': result['name'], 'category': result['category']})
                 
                 # Detectar cambios de estado
                 prev_status = previous_states.get(result['id'])
-                if prev_status and prev_status != result['status']:
+                status_changed = bool(prev_status and prev_status != result['status'])
+                self._publish_result({
+                    **status.to_dict(),
+                    'previous_status': prev_status,
+                    'status_changed': status_changed
+                })
+                if status_changed:
                     changes_detected.append({
                         'dataset_id': result['id'],
                         'dataset_name': result['name'],
@@ -139,18 +308,26 @@ class DatasetMonitor:
                         'error': result.get('error')
                     })
             
+            self.db.save_anomaly_detectors(self.detectors.pop_dirty())
+            
             # Enviar notificaciones de cambios
             self._send_change_notifications(changes_detected)
+            self._send_anomaly_notifications(anomalies)
+            self._publish_cycle(cycle_statuses)
             
             # Invalidar cache para forzar actualización
             invalidate_datasets_cache()
             
             # Log de resumen
             available = len([r for r in results if r['status'] == 'up'])
-            logger.info(f"Check completado: {available}/{len(results)} datasets disponibles")
+            skipped = len([r for r in results if r.get('error') == CIRCUIT_OPEN_ERROR])
+            logger.info(f"Check completado: {available}/{len(results)} datasets disponibles"
+                        f" ({skipped} con circuito abierto, sin verificar)")
             
             if changes_detected:
                 logger.info(f"Detectados {len(changes_detected)} cambios de estado")
+            if anomalies:
+                logger.info(f"Detectores: {len(anomalies)} degradaciones/recuperaciones")
             
         except Exception as e:
             logger.error(f"Error verificando datasets: {e}")
@@ -177,28 +354,70 @@ class DatasetMonitor:
         except Exception as e:
             logger.error(f"Error enviando notificaciones de cambios: {e}")
     
+    def _send_anomaly_notifications(self, anomalies: List[Dict]):
+        """Notifica y publica las degradaciones/recuperaciones detectadas"""
+        try:
+            from notifications import create_dataset_anomaly_notification
+            
+            for event in anomalies:
+                create_dataset_anomaly_notification(event['name'], event)
+                self._publish_anomaly(event)
+        except Exception as e:
+            logger.error(f"Error enviando notificaciones de anomalías: {e}")
+    
+    def _maintenance_loop(self, stop_event: threading.Event):
+        """Retención del historial al iniciar y luego cada `maintenance_interval` segundos"""
+        while not stop_event.is_set():
+            self._cleanup_old_data()
+            stop_event.wait(self.maintenance_interval)
+    
     def _cleanup_old_data(self):
-        """Limpia datos antiguos de la base de datos"""
+        """Elimina las particiones de historial fuera de la retención"""
         try:
             logger.info("Limpiando datos antiguos...")
-            self.db.cleanup_old_data(days=7)  # Mantener solo 7 días
-            logger.info("Limpieza completada")
+            started = time.time()
+            stats = self.db.cleanup_old_data(days=self.retention_days)
+            self.last_maintenance = {
+                **stats,
+                'ran_at': datetime.now(timezone.utc).isoformat(),
+                'duration_ms': round((time.time() - started) * 1000, 1)
+            }
+            logger.info(f"Limpieza completada: {len(stats['dropped_partitions'])} particiones eliminadas, "
+                        f"{stats['freed_pages']} páginas liberadas")
         except Exception as e:
             logger.error(f"Error en limpieza: {e}")
     
-    def force_check(self):
-        """Fuerza una verificación inmediata"""
+    def force_check(self) -> bool:
+        """Fuerza una verificación inmediata (se omite si ya hay un ciclo en curso)"""
         logger.info("Forzando verificación inmediata...")
-        self._check_datasets()
+        return self._check_datasets(wait=False)
 
 
 class BackgroundScheduler:
-    """Scheduler en background para tareas periódicas"""
+    """
+    Scheduler en background para tareas periódicas
+    
+    Con varios workers solo el que posee el lease de líder ejecuta el monitor;
+    el resto atiende lecturas y toma el relevo si el líder deja de renovarlo.
+    """
+    
+    FORCE_CHECK_CHANNEL = 'monitor:force_check'
     
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, bus: Optional[MessageBus] = None, lease_ttl: float = 30.0,
+                 check_shards: int = 1, retention_days: int = HISTORY_RETENTION_DAYS):
         self.db = db
-        self.monitor = DatasetMonitor(db)
+        self.monitor = DatasetMonitor(db, check_shards=check_shards, retention_days=retention_days)
+        self.lease = LeaderLease(db.db_path, ttl=lease_ttl)
+        self.monitor.lease_check = lambda: self.lease.is_leader
+        self.bus = bus or LocalMessageBus()
+        self.bus.subscribe(self.FORCE_CHECK_CHANNEL, self._handle_force_check)
         self.running = False
+        self._stop_event = threading.Event()
+        self._heartbeat_thread = None
+    
+    @property
+    def is_leader(self) -> bool:
+        return self.lease.is_leader
     
     def start(self):
         """Inicia todas las tareas en background"""
@@ -207,15 +426,44 @@ class BackgroundScheduler:
         
         logger.info("Iniciando scheduler en background...")
         self.running = True
+        self._stop_event.clear()
         
-        # Iniciar monitor de datasets
-        self.monitor.start()
+        # Primera elección síncrona: un único proceso se comporta como antes
+        if self.lease.try_acquire():
+            self._become_leader()
+        else:
+            logger.info("Otro worker tiene el lease de líder; este proceso solo atiende lecturas")
         
-        # Hacer una verificación inicial
-        self.monitor.force_check()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat_thread.start()
         
         logger.info("Scheduler iniciado correctamente")
     
+    def _become_leader(self):
+        # Iniciar monitor de datasets (su loop hace la verificación inicial)
+        self.monitor.start()
+    
+    def _heartbeat_loop(self):
+        """Renueva el lease y arranca o detiene el monitor según el resultado"""
+        interval = self.lease.ttl / 3
+        while not self._stop_event.wait(interval):
+            was_leader = self.monitor.running
+            if self.lease.try_acquire():
+                if not was_leader:
+                    logger.info("Este worker pasa a ser líder: iniciando monitor")
+                    self.monitor.start()
+            elif was_leader:
+                logger.warning("Lease de líder perdido: deteniendo monitor")
+                self.monitor.stop()
+    
+    def request_check(self):
+        """Pide una verificación inmediata al worker líder (sea este u otro)"""
+        self.bus.publish(self.FORCE_CHECK_CHANNEL, {'requested_by': self.lease.holder_id})
+    
+    def _handle_force_check(self, message: Dict):
+        if self.is_leader:
+            self.monitor.force_check()
+    
     def stop(self):
         """Detiene todas las tareas"""
         if not self.running:
@@ -223,9 +471,13 @@ class BackgroundScheduler:
         
         logger.info("Deteniendo scheduler...")
         self.running = False
+        self._stop_event.set()
+        if self._heartbeat_thread and self._heartbeat_thread.is_alive():
+            self._heartbeat_thread.join(timeout=5)
         
-        # Detener monitor
+        # Detener monitor y ceder el liderazgo
         self.monitor.stop()
+        self.lease.release()
         
         logger.info("Scheduler detenido")
     
@@ -235,6 +487,16 @@ class BackgroundScheduler:
             'running': self.running,
             'monitor_running': self.monitor.running,
             'check_interval': self.monitor.check_interval,
+            'leader': self.lease.get_info(),
+            'open_circuits': self.monitor.breakers.open_circuits(),
+            'degraded_datasets': self.monitor.detectors.degraded(),
+            'check_shards': self.monitor.check_shards,
+            'last_shard_stats': self.monitor.last_shard_stats,
+            'history_retention_days': self.monitor.retention_days,
+            'last_maintenance': self.monitor.last_maintenance,
+            'dns_cache': dns_cache.stats(),
+            'host_politeness': host_politeness.stats(),
+            'catalog': get_catalog().info(),
             'database_stats': self.db.get_availability_stats(hours=1)
         }
 
@@ -243,10 +505,12 @@ class BackgroundScheduler:
 scheduler = None
 
 
-def init_scheduler(db: Database):
+def init_scheduler(db: Database, bus: Optional[MessageBus] = None, lease_ttl: float = 30.0,
+                   check_shards: int = 1, retention_days: int = HISTORY_RETENTION_DAYS):
     """Inicializa el scheduler global"""
     global scheduler
-    scheduler = BackgroundScheduler(db)
+    scheduler = BackgroundScheduler(db, bus=bus, lease_ttl=lease_ttl, check_shards=check_shards,
+                                    retention_days=retention_days)
     return scheduler
 
 
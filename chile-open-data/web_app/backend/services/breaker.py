@@ -0,0 +1,150 @@
+# /web_app/backend/services/breaker.py
+"""
+Circuit breaker por dataset y por host para el checker.
+
+Un dataset (o un host completo) que falla de forma persistente deja de
+verificarse en cada ciclo: su circuito se abre y solo se vuelve a probar
+(half-open) después de un intervalo que crece exponencialmente con cada
+reapertura. Así los endpoints caídos no consumen su timeout completo ni
+ocupan workers en cada ciclo.
+"""
+from dataclasses import dataclass, asdict
+from urllib.parse import urlparse
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Error registrado para los datasets que se saltan por circuito abierto
+CIRCUIT_OPEN_ERROR = "CircuitOpen"
+
+
+@dataclass
+class BreakerState:
+    key: str
+    state: str = CLOSED
+    failures: int = 0            # fallos consecutivos
+    opened_count: int = 0        # aperturas consecutivas (define el backoff)
+    next_probe_at: float = 0.0   # epoch a partir del cual se permite un probe
+    last_error: str | None = None
+    updated_at: float = 0.0
+
+
+def dataset_key(ds: dict) -> str:
+    return f"dataset:{ds['id']}"
+
+
+def host_key(ds: dict) -> str:
+    return f"host:{urlparse(ds['url']).hostname or ''}"
+
+
+class CircuitBreakerRegistry:
+    """Estados de circuito de todos los datasets y hosts.
+
+    `allow` se llama antes de enviar cada verificación y `record` con cada
+    resultado; ambos desde el hilo que coordina `check_all`.
+    """
+
+    def __init__(self, failure_threshold: int = 3, host_failure_threshold: int = 5,
+                 base_interval: float = 60.0, max_interval: float = 3600.0):
+        self.failure_threshold = failure_threshold
+        self.host_failure_threshold = host_failure_threshold
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self._states: dict[str, BreakerState] = {}
+        self._dirty: set[str] = set()
+        # host -> id del dataset que hace el probe half-open de ese host
+        self._host_probes: dict[str, str] = {}
+
+    def load(self, rows: list[dict]) -> None:
+        """Carga estados persistidos (un half-open interrumpido vuelve a open)."""
+        for row in rows:
+            st = BreakerState(**row)
+            if st.state == HALF_OPEN:
+                st.state = OPEN
+            self._states[st.key] = st
+
+    def _get(self, key: str) -> BreakerState:
+        st = self._states.get(key)
+        if st is None:
+            st = self._states[key] = BreakerState(key=key)
+        return st
+
+    def begin_cycle(self) -> None:
+        """Descarta probes de host pendientes de un ciclo anterior."""
+        self._host_probes.clear()
+
+    def allow(self, ds: dict, now: float | None = None) -> bool:
+        """Indica si el dataset debe verificarse en este ciclo."""
+        now = time.time() if now is None else now
+        st = self._get(dataset_key(ds))
+        if st.state != CLOSED and now < st.next_probe_at:
+            return False
+
+        hk = host_key(ds)
+        host = self._get(hk)
+        if host.state != CLOSED:
+            probe_id = self._host_probes.get(hk)
+            if probe_id is None and now >= host.next_probe_at:
+                # half-open: un solo dataset prueba el host
+                self._set_state(host, HALF_OPEN, now)
+                self._host_probes[hk] = ds["id"]
+            elif probe_id != ds["id"]:
+                return False
+
+        if st.state != CLOSED:
+            self._set_state(st, HALF_OPEN, now)
+        return True
+
+    def record(self, ds: dict, status: str, http_code: int | None,
+               error: str | None, now: float | None = None) -> None:
+        """Actualiza los circuitos del dataset y de su host con un resultado."""
+        now = time.time() if now is None else now
+        hk = host_key(ds)
+        self._host_probes.pop(hk, None)
+
+        # El host está sano si respondió algo, aunque el dataset falle
+        host = self._get(hk)
+        if http_code is not None:
+            self._close(host, now)
+        else:
+            self._fail(host, error, self.host_failure_threshold, now)
+
+        st = self._get(dataset_key(ds))
+        if status == "up":
+            self._close(st, now)
+        else:
+            self._fail(st, error, self.failure_threshold, now)
+
+    def _close(self, st: BreakerState, now: float) -> None:
+        if st.state != CLOSED or st.failures or st.opened_count:
+            st.failures = 0
+            st.opened_count = 0
+            st.next_probe_at = 0.0
+            st.last_error = None
+            self._set_state(st, CLOSED, now)
+
+    def _fail(self, st: BreakerState, error: str | None, threshold: int, now: float) -> None:
+        st.failures += 1
+        st.last_error = error
+        if st.state == HALF_OPEN or st.failures >= threshold:
+            st.opened_count += 1
+            interval = min(self.base_interval * 2 ** (st.opened_count - 1), self.max_interval)
+            st.next_probe_at = now + interval
+            st.state = OPEN
+        self._set_state(st, st.state, now)
+
+    def _set_state(self, st: BreakerState, state: str, now: float) -> None:
+        st.state = state
+        st.updated_at = now
+        self._dirty.add(st.key)
+
+    def pop_dirty(self) -> list[dict]:
+        """Devuelve los estados modificados desde la última llamada."""
+        rows = [asdict(self._states[k]) for k in self._dirty]
+        self._dirty.clear()
+        return rows
+
+    def open_circuits(self) -> list[dict]:
+        return [asdict(st) for st in self._states.values() if st.state != CLOSED]
@@ -0,0 +1,85 @@
+# /web_app/backend/services/catalog_snapshot.py
+"""
+Snapshots binarios del catálogo ya parseado y validado.
+
+Parsear YAML y validar cada dataset domina el arranque en frío con catálogos
+grandes. `cached_parse` guarda el resultado de la función de parseo en un
+pickle junto al archivo de origen (en `__catalog_cache__/`), con clave en el
+hash SHA-256 del contenido: mientras el YAML no cambie, cargar el catálogo
+cuesta leer y deserializar un archivo.
+
+Los snapshots son archivos locales generados por este mismo proceso; se
+descartan si no se pueden leer. Solo depende de la biblioteca estándar y el
+scraper lo importa como `web_app.backend.services.catalog_snapshot`.
+"""
+from pathlib import Path
+from typing import Any, Callable
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Cambiar al modificar la forma de los objetos guardados
+SNAPSHOT_VERSION = 1
+CACHE_DIRNAME = "__catalog_cache__"
+
+
+def source_hash(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def snapshot_path(source: Path, namespace: str, digest: str) -> Path:
+    """Ruta del snapshot de `source` para un consumidor (`namespace`) y hash."""
+    return source.parent / CACHE_DIRNAME / f"{source.name}.{namespace}.v{SNAPSHOT_VERSION}.{digest[:32]}.pickle"
+
+
+def load_snapshot(source: Path, namespace: str, digest: str, kind: type | None = None) -> Any | None:
+    """Valor guardado, o None si no existe, no se puede leer o no es de tipo `kind`."""
+    path = snapshot_path(source, namespace, digest)
+    try:
+        with open(path, "rb") as f:
+            value = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Snapshot de catálogo inválido {path}: {e}")
+        return None
+    if kind is not None and not isinstance(value, kind):
+        logger.warning(f"Snapshot de catálogo incompatible {path}: {type(value).__name__}")
+        return None
+    return value
+
+
+def save_snapshot(source: Path, namespace: str, digest: str, value: Any) -> None:
+    """Escribe el snapshot de forma atómica y borra los de versiones anteriores."""
+    path = snapshot_path(source, namespace, digest)
+    try:
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        for old in path.parent.glob(f"{source.name}.{namespace}.*.pickle"):
+            if old != path:
+                old.unlink(missing_ok=True)
+    except OSError as e:
+        # Sin permisos de escritura el catálogo funciona igual, solo sin snapshot
+        logger.warning(f"No se pudo guardar el snapshot de catálogo {path}: {e}")
+
+
+def cached_parse(source: Path, raw: bytes, namespace: str, parse: Callable[[bytes], Any],
+                 digest: str | None = None, kind: type | None = None) -> Any:
+    """Resultado de `parse(raw)`, desde el snapshot si el contenido no cambió.
+
+    Un snapshot ilegible o que no es de tipo `kind` se descarta: se vuelve a
+    parsear y se reescribe.
+    """
+    digest = digest or source_hash(raw)
+    value = load_snapshot(source, namespace, digest, kind)
+    if value is None:
+        value = parse(raw)
+        save_snapshot(source, namespace, digest, value)
+    return value
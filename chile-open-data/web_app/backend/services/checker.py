@@ -1,9 +1,29 @@
 # /web_app/backend/services/checker.py
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, asdict
+from urllib.parse import urlparse
+import math
+import multiprocessing
+import threading
 import time
+import zlib
 import requests
 
+from services.breaker import CircuitBreakerRegistry, CIRCUIT_OPEN_ERROR
+from services.dns_cache import dns_cache, url_hosts, configure_dns_cache
+from services.http_timing import get_phases, start_phases, timed_session
+from services.politeness import (
+    host_politeness, configure_politeness, spread_by_host, HostRateLimited,
+    RATE_LIMITED_ERROR, RATE_LIMIT_CODES
+)
+
+# Timeouts adaptativos: p99 de la latencia reciente × factor, acotado entre
+# un piso y el timeout configurado en sources.yaml
+ADAPTIVE_TIMEOUT_FACTOR = 3.0
+ADAPTIVE_TIMEOUT_FLOOR = 2.0
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = 20
+
 @dataclass
 class CheckResult:
     id: str
@@ -14,29 +34,105 @@ class CheckResult:
     http_code: int | None
     latency_ms: float | None
     error: str | None
+    etag: str | None = None
+    last_modified: str | None = None
+    content_changed: bool | None = None   # None: sin validadores para comparar
+    dns_ms: float | None = None           # parte de latency_ms usada en resolver el host
+    connect_ms: float | None = None       # apertura TCP
+    tls_ms: float | None = None           # handshake TLS (solo https)
+    ttfb_ms: float | None = None          # espera de las cabeceras de respuesta
+
+def adaptive_timeout(latencies_ms: list[float], configured: float,
+                     factor: float = ADAPTIVE_TIMEOUT_FACTOR,
+                     floor: float = ADAPTIVE_TIMEOUT_FLOOR,
+                     min_samples: int = ADAPTIVE_TIMEOUT_MIN_SAMPLES) -> float:
+    """Timeout (s) derivado del p99 de latencias históricas; sin historia suficiente usa el configurado."""
+    if len(latencies_ms) < min_samples:
+        return configured
+    ordered = sorted(latencies_ms)
+    # Nearest-rank: con 100 muestras el p99 es la segunda peor, no el máximo
+    p99 = ordered[max(0, math.ceil(0.99 * len(ordered)) - 1)]
+    return round(min(configured, max(floor, p99 / 1000 * factor)), 2)
+
+def with_adaptive_timeouts(datasets: list[dict], latencies: dict[str, list[float]]) -> list[dict]:
+    """Copia de los datasets con `timeout` ajustado según su historial de latencias."""
+    adjusted = []
+    for ds in datasets:
+        configured = float(ds.get("timeout", 6))
+        timeout = adaptive_timeout(latencies.get(ds["id"], []), configured)
+        adjusted.append({**ds, "timeout": timeout} if timeout != configured else ds)
+    return adjusted
+
+def _probe_headers(validators: dict | None) -> dict:
+    """Cabeceras condicionales con los validadores del chequeo anterior."""
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
 
-def _check_one(ds: dict) -> CheckResult:
+def _content_changed(resp: requests.Response, validators: dict | None) -> bool | None:
+    if resp.status_code == 304:
+        return False
+    if not validators or resp.status_code >= 400:
+        return None
+    etag = resp.headers.get("ETag")
+    if validators.get("etag") and etag:
+        return etag != validators["etag"]
+    last_modified = resp.headers.get("Last-Modified")
+    if validators.get("last_modified") and last_modified:
+        return last_modified != validators["last_modified"]
+    return None
+
+def _check_one(ds: dict, validators: dict | None = None, not_before: float | None = None) -> CheckResult:
     method = ds.get("method", "HEAD").upper()
     timeout = float(ds.get("timeout", 6))
     url = ds["url"]
+    headers = _probe_headers(validators)
+    # En GET pedimos un solo byte: basta para saber si el recurso responde
+    get_headers = {**headers, "Range": "bytes=0-0"}
+    if not_before is not None:
+        # Turno asignado por spread_by_host (reloj monotónico)
+        wait = not_before - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+    start_phases()
     t0 = time.perf_counter()
+    dns_ms = None
     try:
-        # Preferimos HEAD para rapidez; si falla, intentamos GET liviano.
-        if method == "HEAD":
-            resp = requests.head(url, timeout=timeout, allow_redirects=True)
-            if resp.status_code >= 400:
-                # fallback a GET por si el servidor no implementa HEAD correctamente
-                resp = requests.get(url, timeout=timeout, stream=True)
-        else:
-            resp = requests.get(url, timeout=timeout, stream=True)
+        host = urlparse(url).hostname or ""
+        # La resolución queda en el cache DNS y la request la reutiliza
+        dns_ms = dns_cache.resolve(host)
+        # Cupo por host: limita la concurrencia, espacia los probes y respeta Retry-After
+        with host_politeness.slot(host), timed_session(resolver=dns_cache) as session:
+            # La espera del cupo no cuenta como latencia del dataset
+            t0 = time.perf_counter() - dns_ms / 1000
+            # Preferimos HEAD para rapidez; si falla, intentamos GET liviano.
+            if method == "HEAD":
+                resp = session.head(url, timeout=timeout, allow_redirects=True, headers=headers)
+                if resp.status_code >= 400 and resp.status_code not in RATE_LIMIT_CODES:
+                    # fallback a GET por si el servidor no implementa HEAD correctamente
+                    resp = session.get(url, timeout=timeout, stream=True, headers=get_headers)
+            else:
+                resp = session.get(url, timeout=timeout, stream=True, headers=get_headers)
 
         latency = (time.perf_counter() - t0) * 1000
-        status = "up" if 200 <= resp.status_code < 400 else "down"
+        if 200 <= resp.status_code < 400:
+            status = "up"
+        elif host_politeness.record_response(host, resp.status_code, resp.headers) is not None:
+            # Rate limiting con Retry-After: el host responde, no está caído
+            status = "unknown"
+        else:
+            status = "down"
         # cerrar stream si corresponde
         try:
             resp.close()
         except Exception:
             pass
+        # Un 304 no trae validadores nuevos: se conservan los anteriores
+        previous = validators or {}
         return CheckResult(
             id=ds["id"],
             name=ds["name"],
@@ -45,7 +141,27 @@ def _check_one(ds: dict) -> CheckResult:
             status=status,
             http_code=resp.status_code,
             latency_ms=round(latency, 1),
-            error=None
+            error=RATE_LIMITED_ERROR if status == "unknown" else None,
+            etag=resp.headers.get("ETag") or previous.get("etag"),
+            last_modified=resp.headers.get("Last-Modified") or previous.get("last_modified"),
+            content_changed=_content_changed(resp, validators),
+            dns_ms=dns_ms,
+            **get_phases()
+        )
+    except HostRateLimited:
+        # El host sigue dentro de su Retry-After: el probe se difiere
+        return CheckResult(
+            id=ds["id"],
+            name=ds["name"],
+            category=ds["category"],
+            url=url,
+            status="unknown",
+            http_code=None,
+            latency_ms=None,
+            error=RATE_LIMITED_ERROR,
+            etag=(validators or {}).get("etag"),
+            last_modified=(validators or {}).get("last_modified"),
+            dns_ms=dns_ms
         )
     except Exception as e:
         latency = (time.perf_counter() - t0) * 1000
@@ -57,26 +173,194 @@ def _check_one(ds: dict) -> CheckResult:
             status="down",
             http_code=None,
             latency_ms=round(latency, 1),
-            error=str(e.__class__.__name__)
+            error=str(e.__class__.__name__),
+            etag=(validators or {}).get("etag"),
+            last_modified=(validators or {}).get("last_modified"),
+            dns_ms=dns_ms,
+            **get_phases()
         )
 
-def check_all(datasets: list[dict], max_workers: int = 8) -> list[dict]:
-    """Chequea todos los datasets en paralelo y devuelve lista de dicts serializables."""
-    results: list[dict] = []
+def _skipped(ds: dict, validators: dict | None = None) -> CheckResult:
+    """Resultado para un dataset cuyo circuito está abierto (no se verifica)."""
+    validators = validators or {}
+    return CheckResult(
+        id=ds["id"],
+        name=ds["name"],
+        category=ds["category"],
+        url=ds["url"],
+        status="down",
+        http_code=None,
+        latency_ms=None,
+        error=CIRCUIT_OPEN_ERROR,
+        etag=validators.get("etag"),
+        last_modified=validators.get("last_modified")
+    )
+
+def _filter_open_circuits(datasets: list[dict], breaker: CircuitBreakerRegistry | None,
+                          validators: dict[str, dict]) -> tuple[list[dict], list[CheckResult]]:
+    """Separa los datasets a verificar de los que tienen el circuito abierto."""
+    if breaker is None:
+        return datasets, []
+    breaker.begin_cycle()
+    to_check, skipped = [], []
+    for ds in datasets:
+        if breaker.allow(ds):
+            to_check.append(ds)
+        else:
+            skipped.append(_skipped(ds, validators.get(ds["id"])))
+    return to_check, skipped
+
+def _check_batch(datasets: list[dict], validators: dict[str, dict], max_workers: int,
+                 breaker: CircuitBreakerRegistry | None = None,
+                 spread: float = 0.0) -> list[CheckResult]:
+    """Verifica un lote de datasets con un pool de hilos.
+
+    Con `spread` > 0, los probes de cada host se reparten en esos segundos.
+    """
+    checked: list[CheckResult] = []
+    # Pre-resolución de los hosts del lote antes de lanzar los probes
+    dns_cache.prefetch(url_hosts(ds["url"] for ds in datasets), max_workers=max_workers)
+    started = time.monotonic()
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futures = {ex.submit(_check_one, ds): ds["id"] for ds in datasets}
+        # Se encolan por turno (sin ventana, alternando hosts): un worker solo
+        # espera el turno más próximo y no quedan todos esperando el cupo de un host
+        futures = {
+            ex.submit(_check_one, ds, validators.get(ds["id"]), started + offset if offset else None): ds
+            for offset, ds in spread_by_host(datasets, spread)
+        }
         for fut in as_completed(futures):
             r: CheckResult = fut.result()
-            results.append({
-                "id": r.id,
-                "name": r.name,
-                "category": r.category,
-                "url": r.url,
-                "status": r.status,
-                "http_code": r.http_code,
-                "latency_ms": r.latency_ms,
-                "error": r.error
-            })
+            # El rate limiting no cuenta como fallo para los circuitos
+            if breaker is not None and r.error != RATE_LIMITED_ERROR:
+                breaker.record(futures[fut], r.status, r.http_code, r.error)
+            checked.append(r)
+    return checked
+
+def _to_dicts(checked: list[CheckResult]) -> list[dict]:
+    results = [asdict(r) for r in checked]
     # ordenemos por categoría y nombre para una UI estable
     results.sort(key=lambda x: (x["category"], x["name"]))
-    return results
\ No newline at end of file
+    return results
+
+def check_all(datasets: list[dict], max_workers: int = 8,
+              breaker: CircuitBreakerRegistry | None = None,
+              validators: dict[str, dict] | None = None,
+              spread: float = 0.0) -> list[dict]:
+    """Chequea todos los datasets en paralelo y devuelve lista de dicts serializables.
+
+    Con `breaker`, los datasets (o hosts) con el circuito abierto no se
+    verifican y se reportan como caídos con error `CircuitOpen` (el monitor
+    no los guarda como chequeos).
+    `validators` mapea id -> {"etag", "last_modified"} del chequeo anterior
+    para hacer probes condicionales.
+    `spread` (s) reparte los probes de cada host en esa ventana con jitter.
+    """
+    validators = validators or {}
+    to_check, checked = _filter_open_circuits(datasets, breaker, validators)
+    checked += _check_batch(to_check, validators, max_workers, breaker, spread)
+    return _to_dicts(checked)
+
+def shard_for(ds: dict, shards: int) -> int:
+    """Shard estable de un dataset según el hash de su host."""
+    host = urlparse(ds["url"]).hostname or ""
+    return zlib.crc32(host.encode("utf-8")) % shards
+
+# Pool de procesos de los shards: se crea una vez (no en cada ciclo) y con
+# 'spawn', porque hacer fork de un proceso con eventlet e hilos puede heredar
+# locks tomados y bloquear al hijo
+_shard_pool: ProcessPoolExecutor | None = None
+_shard_pool_size = 0
+_shard_pool_lock = threading.Lock()
+
+def _init_shard(politeness: dict, dns: dict) -> None:
+    """Inicializa cada proceso con la configuración del padre (spawn no la hereda)."""
+    configure_politeness(**politeness)
+    configure_dns_cache(**dns)
+
+def _get_shard_pool(shards: int) -> ProcessPoolExecutor:
+    global _shard_pool, _shard_pool_size
+    with _shard_pool_lock:
+        if _shard_pool is None or _shard_pool_size != shards:
+            if _shard_pool is not None:
+                _shard_pool.shutdown(wait=False, cancel_futures=True)
+            politeness = {
+                "max_per_host": host_politeness.max_per_host,
+                "min_delay": host_politeness.min_delay,
+                "jitter": host_politeness.jitter,
+                "max_wait": host_politeness.max_wait,
+                "spread_fraction": host_politeness.spread_fraction
+            }
+            dns = {"ttl": dns_cache.ttl, "negative_ttl": dns_cache.negative_ttl}
+            _shard_pool = ProcessPoolExecutor(
+                max_workers=shards,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_shard,
+                initargs=(politeness, dns)
+            )
+            _shard_pool_size = shards
+        return _shard_pool
+
+def shutdown_shard_pool() -> None:
+    """Termina los procesos de los shards (al detener el monitor)."""
+    global _shard_pool, _shard_pool_size
+    with _shard_pool_lock:
+        if _shard_pool is not None:
+            _shard_pool.shutdown(wait=True, cancel_futures=True)
+        _shard_pool = None
+        _shard_pool_size = 0
+
+def _run_shard(index: int, datasets: list[dict], validators: dict[str, dict],
+               max_workers: int, spread: float = 0.0) -> tuple[int, list[CheckResult], float]:
+    """Punto de entrada de cada proceso: verifica su shard y mide el tiempo."""
+    t0 = time.perf_counter()
+    checked = _check_batch(datasets, validators, max_workers, spread=spread)
+    return index, checked, round((time.perf_counter() - t0) * 1000, 1)
+
+def check_sharded(datasets: list[dict], shards: int, max_workers: int = 8,
+                  breaker: CircuitBreakerRegistry | None = None,
+                  validators: dict[str, dict] | None = None,
+                  spread: float = 0.0) -> tuple[list[dict], list[dict]]:
+    """Como `check_all`, pero reparte los datasets por host entre `shards` procesos.
+
+    Cada proceso verifica su partición con su propio pool de `max_workers`
+    hilos; todos los datasets de un host caen en el mismo shard. Los procesos
+    son de un pool persistente creado con 'spawn'. Devuelve los resultados
+    combinados y el tiempo de cada shard.
+    """
+    validators = validators or {}
+    to_check, checked = _filter_open_circuits(datasets, breaker, validators)
+
+    partitions: list[list[dict]] = [[] for _ in range(shards)]
+    for ds in to_check:
+        partitions[shard_for(ds, shards)].append(ds)
+
+    by_id = {ds["id"]: ds for ds in to_check}
+    shard_stats: list[dict] = []
+    ex = _get_shard_pool(shards)
+    futures = []
+    for i, part in enumerate(partitions):
+        if not part:
+            continue
+        part_validators = {ds["id"]: validators[ds["id"]] for ds in part if ds["id"] in validators}
+        futures.append(ex.submit(_run_shard, i, part, part_validators, max_workers, spread))
+    for fut in as_completed(futures):
+        try:
+            index, shard_checked, elapsed_ms = fut.result()
+        except BrokenProcessPool:
+            # Un proceso murió: el próximo ciclo crea un pool nuevo
+            shutdown_shard_pool()
+            raise
+        if breaker is not None:
+            for r in shard_checked:
+                if r.error == RATE_LIMITED_ERROR:
+                    continue
+                breaker.record(by_id[r.id], r.status, r.http_code, r.error)
+        checked += shard_checked
+        shard_stats.append({
+            "shard": index,
+            "datasets": len(partitions[index]),
+            "elapsed_ms": elapsed_ms
+        })
+
+    shard_stats.sort(key=lambda x: x["shard"])
+    return _to_dicts(checked), shard_stats
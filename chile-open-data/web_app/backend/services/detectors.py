@@ -0,0 +1,160 @@
+# /web_app/backend/services/detectors.py
+"""
+Detección incremental de degradaciones por dataset.
+
+Cada resultado del monitor actualiza en O(1) dos detectores por dataset:
+
+- Latencia: media y varianza EWMA de la latencia (en log, porque es
+  asimétrica) y un CUSUM unilateral sobre el desvío estandarizado. Detecta
+  subidas sostenidas aunque cada chequeo por sí solo parezca normal.
+- Tasa de fallos: EWMA lenta como línea base y CUSUM de Bernoulli sobre
+  los fallos que exceden esa base. Detecta datasets intermitentes que
+  no llegan a quedar "down" de forma estable.
+
+Mientras un detector está en alarma su línea base se congela, para que la
+degradación no pase a ser "lo normal". Al volver el CUSUM a cero se emite
+la recuperación. El estado se persiste entre reinicios como el de los
+circuit breakers.
+"""
+from dataclasses import dataclass, asdict
+import math
+import time
+
+# Suavizado de la línea base de latencia (media/varianza en log)
+LATENCY_ALPHA = 0.1
+# Holgura (en desvíos estándar) y umbral de alarma del CUSUM de latencia
+LATENCY_K = 0.5
+LATENCY_H = 5.0
+# Varianza mínima en log: evita alarmas por jitter en datasets muy estables (~10%)
+LATENCY_MIN_VARIANCE = 0.01
+# Suavizado de la línea base de fallos y de la tasa reportada
+FAILURE_BASE_ALPHA = 0.02
+FAILURE_ALPHA = 0.1
+# Exceso de tasa de fallos sobre la base que se tolera, y umbral del CUSUM
+FAILURE_K = 0.1
+FAILURE_H = 2.0
+# Chequeos antes de poder alarmar (la línea base necesita muestras)
+WARMUP_SAMPLES = 20
+# El CUSUM se acota para que una degradación larga no demore la recuperación
+CUSUM_CAP = 1.5
+
+DEGRADED = "degraded"
+RECOVERED = "recovered"
+
+
+@dataclass
+class DetectorState:
+    dataset_id: str
+    samples: int = 0               # chequeos exitosos con latencia
+    checks: int = 0                # todos los chequeos considerados
+    latency_mean: float = 0.0      # EWMA de log(latencia)
+    latency_var: float = 0.0       # EWMA de la varianza de log(latencia)
+    latency_cusum: float = 0.0
+    latency_degraded: bool = False
+    failure_base: float = 0.0      # tasa de fallos de referencia (EWMA lenta)
+    failure_rate: float = 0.0      # tasa de fallos reciente (EWMA)
+    failure_cusum: float = 0.0
+    failure_degraded: bool = False
+    updated_at: float = 0.0
+
+
+class AnomalyDetectorRegistry:
+    """Detectores de latencia y tasa de fallos de todos los datasets.
+
+    `update` se llama con cada resultado desde el hilo del monitor y
+    devuelve los eventos (degradación o recuperación) que produjo.
+    """
+
+    def __init__(self):
+        self._states: dict[str, DetectorState] = {}
+        self._dirty: set[str] = set()
+
+    def load(self, rows: list[dict]) -> None:
+        """Carga estados persistidos."""
+        for row in rows:
+            st = DetectorState(**row)
+            st.latency_degraded = bool(st.latency_degraded)
+            st.failure_degraded = bool(st.failure_degraded)
+            self._states[st.dataset_id] = st
+
+    def _get(self, dataset_id: str) -> DetectorState:
+        st = self._states.get(dataset_id)
+        if st is None:
+            st = self._states[dataset_id] = DetectorState(dataset_id=dataset_id)
+        return st
+
+    def update(self, dataset_id: str, status: str, latency_ms: float | None,
+               now: float | None = None) -> list[dict]:
+        """Incorpora un resultado y devuelve los eventos de cambio de estado."""
+        now = time.time() if now is None else now
+        st = self._get(dataset_id)
+        st.updated_at = now
+        events = []
+        failed = status != "up"
+
+        # Tasa de fallos
+        st.checks += 1
+        if st.checks == 1:
+            st.failure_base = st.failure_rate = float(failed)
+        else:
+            st.failure_rate += FAILURE_ALPHA * (failed - st.failure_rate)
+            st.failure_cusum = min(
+                max(0.0, st.failure_cusum + failed - st.failure_base - FAILURE_K), CUSUM_CAP * FAILURE_H
+            )
+            if not st.failure_degraded:
+                st.failure_base += FAILURE_BASE_ALPHA * (failed - st.failure_base)
+        events += self._transition(st, "failure_rate", st.failure_cusum > FAILURE_H,
+                                   st.failure_rate, st.failure_base, st.checks)
+
+        # Latencia (solo chequeos exitosos)
+        if not failed and latency_ms is not None and latency_ms > 0:
+            x = math.log(latency_ms)
+            st.samples += 1
+            if st.samples == 1:
+                st.latency_mean = x
+            else:
+                std = math.sqrt(max(st.latency_var, LATENCY_MIN_VARIANCE))
+                z = (x - st.latency_mean) / std
+                st.latency_cusum = min(max(0.0, st.latency_cusum + z - LATENCY_K), CUSUM_CAP * LATENCY_H)
+                if not st.latency_degraded:
+                    diff = x - st.latency_mean
+                    st.latency_mean += LATENCY_ALPHA * diff
+                    st.latency_var = (1 - LATENCY_ALPHA) * (st.latency_var + LATENCY_ALPHA * diff * diff)
+            events += self._transition(st, "latency", st.latency_cusum > LATENCY_H,
+                                       latency_ms, math.exp(st.latency_mean), st.samples)
+
+        self._dirty.add(dataset_id)
+        return events
+
+    def _transition(self, st: DetectorState, detector: str, alarm: bool,
+                    value: float, baseline: float, samples: int) -> list[dict]:
+        flag = f"{detector.split('_')[0]}_degraded"
+        cusum = st.latency_cusum if detector == "latency" else st.failure_cusum
+        degraded = getattr(st, flag)
+        if not degraded and alarm and samples >= WARMUP_SAMPLES:
+            setattr(st, flag, True)
+            state = DEGRADED
+        elif degraded and cusum == 0.0:
+            setattr(st, flag, False)
+            state = RECOVERED
+        else:
+            return []
+        return [{
+            "dataset_id": st.dataset_id,
+            "detector": detector,
+            "state": state,
+            "value": round(value, 3),
+            "baseline": round(baseline, 3),
+            "cusum": round(cusum, 3),
+            "at": st.updated_at
+        }]
+
+    def degraded(self) -> list[dict]:
+        """Datasets con algún detector en alarma."""
+        return [asdict(st) for st in self._states.values() if st.latency_degraded or st.failure_degraded]
+
+    def pop_dirty(self) -> list[dict]:
+        """Estados modificados desde la última llamada (para persistir)."""
+        rows = [asdict(self._states[key]) for key in self._dirty]
+        self._dirty.clear()
+        return rows
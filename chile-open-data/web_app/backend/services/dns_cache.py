@@ -0,0 +1,179 @@
+# /web_app/backend/services/dns_cache.py
+"""
+Cache DNS en proceso con TTL para el checker y el scraper.
+
+Muchos datasets comparten unos pocos hosts (*.gob.cl) y cada request volvía
+a resolver el nombre con el resolver del sistema. Solo las sesiones HTTP del
+checker y del scraper usan el cache: sus conexiones abren el socket con
+`DNSCache.create_connection` (ver `http_timing.timed_session`), y el resto
+del proceso (Redis, SMTP, otras bibliotecas) sigue usando `socket.getaddrinfo`
+sin cambios. Las resoluciones fallidas también se guardan (cache negativo) por
+un tiempo más corto. `prefetch` resuelve en paralelo los hosts de un ciclo
+antes de empezar las verificaciones.
+
+El módulo solo depende de la biblioteca estándar: el scraper lo importa como
+`web_app.backend.services.dns_cache`.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import socket
+import threading
+import time
+
+DEFAULT_TTL = 300.0
+DEFAULT_NEGATIVE_TTL = 30.0
+
+
+class _Entry:
+    __slots__ = ("infos", "error", "expires_at")
+
+    def __init__(self, infos, error, expires_at):
+        self.infos = infos
+        self.error = error
+        self.expires_at = expires_at
+
+
+def _with_port(infos: list, port: int) -> list:
+    """Copia de las direcciones resueltas (con puerto 0) usando `port`."""
+    out = []
+    for family, type_, proto, canonname, sockaddr in infos:
+        out.append((family, type_, proto, canonname, (sockaddr[0], port) + tuple(sockaddr[2:])))
+    return out
+
+
+class DNSCache:
+    """Resoluciones de nombres cacheadas por host."""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, negative_ttl: float = DEFAULT_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _resolve(self, host: str) -> list:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is not None and entry.expires_at > now:
+                self.hits += 1
+                if entry.error is not None:
+                    raise socket.gaierror(*entry.error.args)
+                return entry.infos
+            self.misses += 1
+
+        try:
+            infos = socket.getaddrinfo(host, 0, socket.AF_UNSPEC, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            with self._lock:
+                self._entries[host] = _Entry(None, e, time.monotonic() + self.negative_ttl)
+            raise
+        with self._lock:
+            self._entries[host] = _Entry(infos, None, time.monotonic() + self.ttl)
+        return infos
+
+    def resolve(self, host: str) -> float:
+        """Resuelve `host` (desde el cache si está vigente) y devuelve los ms empleados."""
+        t0 = time.perf_counter()
+        self._resolve(host)
+        return round((time.perf_counter() - t0) * 1000, 1)
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        """Como `socket.getaddrinfo`, pero consultando el cache (solo TCP)."""
+        cacheable = (
+            isinstance(host, str) and flags == 0 and proto in (0, socket.IPPROTO_TCP)
+            and type in (0, socket.SOCK_STREAM)
+        )
+        try:
+            port_num = int(port or 0)
+        except (TypeError, ValueError):
+            cacheable = False
+        if not cacheable:
+            return socket.getaddrinfo(host, port, family, type, proto, flags)
+
+        infos = self._resolve(host)
+        if family not in (0, socket.AF_UNSPEC):
+            infos = [info for info in infos if info[0] == family]
+            if not infos:
+                raise socket.gaierror(socket.EAI_ADDRFAMILY if hasattr(socket, "EAI_ADDRFAMILY")
+                                      else socket.EAI_NONAME, "No address for requested family")
+        return _with_port(infos, port_num)
+
+    def create_connection(self, address: tuple, timeout=None, source_address=None,
+                          socket_options=None) -> socket.socket:
+        """Abre un socket TCP a (host, puerto) probando las direcciones cacheadas en orden.
+
+        Equivale a `urllib3.util.connection.create_connection`; `timeout` que
+        no sea un número (el valor por defecto de urllib3) deja el del socket.
+        """
+        host, port = address
+        if host.startswith("["):
+            host = host.strip("[]")
+        error = None
+        for family, type_, proto, _, sockaddr in self.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            sock = None
+            try:
+                sock = socket.socket(family, type_, proto)
+                for option in socket_options or ():
+                    sock.setsockopt(*option)
+                if timeout is None or isinstance(timeout, (int, float)):
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except OSError as e:
+                error = e
+                if sock is not None:
+                    sock.close()
+        if error is not None:
+            raise error
+        raise OSError("getaddrinfo returns an empty list")
+
+    def prefetch(self, hosts, max_workers: int = 8) -> dict[str, float | None]:
+        """Pre-resuelve los hosts en paralelo; devuelve ms por host (None si falla)."""
+        hosts = [h for h in set(hosts) if h]
+
+        def _one(host):
+            try:
+                return host, self.resolve(host)
+            except OSError:
+                return host, None
+
+        if not hosts:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(hosts))) as ex:
+            return dict(ex.map(_one, hosts))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            live = [e for e in self._entries.values() if e.expires_at > now]
+            return {
+                "entries": len(live),
+                "negative_entries": sum(1 for e in live if e.error is not None),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl": self.ttl,
+                "negative_ttl": self.negative_ttl
+            }
+
+
+def url_hosts(urls) -> set[str]:
+    return {urlparse(u).hostname for u in urls if u}
+
+
+# Instancia global del cache (compartida por las sesiones del checker y del scraper)
+dns_cache = DNSCache()
+
+
+def configure_dns_cache(ttl: float = DEFAULT_TTL, negative_ttl: float = DEFAULT_NEGATIVE_TTL) -> DNSCache:
+    """Ajusta los TTL del cache global."""
+    dns_cache.ttl = ttl
+    dns_cache.negative_ttl = negative_ttl
+    return dns_cache
@@ -0,0 +1,148 @@
+# /web_app/backend/services/http_timing.py
+"""
+Medición por fases de las requests del checker (connect, TLS, TTFB).
+
+Las conexiones de urllib3 se reemplazan por subclases que cronometran:
+
+- connect: apertura del socket TCP (`_new_conn`);
+- tls: handshake TLS (resto de `connect` en HTTPS);
+- ttfb: desde enviada la request hasta recibir las cabeceras (`getresponse`).
+
+Los tiempos se acumulan en un registro por hilo, de modo que un probe que
+hace HEAD y luego GET (o sigue redirecciones) suma todas sus conexiones.
+La resolución DNS se mide aparte con `services.dns_cache`; con `resolver`,
+las conexiones de la sesión resuelven con ese cache y no con el resolver
+global del proceso.
+
+Como `dns_cache`, el scraper lo importa como `web_app.backend.services.http_timing`.
+"""
+from socket import gaierror, timeout as SocketTimeout
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+
+PHASES = ("connect_ms", "tls_ms", "ttfb_ms")
+
+_local = threading.local()
+
+
+def start_phases() -> None:
+    """Reinicia el registro de fases del hilo actual."""
+    _local.phases = dict.fromkeys(PHASES)
+
+
+def get_phases() -> dict:
+    """Fases acumuladas desde el último `start_phases` (ms, None si no ocurrió)."""
+    phases = getattr(_local, "phases", None) or dict.fromkeys(PHASES)
+    return {k: (round(v, 1) if v is not None else None) for k, v in phases.items()}
+
+
+def _add(phase: str, seconds: float) -> None:
+    phases = getattr(_local, "phases", None)
+    if phases is None:
+        return
+    phases[phase] = (phases[phase] or 0.0) + seconds * 1000
+
+
+class _PhaseTimingMixin:
+    """Cronometra la apertura TCP y la espera de cabeceras."""
+
+    def _new_conn(self):
+        t0 = time.perf_counter()
+        sock = super()._new_conn()
+        self._tcp_elapsed = time.perf_counter() - t0
+        _add("connect_ms", self._tcp_elapsed)
+        return sock
+
+    def getresponse(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        resp = super().getresponse(*args, **kwargs)
+        _add("ttfb_ms", time.perf_counter() - t0)
+        return resp
+
+
+class _ResolverMixin:
+    """Abre el socket con `resolver.create_connection` (un DNSCache) si está asignado."""
+
+    resolver = None
+
+    def _new_conn(self):
+        if self.resolver is None:
+            return super()._new_conn()
+        # Mismo mapeo de errores que urllib3.connection.HTTPConnection._new_conn
+        try:
+            return self.resolver.create_connection(
+                (self._dns_host, self.port),
+                self.timeout,
+                source_address=self.source_address,
+                socket_options=self.socket_options,
+            )
+        except gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        except SocketTimeout as e:
+            raise ConnectTimeoutError(
+                self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"
+            ) from e
+        except OSError as e:
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+
+
+class TimedHTTPConnection(_PhaseTimingMixin, _ResolverMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_PhaseTimingMixin, _ResolverMixin, HTTPSConnection):
+    def connect(self):
+        self._tcp_elapsed = 0.0
+        t0 = time.perf_counter()
+        super().connect()
+        _add("tls_ms", time.perf_counter() - t0 - self._tcp_elapsed)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def _with_resolver(pool_cls, resolver):
+    """Subclase del pool cuyas conexiones resuelven con `resolver`."""
+    if resolver is None:
+        return pool_cls
+    conn_cls = type(pool_cls.ConnectionCls.__name__, (pool_cls.ConnectionCls,), {"resolver": resolver})
+    return type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": conn_cls})
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Adaptador de requests cuyas conexiones registran sus fases."""
+
+    def __init__(self, resolver=None, **kwargs):
+        # HTTPAdapter.__init__ llama a init_poolmanager: el resolver va antes
+        self.resolver = resolver
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _with_resolver(_TimedHTTPConnectionPool, self.resolver),
+            "https": _with_resolver(_TimedHTTPSConnectionPool, self.resolver),
+        }
+
+
+def timed_session(resolver=None) -> requests.Session:
+    """Sesión de requests con el adaptador instrumentado para http y https.
+
+    `resolver` (un `DNSCache`) resuelve los hosts de esta sesión.
+    """
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(resolver=resolver)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
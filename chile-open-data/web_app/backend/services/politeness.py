@@ -0,0 +1,191 @@
+# /web_app/backend/services/politeness.py
+"""
+Despacho cortés por host para el checker y el scraper.
+
+Varios datasets viven en el mismo servidor de gobierno; enviarlos todos a
+la vez provoca rate limiting (429/503) que se veía como caídas falsas.
+`HostPoliteness` limita las requests simultáneas por host, separa los
+inicios con un intervalo mínimo más jitter aleatorio y respeta `Retry-After`:
+mientras un host pide esperar, los probes esperan (hasta `max_wait`) o se
+difieren con `HostRateLimited`. Con `spread_fraction`, el monitor además
+reparte los probes de cada host a lo largo de esa fracción del intervalo de
+chequeo (`spread_by_host`) en vez de lanzarlos todos al inicio del ciclo.
+
+Igual que `dns_cache`, solo depende de la biblioteca estándar y el scraper lo
+importa como `web_app.backend.services.politeness`.
+"""
+from contextlib import contextmanager
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from itertools import zip_longest
+from urllib.parse import urlparse
+import random
+import threading
+import time
+
+RATE_LIMITED_ERROR = "RateLimited"
+RATE_LIMIT_CODES = (429, 503)
+
+
+class HostRateLimited(Exception):
+    """El host pidió esperar más de lo que el llamador está dispuesto a bloquear."""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"{host} pide esperar {retry_in:.0f}s (Retry-After)")
+        self.host = host
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """Segundos indicados por una cabecera Retry-After (número o fecha HTTP)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    now = time.time() if now is None else now
+    return max(0.0, when.timestamp() - now)
+
+
+def interleave_by_host(datasets: list[dict]) -> list[dict]:
+    """Reordena los datasets alternando hosts, para no encolar un host completo seguido."""
+    by_host: dict[str, list[dict]] = {}
+    for ds in datasets:
+        by_host.setdefault(urlparse(ds["url"]).hostname or "", []).append(ds)
+    return [ds for group in zip_longest(*by_host.values()) for ds in group if ds is not None]
+
+
+def spread_by_host(datasets: list[dict], window: float) -> list[tuple[float, dict]]:
+    """Asigna a cada dataset un desfase (s) dentro de `window`, ordenados por desfase.
+
+    Los n probes de un host se reparten en n tramos iguales de la ventana, cada
+    uno en un punto aleatorio de su tramo: el host recibe un goteo uniforme con
+    jitter y los hosts no quedan sincronizados entre sí. Sin ventana, todos
+    parten de inmediato alternando hosts.
+    """
+    if window <= 0:
+        return [(0.0, ds) for ds in interleave_by_host(datasets)]
+    by_host: dict[str, list[dict]] = {}
+    for ds in datasets:
+        by_host.setdefault(urlparse(ds["url"]).hostname or "", []).append(ds)
+    planned = []
+    for group in by_host.values():
+        step = window / len(group)
+        for i, ds in enumerate(group):
+            planned.append((i * step + random.uniform(0, step), ds))
+    planned.sort(key=lambda item: item[0])
+    return planned
+
+
+class HostPoliteness:
+    """Límites de concurrencia, espaciado con jitter y Retry-After por host."""
+
+    def __init__(self, max_per_host: int = 2, min_delay: float = 0.2, jitter: float = 0.5,
+                 max_wait: float = 30.0, max_backoff: float = 3600.0, spread_fraction: float = 0.0):
+        self.max_per_host = max_per_host
+        self.min_delay = min_delay
+        self.jitter = jitter
+        self.max_wait = max_wait
+        self.spread_fraction = spread_fraction
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._next_start: dict[str, float] = {}
+        self._blocked_until: dict[str, float] = {}
+        self._deferred = 0
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._semaphores.get(host)
+            if sem is None:
+                sem = self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return sem
+
+    def spread_window(self, interval: float) -> float:
+        """Ventana (s) en la que el monitor reparte los probes de cada ciclo."""
+        return max(0.0, interval * min(self.spread_fraction, 1.0))
+
+    def blocked_for(self, host: str) -> float:
+        """Segundos que faltan para que el host acepte requests según Retry-After."""
+        with self._lock:
+            return max(0.0, self._blocked_until.get(host, 0.0) - time.monotonic())
+
+    def _wait_if_blocked(self, host: str, max_wait: float) -> None:
+        wait = self.blocked_for(host)
+        if wait > max_wait:
+            with self._lock:
+                self._deferred += 1
+            raise HostRateLimited(host, wait)
+        if wait > 0:
+            time.sleep(wait)
+
+    def _reserve_start(self, host: str) -> float:
+        """Reserva el próximo inicio permitido del host y devuelve cuánto esperar."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, 0.0))
+            self._next_start[host] = start + self.min_delay + random.uniform(0, self.jitter)
+            return start - now
+
+    @contextmanager
+    def slot(self, host: str, max_wait: float | None = None):
+        """Bloquea hasta que se pueda enviar una request a `host`."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        self._wait_if_blocked(host, max_wait)
+        sem = self._semaphore(host)
+        with sem:
+            delay = self._reserve_start(host)
+            if delay > 0:
+                time.sleep(delay)
+            yield
+
+    def record_response(self, host: str, status_code: int, headers) -> float | None:
+        """Registra un Retry-After de una respuesta 429/503; devuelve la espera (s)."""
+        if status_code not in RATE_LIMIT_CODES:
+            return None
+        retry_in = parse_retry_after(headers.get("Retry-After"))
+        if retry_in is None:
+            return None
+        retry_in = min(retry_in, self.max_backoff)
+        with self._lock:
+            until = time.monotonic() + retry_in
+            self._blocked_until[host] = max(self._blocked_until.get(host, 0.0), until)
+        return retry_in
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "max_per_host": self.max_per_host,
+                "min_delay": self.min_delay,
+                "jitter": self.jitter,
+                "spread_fraction": self.spread_fraction,
+                "deferred": self._deferred,
+                "blocked_hosts": {
+                    host: round(until - now, 1)
+                    for host, until in self._blocked_until.items() if until > now
+                }
+            }
+
+
+# Instancia global (compartida por todos los clientes HTTP del proceso)
+host_politeness = HostPoliteness()
+
+
+def configure_politeness(max_per_host: int = 2, min_delay: float = 0.2, jitter: float = 0.5,
+                         max_wait: float = 30.0, spread_fraction: float = 0.0) -> HostPoliteness:
+    """Ajusta los límites de la instancia global."""
+    host_politeness.max_per_host = max_per_host
+    host_politeness.min_delay = min_delay
+    host_politeness.jitter = jitter
+    host_politeness.max_wait = max_wait
+    host_politeness.spread_fraction = spread_fraction
+    with host_politeness._lock:
+        host_politeness._semaphores.clear()
+    return host_politeness
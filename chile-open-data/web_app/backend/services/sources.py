@@ -1,29 +1,232 @@
 # /web_app/backend/services/sources.py
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+import os
+import threading
 import yaml
 
-# Ruta corregida para encontrar sources.yaml desde el backend
-DEFAULT_SOURCES_PATH = Path(__file__).resolve().parents[3] / "data_sources" / "config" / "sources.yaml"
+from services.catalog_snapshot import cached_parse, source_hash
+
+# Ruta corregida para encontrar sources.yaml desde el backend. SOURCES_PATH
+# puede apuntar a otro archivo o a un directorio de shards (*.yaml / *.yml).
+DEFAULT_SOURCES_PATH = Path(
+    os.getenv("SOURCES_PATH")
+    or Path(__file__).resolve().parents[3] / "data_sources" / "config" / "sources.yaml"
+)
+
+# libyaml (CSafeLoader) es varias veces más rápido; si no está compilado usamos el loader puro
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Hilos para parsear shards en paralelo
+SHARD_LOAD_WORKERS = 4
 
 class SourceConfigError(Exception):
     pass
 
-def load_sources(path: Path = DEFAULT_SOURCES_PATH) -> list[dict]:
-    """Carga y valida el YAML de fuentes."""
-    if not path.exists():
-        raise SourceConfigError(f"No se encontró sources.yaml en {path}")
-    with open(path, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f) or {}
+@dataclass
+class CatalogDiff:
+    """Cambios del catálogo respecto de la carga anterior."""
+    added: list[dict] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    changed: list[dict] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
 
+    def summary(self) -> dict:
+        return {"added": len(self.added), "removed": len(self.removed), "changed": len(self.changed)}
+
+def _validate(data: dict, source: Path, allow_empty: bool = False) -> list[dict]:
     datasets = data.get("datasets", [])
-    if not isinstance(datasets, list) or not datasets:
-        raise SourceConfigError("El YAML debe contener una lista 'datasets' no vacía.")
+    if not isinstance(datasets, list) or (not datasets and not allow_empty):
+        raise SourceConfigError(f"{source.name} debe contener una lista 'datasets' no vacía.")
 
+    # Un shard puede fijar valores por defecto (p. ej. su categoría) para sus datasets
+    defaults = {k: data[k] for k in ("category", "method", "timeout") if k in data}
     required = {"id", "name", "category", "url"}
     for ds in datasets:
+        for key, value in defaults.items():
+            ds.setdefault(key, value)
         missing = required - set(ds.keys())
         if missing:
-            raise SourceConfigError(f"Dataset con campos faltantes: {missing} en {ds}")
+            raise SourceConfigError(f"Dataset con campos faltantes: {missing} en {ds} ({source.name})")
         ds.setdefault("method", "HEAD")
         ds.setdefault("timeout", 6)
     return datasets
+
+def diff_datasets(old: list[dict], new: list[dict]) -> CatalogDiff:
+    """Compara dos listas de datasets por id."""
+    old_by_id = {ds["id"]: ds for ds in old}
+    new_by_id = {ds["id"]: ds for ds in new}
+    return CatalogDiff(
+        added=[ds for i, ds in new_by_id.items() if i not in old_by_id],
+        removed=[i for i in old_by_id if i not in new_by_id],
+        changed=[ds for i, ds in new_by_id.items() if i in old_by_id and old_by_id[i] != ds]
+    )
+
+class CatalogShard:
+    """Un archivo del catálogo, cacheado por mtime y hash de su contenido."""
+
+    def __init__(self, path: Path, allow_empty: bool = False):
+        self.path = path
+        self.allow_empty = allow_empty
+        self.revision = 0
+        self.datasets: list[dict] = []
+        self._stat_key: tuple | None = None
+        self._hash: str | None = None
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def hash(self) -> str | None:
+        return self._hash
+
+    def refresh(self) -> bool:
+        """Relee el archivo si cambió; devuelve True si cambiaron sus datasets."""
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            raise SourceConfigError(f"No se encontró sources.yaml en {self.path}")
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self._stat_key:
+            return False
+
+        raw = self.path.read_bytes()
+        digest = source_hash(raw)
+        changed = digest != self._hash
+        if changed:
+            # Con el YAML sin cambios se carga el snapshot compilado en vez de parsear
+            self.datasets = cached_parse(self.path, raw, "sources", self._parse, digest, kind=list)
+            self._hash = digest
+            self.revision += 1
+        self._stat_key = stat_key
+        return changed
+
+    def _parse(self, raw: bytes) -> list[dict]:
+        data = yaml.load(raw.decode("utf-8"), Loader=YAML_LOADER) or {}
+        return _validate(data, self.path, self.allow_empty)
+
+class SourceCatalog:
+    """Catálogo de fuentes: un archivo o un directorio de shards.
+
+    Cada shard se cachea por mtime y hash, de modo que `load()` solo vuelve
+    a parsear los archivos que cambiaron (en paralelo). Cada recarga con
+    cambios incrementa `revision` y deja en `last_diff` los datasets
+    agregados, eliminados y modificados.
+    """
+
+    def __init__(self, path: Path = DEFAULT_SOURCES_PATH):
+        self.path = Path(path)
+        self.revision = 0
+        self.last_diff = CatalogDiff()
+        self._shards: dict[Path, CatalogShard] = {}
+        # path -> (revision, datasets) de cada shard en la última combinación válida
+        self._merged: dict[Path, tuple[int, list[dict]]] = {}
+        self._datasets: list[dict] = []
+        self._lock = threading.Lock()
+
+    @property
+    def sharded(self) -> bool:
+        return self.path.is_dir()
+
+    def _shard_paths(self) -> list[Path]:
+        if not self.sharded:
+            return [self.path]
+        return sorted(p for p in self.path.iterdir() if p.suffix in (".yaml", ".yml") and p.is_file())
+
+    def _get_shard(self, path: Path) -> CatalogShard:
+        shard = self._shards.get(path)
+        if shard is None:
+            # En un directorio se admiten shards vacíos (p. ej. una categoría nueva)
+            shard = self._shards[path] = CatalogShard(path, allow_empty=self.sharded)
+        return shard
+
+    def load(self) -> list[dict]:
+        """Datasets vigentes, recargando los shards que cambiaron."""
+        with self._lock:
+            self._refresh()
+            return list(self._datasets)
+
+    def load_shard(self, name: str) -> list[dict]:
+        """Datasets de un solo shard (solo lee ese archivo)."""
+        with self._lock:
+            path = self.path / name if self.sharded else self.path
+            if self.sharded and not path.is_file():
+                raise SourceConfigError(f"No existe el shard {name} en {self.path}")
+            shard = self._get_shard(path)
+            shard.refresh()
+            return list(shard.datasets)
+
+    def _refresh(self) -> None:
+        paths = self._shard_paths()
+        if not self.sharded and not self.path.exists():
+            raise SourceConfigError(f"No se encontró sources.yaml en {self.path}")
+
+        shards = [self._get_shard(path) for path in paths]
+        if len(shards) > 1:
+            with ThreadPoolExecutor(max_workers=min(SHARD_LOAD_WORKERS, len(shards))) as ex:
+                list(ex.map(CatalogShard.refresh, shards))
+        else:
+            for shard in shards:
+                shard.refresh()
+
+        # Shards que cambiaron o desaparecieron desde la última combinación
+        current = set(paths)
+        for path in [p for p in self._shards if p not in current]:
+            del self._shards[path]
+        dirty = [s for s in shards if self._merged.get(s.path, (None,))[0] != s.revision]
+        gone = [path for path in self._merged if path not in current]
+        if not dirty and not gone:
+            return
+
+        datasets = [ds for shard in shards for ds in shard.datasets]
+        if not datasets:
+            raise SourceConfigError(f"El catálogo {self.path} no contiene datasets.")
+        ids = [ds["id"] for ds in datasets]
+        if len(ids) != len(set(ids)):
+            duplicated = sorted({i for i in ids if ids.count(i) > 1})
+            raise SourceConfigError(f"Ids de dataset duplicados entre shards: {duplicated}")
+
+        # Diff solo de los shards afectados (un dataset que cambia de shard no es un alta)
+        old = [ds for s in dirty for ds in self._merged.get(s.path, (None, []))[1]]
+        old += [ds for path in gone for ds in self._merged[path][1]]
+        new = [ds for s in dirty for ds in s.datasets]
+        self.last_diff = diff_datasets(old, new)
+
+        for path in gone:
+            del self._merged[path]
+        for s in dirty:
+            self._merged[s.path] = (s.revision, s.datasets)
+        self._datasets = datasets
+        self.revision += 1
+
+    def info(self) -> dict:
+        return {
+            "path": str(self.path),
+            "revision": self.revision,
+            "datasets": len(self._datasets),
+            "shards": [
+                {"name": s.name, "datasets": len(s.datasets), "revision": s.revision, "hash": s.hash}
+                for s in self._shards.values()
+            ],
+            "last_diff": self.last_diff.summary()
+        }
+
+_catalogs: dict[Path, SourceCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog(path: Path = DEFAULT_SOURCES_PATH) -> SourceCatalog:
+    """Catálogo compartido para una ruta (uno por proceso)."""
+    path = Path(path).resolve()
+    with _catalogs_lock:
+        catalog = _catalogs.get(path)
+        if catalog is None:
+            catalog = _catalogs[path] = SourceCatalog(path)
+        return catalog
+
+def load_sources(path: Path = DEFAULT_SOURCES_PATH) -> list[dict]:
+    """Carga y valida el catálogo de fuentes (cacheado mientras no cambie)."""
+    return get_catalog(path).load()
@@ -0,0 +1,137 @@
+# /web_app/backend/sketches.py
+"""
+Sketches de cuantiles para latencias
+
+`LatencySketch` es un DDSketch: cada latencia cae en un bucket logarítmico
+cuyo ancho es proporcional a su valor, así cualquier cuantil se estima con
+error relativo acotado (`SKETCH_RELATIVE_ACCURACY`). Dos sketches se combinan
+sumando sus buckets, por lo que p50/p95/p99 de cualquier ventana o agrupación
+(dataset, categoría, sistema) se obtienen fusionando sketches horarios en vez
+de ordenar chequeos.
+"""
+
+from typing import Dict, Iterable, Optional
+import json
+import math
+
+# Error relativo máximo de los cuantiles (1%)
+SKETCH_RELATIVE_ACCURACY = 0.01
+# Máximo de buckets por sketch; al superarlo se colapsan los más bajos
+SKETCH_MAX_BINS = 2048
+# Latencias por debajo de este valor (ms) se cuentan como cero
+SKETCH_MIN_VALUE = 1e-3
+
+
+class LatencySketch:
+    """Sketch de cuantiles mergeable (DDSketch) para latencias en ms"""
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        # Punto medio (en error relativo) del bucket (gamma^(k-1), gamma^k]
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1):
+        """Agrega una latencia (ms)"""
+        if value < SKETCH_MIN_VALUE:
+            self.zero_count += count
+        else:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + count
+            if len(self.bins) > SKETCH_MAX_BINS:
+                self._collapse()
+        self.count += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def update(self, values: Iterable[float]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'LatencySketch'):
+        """Suma otro sketch (misma precisión) a este"""
+        if other.gamma != self.gamma:
+            raise ValueError("Solo se pueden combinar sketches con la misma precisión relativa")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > SKETCH_MAX_BINS:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def _collapse(self):
+        # Los buckets más bajos se funden en uno: pierden precisión los valores menos relevantes para p95/p99
+        keys = sorted(self.bins)
+        excess = keys[:len(keys) - SKETCH_MAX_BINS + 1]
+        target = excess[-1]
+        self.bins[target] = sum(self.bins.pop(key) for key in excess[:-1]) + self.bins[target]
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Valor estimado del cuantil q (0..1); None si el sketch está vacío"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                # El estimado se acota al rango observado
+                return min(max(self._value(key), self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """Cantidad, promedio, extremos y p50/p95/p99 redondeados"""
+        def rounded(value):
+            return None if value is None else round(value, 2)
+        return {
+            'samples': self.count,
+            'avg': rounded(self.sum / self.count) if self.count else None,
+            'min': rounded(self.min),
+            'max': rounded(self.max),
+            'p50': rounded(self.quantile(0.50)),
+            'p95': rounded(self.quantile(0.95)),
+            'p99': rounded(self.quantile(0.99))
+        }
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'a': self.relative_accuracy,
+            'b': {str(key): count for key, count in self.bins.items()},
+            'z': self.zero_count,
+            'n': self.count,
+            's': self.sum,
+            'min': self.min,
+            'max': self.max
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data: str) -> 'LatencySketch':
+        raw = json.loads(data)
+        sketch = cls(raw['a'])
+        sketch.bins = {int(key): count for key, count in raw['b'].items()}
+        sketch.zero_count = raw['z']
+        sketch.count = raw['n']
+        sketch.sum = raw['s']
+        sketch.min = raw['min']
+        sketch.max = raw['max']
+        return sketch
@@ -3,18 +3,200 @@ WebSocket handler para comunicación en tiempo real
 """
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask import request
+import json
 import logging
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, List, Optional
 from notifications import notification_manager, Notification
+from bus import MessageBus, LocalMessageBus
+from models import to_epoch_ms
+
+try:
+    import msgpack
+except ImportError:  # Dependencia opcional: sin ella todos los clientes usan JSON
+    msgpack = None
 
 logger = logging.getLogger(__name__)
 
+# Sala a la que se unen todos los clientes al conectarse
+GENERAL_ROOM = 'general'
+
+# Canales del bus de mensajes compartidos por todos los workers
+WS_EMIT_CHANNEL = 'ws:emit'
+WS_SNAPSHOT_CHANNEL = 'ws:snapshot'
+
+# Codificaciones de payload negociables al conectar
+ENCODING_JSON = 'json'
+ENCODING_MSGPACK = 'msgpack'
+
+
+def encoded_room(room: str, encoding: str) -> str:
+    """Variante de una sala para los clientes de una codificación dada"""
+    return room if encoding == ENCODING_JSON else f"{room}#{encoding}"
+
+
+def dataset_room(dataset_id: str) -> str:
+    """Nombre de la sala de suscripción de un dataset"""
+    return f"dataset:{dataset_id}"
+
+
+def category_room(category: str) -> str:
+    """Nombre de la sala de suscripción de una categoría"""
+    return f"category:{category}"
+
+
+def configure_websocket_compression(socketio: SocketIO, enabled: bool = True,
+                                    max_window_bits: int = 15,
+                                    no_context_takeover: bool = False) -> Dict[str, Any]:
+    """
+    Configura permessage-deflate (RFC 7692) del transporte websocket
+    
+    `http_compression` de SocketIO solo cubre el long-polling. Con eventlet el
+    websocket lo atiende `eventlet.websocket.WebSocketWSGI`, que acepta
+    cualquier oferta de deflate del cliente; aquí se reemplaza la clase
+    websocket de este servidor Engine.IO por una que la acepta o la rechaza
+    según la configuración y acota la ventana LZ77 del servidor (memoria por
+    conexión). Otros modos asíncronos no implementan permessage-deflate.
+    Devuelve las opciones efectivas.
+    """
+    eio = socketio.server.eio
+    options = {
+        'async_mode': socketio.async_mode,
+        'http_compression': eio.http_compression,
+        'compression_threshold': eio.compression_threshold,
+        'permessage_deflate': False
+    }
+    if socketio.async_mode != 'eventlet':
+        if enabled:
+            logger.warning(f"permessage-deflate no disponible con async_mode={socketio.async_mode}")
+        return options
+    
+    base = eio._async['websocket']
+    max_window_bits = min(max(max_window_bits, 9), 15)
+    
+    class DeflateWebSocketWSGI(base):
+        def _negotiate_permessage_deflate(self, extensions):
+            if not enabled:
+                return None
+            config = super()._negotiate_permessage_deflate(extensions)
+            if config is None:
+                return None
+            config['server_max_window_bits'] = min(config.get('server_max_window_bits', 15), max_window_bits)
+            if no_context_takeover:
+                config['server_no_context_takeover'] = True
+            return config
+    
+    # Copia del diccionario del driver: el reemplazo afecta solo a este servidor
+    eio._async = {**eio._async, 'websocket': DeflateWebSocketWSGI}
+    options.update({
+        'permessage_deflate': enabled,
+        'deflate_max_window_bits': max_window_bits,
+        'deflate_no_context_takeover': no_context_takeover
+    })
+    return options
+
+
+class HelloSnapshot:
+    """
+    Snapshot versionado que se envía a cada cliente al conectarse
+    
+    Contiene el último estado de todos los datasets, estadísticas resumidas y
+    las notificaciones recientes. Se reconstruye una vez por ciclo del monitor
+    (o cuando cambia `notification_manager.revision`) y se serializa una sola
+    vez por codificación, de modo que cada conexión nueva solo envía bytes ya
+    armados.
+    """
+    
+    RECENT_NOTIFICATIONS = 10
+    
+    def __init__(self, db=None):
+        self.db = db
+        self.version = 0
+        self._lock = threading.Lock()
+        self._datasets: Optional[List[Dict[str, Any]]] = None
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._notifications_revision = None
+        self._payloads: Dict[str, bytes] = {}
+    
+    def update_datasets(self, statuses: List[Dict[str, Any]]):
+        """Reemplaza el estado de los datasets con los resultados de un ciclo"""
+        with self._lock:
+            self._datasets = list(statuses)
+            self._snapshot = None
+            self._payloads = {}
+    
+    def payload(self, encoding: str) -> bytes:
+        """Devuelve el snapshot serializado, reconstruyéndolo solo si cambió"""
+        with self._lock:
+            if self._snapshot is None or self._notifications_revision != notification_manager.revision:
+                self._notifications_revision = notification_manager.revision
+                self._snapshot = self._build()
+                self._payloads = {}
+            data = self._payloads.get(encoding)
+            if data is None:
+                data = self._payloads[encoding] = self._encode(self._snapshot, encoding)
+            return data
+    
+    def _build(self) -> Dict[str, Any]:
+        if self._datasets is None:
+            # Sin ciclos del monitor todavía: una sola lectura de la BD
+            self._datasets = self.db.get_latest_status() if self.db else []
+        
+        self.version += 1
+        latencies = [d['latency_ms'] for d in self._datasets if d.get('latency_ms') is not None]
+        available = sum(1 for d in self._datasets if d.get('status') == 'up')
+        return {
+            'version': self.version,
+            'built_at': datetime.now().isoformat(),
+            'datasets': self._datasets,
+            'stats': {
+                'total_datasets': len(self._datasets),
+                'available_datasets': available,
+                'unavailable_datasets': len(self._datasets) - available,
+                'avg_latency': round(sum(latencies) / len(latencies), 1) if latencies else None,
+                'last_checked': self._last_checked(self._datasets)
+            },
+            'notifications': notification_manager.get_notifications(limit=self.RECENT_NOTIFICATIONS),
+            'unread_count': notification_manager.get_unread_count()
+        }
+    
+    @staticmethod
+    def _last_checked(datasets: List[Dict[str, Any]]) -> Optional[str]:
+        """Chequeo más reciente en ISO UTC
+        
+        `checked_at` llega como datetime (ciclo del monitor) o como texto en
+        varios formatos (BD, bus): se compara como epoch ms, no como string.
+        """
+        latest = None
+        for dataset in datasets:
+            try:
+                checked_ms = to_epoch_ms(dataset['checked_at'])
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+            latest = checked_ms if latest is None else max(latest, checked_ms)
+        if latest is None:
+            return None
+        return datetime.fromtimestamp(latest / 1000, tz=timezone.utc).isoformat()
+    
+    @staticmethod
+    def _encode(snapshot: Dict[str, Any], encoding: str) -> bytes:
+        if encoding == ENCODING_MSGPACK:
+            return msgpack.packb(snapshot, use_bin_type=True, default=str)
+        return json.dumps(snapshot, default=str).encode('utf-8')
+
+
 class WebSocketManager:
     """Gestor de conexiones WebSocket"""
     
-    def __init__(self, socketio: SocketIO):
+    def __init__(self, socketio: SocketIO, db=None, bus: Optional[MessageBus] = None):
         self.socketio = socketio
         self.connected_clients: Dict[str, Dict[str, Any]] = {}
+        self.snapshot = HelloSnapshot(db)
+        
+        # Los broadcasts pasan por el bus para llegar a los clientes de todos los workers
+        self.bus = bus or LocalMessageBus()
+        self.bus.subscribe(WS_EMIT_CHANNEL, self._handle_bus_emit)
+        self.bus.subscribe(WS_SNAPSHOT_CHANNEL, self._handle_bus_snapshot)
         
         # Suscribirse al gestor de notificaciones
         notification_manager.add_subscriber(self.broadcast_notification)
@@ -26,28 +208,27 @@ class WebSocketManager:
         """Registra todos los eventos de WebSocket"""
         
         @self.socketio.on('connect')
-        def handle_connect():
+        def handle_connect(auth=None):
             client_id = request.sid
+            encoding = self._negotiate_encoding(auth)
             self.connected_clients[client_id] = {
                 'connected_at': None,
-                'rooms': ['general'],
+                'rooms': [GENERAL_ROOM],
+                'encoding': encoding,
                 'user_agent': request.headers.get('User-Agent', 'Unknown')
             }
             
             # Unir a la sala general
-            join_room('general', sid=client_id)
+            self._join(GENERAL_ROOM, client_id)
             
-            logger.info(f"Cliente conectado: {client_id}")
-            
-            # Enviar notificaciones recientes al cliente recién conectado
-            recent_notifications = notification_manager.get_notifications(limit=10)
-            emit('recent_notifications', {
-                'notifications': recent_notifications,
-                'unread_count': notification_manager.get_unread_count()
-            })
+            logger.info(f"Cliente conectado: {client_id} (codificación: {encoding})")
+            emit('encoding', {'encoding': encoding})
             
-            # Enviar estadísticas iniciales
-            self._send_initial_stats(client_id)
+            # Enviar el snapshot precalculado (estado, estadísticas y notificaciones)
+            try:
+                emit('hello', self.snapshot.payload(encoding))
+            except Exception as e:
+                logger.error(f"Error enviando snapshot inicial: {e}")
         
         @self.socketio.on('disconnect')
         def handle_disconnect():
@@ -60,7 +241,7 @@ class WebSocketManager:
         def handle_join_room(data):
             room = data.get('room')
             if room:
-                join_room(room)
+                self._join(room, request.sid)
                 if request.sid in self.connected_clients:
                     self.connected_clients[request.sid]['rooms'].append(room)
                 logger.info(f"Cliente {request.sid} se unió a la sala: {room}")
@@ -69,19 +250,41 @@ class WebSocketManager:
         def handle_leave_room(data):
             room = data.get('room')
             if room:
-                leave_room(room)
+                self._leave(room, request.sid)
                 if request.sid in self.connected_clients:
                     rooms = self.connected_clients[request.sid]['rooms']
                     if room in rooms:
                         rooms.remove(room)
                 logger.info(f"Cliente {request.sid} salió de la sala: {room}")
         
+        @self.socketio.on('subscribe')
+        def handle_subscribe(data):
+            rooms = self._subscription_rooms(data)
+            for room in rooms:
+                self._join(room, request.sid)
+            client = self.connected_clients.get(request.sid)
+            if client is not None:
+                client['rooms'].extend(r for r in rooms if r not in client['rooms'])
+            self._reply('subscribed', {'rooms': client['rooms'] if client else rooms})
+            logger.info(f"Cliente {request.sid} suscrito a {len(rooms)} salas")
+        
+        @self.socketio.on('unsubscribe')
+        def handle_unsubscribe(data):
+            rooms = self._subscription_rooms(data)
+            for room in rooms:
+                self._leave(room, request.sid)
+            client = self.connected_clients.get(request.sid)
+            if client is not None:
+                client['rooms'] = [r for r in client['rooms'] if r not in rooms]
+            self._reply('unsubscribed', {'rooms': rooms})
+            logger.info(f"Cliente {request.sid} canceló suscripción a {len(rooms)} salas")
+        
         @self.socketio.on('mark_notification_read')
         def handle_mark_notification_read(data):
             notification_id = data.get('notification_id')
             if notification_id:
                 success = notification_manager.mark_as_read(notification_id)
-                emit('notification_marked_read', {
+                self._reply('notification_marked_read', {
                     'notification_id': notification_id,
                     'success': success,
                     'unread_count': notification_manager.get_unread_count()
@@ -91,7 +294,7 @@ class WebSocketManager:
         def handle_get_notifications(data):
             limit = data.get('limit', 50)
             notifications = notification_manager.get_notifications(limit)
-            emit('notifications_list', {
+            self._reply('notifications_list', {
                 'notifications': notifications,
                 'unread_count': notification_manager.get_unread_count()
             })
@@ -99,48 +302,123 @@ class WebSocketManager:
         @self.socketio.on('clear_notifications')
         def handle_clear_notifications():
             notification_manager.clear_notifications()
-            self.socketio.emit('notifications_cleared', room='general')
+            self.broadcast('notifications_cleared', None, GENERAL_ROOM)
         
         @self.socketio.on('ping')
         def handle_ping():
-            emit('pong', {'timestamp': str(datetime.now())})
+            self._reply('pong', {'timestamp': str(datetime.now())})
     
-    def _send_initial_stats(self, client_id: str):
-        """Envía estadísticas iniciales al cliente"""
-        try:
-            # Aquí podrías obtener estadísticas reales del sistema
-            initial_stats = {
-                'connected_clients': len(self.connected_clients),
-                'system_status': 'healthy',
-                'last_update': str(datetime.now())
-            }
-            self.socketio.emit('initial_stats', initial_stats, room=client_id)
-        except Exception as e:
-            logger.error(f"Error enviando estadísticas iniciales: {e}")
+    @staticmethod
+    def _negotiate_encoding(auth: Any) -> str:
+        """Elige la codificación del cliente a partir de `auth` o del query string"""
+        requested = None
+        if isinstance(auth, dict):
+            requested = auth.get('encoding')
+        requested = requested or request.args.get('encoding')
+        if requested == ENCODING_MSGPACK and msgpack is not None:
+            return ENCODING_MSGPACK
+        return ENCODING_JSON
+    
+    def _client_encoding(self, client_id: str) -> str:
+        client = self.connected_clients.get(client_id)
+        return client['encoding'] if client else ENCODING_JSON
+    
+    def _join(self, room: str, client_id: str):
+        """Une al cliente a la variante de la sala según su codificación"""
+        join_room(encoded_room(room, self._client_encoding(client_id)), sid=client_id)
+    
+    def _leave(self, room: str, client_id: str):
+        leave_room(encoded_room(room, self._client_encoding(client_id)), sid=client_id)
+    
+    @staticmethod
+    def _pack(data: Any) -> bytes:
+        return msgpack.packb(data, use_bin_type=True, default=str)
+    
+    def _reply(self, event: str, data: Any):
+        """Responde al cliente del request actual en su codificación"""
+        if self._client_encoding(request.sid) == ENCODING_MSGPACK:
+            data = self._pack(data)
+        emit(event, data)
+    
+    def _has_msgpack_clients(self) -> bool:
+        return any(c['encoding'] == ENCODING_MSGPACK for c in self.connected_clients.values())
+    
+    def broadcast(self, event: str, data: Any, rooms):
+        """Emite un evento a una o varias salas en todos los workers"""
+        rooms = [rooms] if isinstance(rooms, str) else list(rooms)
+        self.bus.publish(WS_EMIT_CHANNEL, {'event': event, 'data': data, 'rooms': rooms})
+    
+    def _handle_bus_emit(self, message: Dict[str, Any]):
+        self._emit_local(message['event'], message.get('data'), message['rooms'])
+    
+    def _handle_bus_snapshot(self, message: Dict[str, Any]):
+        self.snapshot.update_datasets(message['datasets'])
+    
+    def _emit_local(self, event: str, data: Any, rooms: List[str]):
+        """
+        Emite un evento a los clientes conectados a este worker
+        
+        El payload se serializa una sola vez por codificación: JSON para las
+        salas normales y MessagePack para sus variantes `#msgpack`.
+        """
+        args = (data,) if data is not None else ()
+        self.socketio.emit(event, *args, room=rooms)
+        if msgpack is not None and self._has_msgpack_clients():
+            packed_args = (self._pack(data),) if data is not None else ()
+            self.socketio.emit(event, *packed_args,
+                               room=[encoded_room(r, ENCODING_MSGPACK) for r in rooms])
+    
+    @staticmethod
+    def _subscription_rooms(data: Dict[str, Any]) -> List[str]:
+        """Traduce un payload {'datasets': [...], 'categories': [...]} a nombres de sala"""
+        data = data or {}
+        rooms = [dataset_room(ds_id) for ds_id in data.get('datasets') or [] if ds_id]
+        rooms += [category_room(cat) for cat in data.get('categories') or [] if cat]
+        return rooms
+    
+    def update_snapshot(self, statuses: List[Dict[str, Any]]):
+        """Reconstruye el snapshot de conexión de todos los workers con los resultados de un ciclo"""
+        self.bus.publish(WS_SNAPSHOT_CHANNEL, {'datasets': statuses})
     
     def broadcast_notification(self, notification: Notification):
-        """Envía una notificación a todos los clientes conectados"""
+        """Envía una notificación a los clientes de este worker"""
+        # Cada worker recibe la notificación replicada por el bus y la emite
+        # solo a sus propios clientes
         try:
-            self.socketio.emit('new_notification', {
+            self._emit_local('new_notification', {
                 'notification': notification.to_dict(),
                 'unread_count': notification_manager.get_unread_count()
-            }, room='general')
+            }, [GENERAL_ROOM])
             logger.info(f"Notificación enviada via WebSocket: {notification.title}")
         except Exception as e:
             logger.error(f"Error enviando notificación via WebSocket: {e}")
     
     def broadcast_dataset_update(self, dataset_info: Dict[str, Any]):
-        """Envía actualizaciones de datasets a todos los clientes"""
+        """Envía la actualización de un dataset a los clientes suscritos a él o a su categoría"""
         try:
-            self.socketio.emit('dataset_update', dataset_info, room='general')
-            logger.info(f"Actualización de dataset enviada: {dataset_info.get('name', 'Unknown')}")
+            rooms = [dataset_room(dataset_info['id'])]
+            if dataset_info.get('category'):
+                rooms.append(category_room(dataset_info['category']))
+            # Con una lista de salas Socket.IO entrega una sola vez a cada cliente
+            self.broadcast('dataset_update', dataset_info, rooms)
+            logger.debug(f"Actualización de dataset enviada: {dataset_info.get('name', 'Unknown')}")
         except Exception as e:
             logger.error(f"Error enviando actualización de dataset: {e}")
     
+    def broadcast_dataset_anomaly(self, event: Dict[str, Any]):
+        """Envía una degradación/recuperación detectada a los suscritos al dataset o su categoría"""
+        try:
+            rooms = [dataset_room(event['dataset_id'])]
+            if event.get('category'):
+                rooms.append(category_room(event['category']))
+            self.broadcast('dataset_anomaly', event, rooms)
+        except Exception as e:
+            logger.error(f"Error enviando anomalía de dataset: {e}")
+    
     def broadcast_stats_update(self, stats: Dict[str, Any]):
         """Envía actualizaciones de estadísticas a todos los clientes"""
         try:
-            self.socketio.emit('stats_update', stats, room='general')
+            self.broadcast('stats_update', stats, GENERAL_ROOM)
         except Exception as e:
             logger.error(f"Error enviando actualización de estadísticas: {e}")
     
@@ -156,4 +434,4 @@ class WebSocketManager:
         }
 
 # Import datetime aquí para evitar problemas de importación circular
-from datetime import datetime
+from datetime import datetime, timezone
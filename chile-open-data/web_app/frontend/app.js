@@ -21,6 +21,9 @@ class ChileDataApp {
     this.notifications = [];
     this.unreadCount = 0;
     this.isConnected = false;
+    this.categories = [];
+    this.subscribedCategories = [];
+    this.datasetUpdateTimer = null;
     
     // Referencias a elementos DOM
     this.elements = {
@@ -93,6 +96,7 @@ class ChileDataApp {
     this.elements.categoryFilter.addEventListener('change', (e) => {
       this.filters.category = e.target.value;
       this.applyFilters();
+      this.syncSubscriptions();
     });
     
     this.elements.statusFilter.addEventListener('change', (e) => {
@@ -149,7 +153,9 @@ class ChileDataApp {
       const data = await response.json();
       
       if (response.ok) {
+        this.categories = data.categories.map(category => category.name);
         this.populateCategoryFilter(data.categories);
+        this.syncSubscriptions();
       }
     } catch (error) {
       console.warn('Error loading categories:', error);
@@ -334,6 +340,7 @@ class ChileDataApp {
     this.elements.categoryFilter.value = '';
     this.elements.statusFilter.value = '';
     this.applyFilters();
+    this.syncSubscriptions();
   }
   
   async showHistory(datasetId, datasetName) {
@@ -560,14 +567,24 @@ class ChileDataApp {
   
   initWebSocket() {
     try {
-      // Inicializar socket.io
-      this.socket = io(this.API_BASE);
+      // Inicializar socket.io; si la página cargó @msgpack/msgpack se piden
+      // payloads binarios MessagePack en lugar de JSON
+      this.useMsgpack = typeof MessagePack !== 'undefined';
+      this.socket = io(this.API_BASE, {
+        auth: { encoding: this.useMsgpack ? 'msgpack' : 'json' }
+      });
+      const on = (event, handler) => {
+        this.socket.on(event, (data) => handler(this.decodePayload(data)));
+      };
       
       // Event listeners del socket
       this.socket.on('connect', () => {
         console.log('WebSocket conectado');
         this.isConnected = true;
         this.updateConnectionStatus(true);
+        // Las salas se pierden al reconectar: volver a suscribirse
+        this.subscribedCategories = [];
+        this.syncSubscriptions();
       });
       
       this.socket.on('disconnect', () => {
@@ -582,19 +599,20 @@ class ChileDataApp {
       });
       
       // Eventos de notificaciones
-      this.socket.on('new_notification', (data) => {
+      on('new_notification', (data) => {
         this.handleNewNotification(data);
       });
       
-      this.socket.on('recent_notifications', (data) => {
-        this.handleRecentNotifications(data);
+      // Snapshot inicial precalculado por el servidor (llega como bytes)
+      this.socket.on('hello', (data) => {
+        this.handleHello(this.decodeSnapshot(data));
       });
       
-      this.socket.on('notification_marked_read', (data) => {
+      on('notification_marked_read', (data) => {
         this.updateNotificationBadge(data.unread_count);
       });
       
-      this.socket.on('notifications_cleared', () => {
+      on('notifications_cleared', () => {
         this.notifications = [];
         this.unreadCount = 0;
         this.updateNotificationBadge(0);
@@ -604,14 +622,17 @@ class ChileDataApp {
       });
       
       // Eventos de datos
-      this.socket.on('dataset_update', (data) => {
+      on('dataset_update', (data) => {
         console.log('Dataset actualizado:', data);
-        // Actualizar datos en tiempo real
-        this.loadStatus();
-        this.loadStats();
+        // Un ciclo del monitor emite un evento por dataset: agrupar recargas
+        clearTimeout(this.datasetUpdateTimer);
+        this.datasetUpdateTimer = setTimeout(() => {
+          this.loadStatus();
+          this.loadStats();
+        }, 1000);
       });
       
-      this.socket.on('stats_update', (data) => {
+      on('stats_update', (data) => {
         this.updateStatsDisplay(data);
       });
       
@@ -621,6 +642,45 @@ class ChileDataApp {
     }
   }
   
+  decodePayload(data) {
+    // Los payloads MessagePack llegan como ArrayBuffer
+    if (this.useMsgpack && data instanceof ArrayBuffer) {
+      return MessagePack.decode(new Uint8Array(data));
+    }
+    return data;
+  }
+  
+  decodeSnapshot(data) {
+    if (!(data instanceof ArrayBuffer)) return data;
+    const bytes = new Uint8Array(data);
+    return this.useMsgpack ?
+      MessagePack.decode(bytes) :
+      JSON.parse(new TextDecoder().decode(bytes));
+  }
+  
+  handleHello(snapshot) {
+    this.snapshotVersion = snapshot.version;
+    this.notifications = snapshot.notifications || [];
+    this.updateNotificationBadge(snapshot.unread_count || 0);
+  }
+  
+  syncSubscriptions() {
+    // Suscribirse solo a la categoría filtrada, o a todas si no hay filtro
+    if (!this.socket || !this.isConnected) return;
+    
+    const wanted = this.filters.category ? [this.filters.category] : this.categories;
+    const toLeave = this.subscribedCategories.filter(cat => !wanted.includes(cat));
+    const toJoin = wanted.filter(cat => !this.subscribedCategories.includes(cat));
+    
+    if (toLeave.length) {
+      this.socket.emit('unsubscribe', { categories: toLeave });
+    }
+    if (toJoin.length) {
+      this.socket.emit('subscribe', { categories: toJoin });
+    }
+    this.subscribedCategories = [...wanted];
+  }
+  
   updateConnectionStatus(isConnected) {
     const indicator = this.elements.connectionStatus.querySelector('#statusIndicator');
     const text = this.elements.connectionStatus.querySelector('#statusText');
@@ -657,11 +717,6 @@ class ChileDataApp {
     console.log('Nueva notificación:', notification.title);
   }
   
-  handleRecentNotifications(data) {
-    this.notifications = data.notifications || [];
-    this.updateNotificationBadge(data.unread_count || 0);
-  }
-  
   updateNotificationBadge(count) {
     this.unreadCount = count;
     this.elements.notificationBadge.textContent = count;